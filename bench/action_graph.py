@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# action_graph.py -- Scheduling cost of large action graphs
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Measure how long it takes to build, launch and complete graphs of actions
+which run nothing, so only the dependency tracking is measured:
+
+ - flat: one group, members end one at a time, like commands would.
+ - nested: groups of groups, members end one at a time.
+ - chain: a sequential group, each member ends as soon as it is launched.
+
+Usage: PYTHONPATH=lib python bench/action_graph.py [-n ACTIONS]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from optparse import OptionParser
+
+from Shine.Lustre.Actions.Action import CommonAction, ActionGroup, \
+                                        ACT_OK
+
+
+class NoopAction(CommonAction):
+    """Action running nothing, ending at once or when end() is called."""
+
+    def __init__(self, pending=None):
+        CommonAction.__init__(self)
+        self.pending = pending
+
+    def _launch(self):
+        if self.pending is None:
+            self.set_status(ACT_OK)
+        else:
+            self.pending.append(self)
+
+    def end(self):
+        self.set_status(ACT_OK)
+
+
+def flat(count, pending):
+    """One group of `count' actions."""
+    grp = ActionGroup()
+    for _ in range(count):
+        grp.add(NoopAction(pending))
+    return grp
+
+def nested(count, pending):
+    """Groups of about sqrt(`count') actions, in a group."""
+    size = max(1, int(count ** 0.5))
+    top = ActionGroup()
+    for _ in range(count // size):
+        top.add(flat(size, pending))
+    return top
+
+def chain(count, pending):
+    """A sequential group of `count' actions, ending when launched."""
+    grp = flat(count, None)
+    grp.sequential()
+    return grp
+
+def run(builder, count):
+    """Return build time and run time of `builder' graph."""
+    pending = []
+    start = time.time()
+    graph = builder(count, pending)
+    built = time.time()
+    graph.launch()
+    for action in pending:
+        action.end()
+    assert graph.status() == ACT_OK
+    return built - start, time.time() - built
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--actions', type='int', default=100000)
+    options, _ = parser.parse_args()
+
+    print("%d actions" % options.actions)
+    for builder in (flat, nested, chain):
+        build, elapsed = run(builder, options.actions)
+        print("%s: build %.2f s, run %.2f s (%.1f us/action)" %
+              (builder.__name__, build, elapsed,
+               elapsed / options.actions * 1e6))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
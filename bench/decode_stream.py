@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# decode_stream.py -- Micro-benchmark of proxy message decoders
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Decode a recorded stream of proxy messages with each decoder: unrestricted
+pickle (as done before msg_pickle), restricted pickle and compact messages.
+
+The stream is recorded in FILE the first time, in v3 and v4 formats, and
+read back by the following runs, so decoders could be compared over time.
+
+Usage: PYTHONPATH=lib python bench/decode_stream.py [-n EVENTS] [-f FILE]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import pickle
+import binascii
+from optparse import OptionParser
+
+from Shine.Configuration.Globals import Globals
+from Shine.Lustre.Component import MOUNTED
+from Shine.Lustre.Actions.Action import Result
+from Shine.Lustre.Actions.StartTarget import StartTarget
+from Shine.Lustre.Actions.StartClient import StartClient
+from Shine.Lustre.Actions.Proxy import shine_msg_pack, \
+                                       shine_msg_pack_compact, \
+                                       shine_msg_unpack, SHINE_MSG_MAGIC
+
+from proxy_protocol import build_fs
+
+
+def record(filename, count):
+    """Write `count' events of a 1000 OSTs filesystem, in both formats."""
+    fs = build_fs(1000, 4000)
+    comps = list(fs.components)
+    stream = open(filename, 'w')
+    for idx in range(count):
+        comp = comps[idx % len(comps)]
+        node = str(comp.server.hostname)
+        if idx % 10 == 9:
+            event = dict(evtype='log', level='detail',
+                         msg='[RUN] mount %s' % comp.label)
+        else:
+            comp.state = MOUNTED
+            if comp.TYPE == 'client':
+                info = StartClient(comp).info()
+            else:
+                info = StartTarget(comp).info()
+            event = dict(evtype='comp', info=info, status='done',
+                         result=Result(duration=1.5))
+        for pack in (shine_msg_pack, shine_msg_pack_compact):
+            stream.write("%s %s" % (node, pack(**event)))
+    stream.close()
+
+def load(filename):
+    """Return v3 and v4 message lines of the recorded stream."""
+    lines = {3: [], 4: []}
+    for line in open(filename):
+        node, msg = line.rstrip('\n').split(' ', 1)
+        version = int(msg[len(SHINE_MSG_MAGIC)])
+        lines[version].append(msg)
+    return lines
+
+def plain_pickle(msg):
+    """Decode a v3 message with pickle, without any restriction."""
+    return pickle.loads(binascii.a2b_base64(msg.split(':', 2)[2]))
+
+def run(decoder, lines):
+    """Decode all lines. Return elapsed time."""
+    start = time.time()
+    for line in lines:
+        decoder(line)
+    return time.time() - start
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--events', type='int', default=100000)
+    parser.add_option('-f', '--file', default='/tmp/shine-events.stream')
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    options = parser.parse_args()[0]
+
+    if not os.path.exists(options.file):
+        print("Recording %d events in %s" % (options.events, options.file))
+        record(options.file, options.events)
+    lines = load(options.file)
+
+    Globals().replace('msg_pickle', 'yes')
+    for name, decoder, version in (('v3 pickle', plain_pickle, 3),
+                                   ('v3 restricted', shine_msg_unpack, 3),
+                                   ('v4 compact', shine_msg_unpack, 4)):
+        elapsed = min(run(decoder, lines[version])
+                      for _ in range(options.repeat))
+        count = len(lines[version])
+        print("%s: %d events, %.1f us/event, %.0f events/s" %
+              (name, count, elapsed * 1e6 / count, count / elapsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
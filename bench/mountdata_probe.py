@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# mountdata_probe.py -- Per-device latency of mountdata probes
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Measure how long it takes to read the mountdata of one device: natively,
+with 'tunefs.lustre --dryrun' when it is installed, and, as a reference for
+the fork cost, with a shell running 'true'.
+
+Devices are ldiskfs images created with mke2fs, or the given devices.
+
+Usage: PYTHONPATH=lib python bench/mountdata_probe.py [-n IMAGES] [DEV...]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import struct
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+from Shine.Lustre.Mountdata import read_mountdata, LDD_MAGIC
+
+
+def make_images(tmpdir, count):
+    """Create `count' small ldiskfs images with a Lustre mountdata."""
+    images = []
+    srcdir = os.path.join(tmpdir, 'src')
+    os.makedirs(os.path.join(srcdir, 'CONFIGS'))
+    for idx in range(count):
+        ldd = struct.pack('<8I', LDD_MAGIC, 0, 0, 0, 1, 0x2, idx, 1)
+        ldd += 'bench'.ljust(64, '\0')
+        ldd += ('bench-OST%04x' % idx).ljust(64, '\0')
+        fobj = open(os.path.join(srcdir, 'CONFIGS', 'mountdata'), 'w')
+        fobj.write(ldd.ljust(12288, '\0'))
+        fobj.close()
+        image = os.path.join(tmpdir, 'ost%d' % idx)
+        devnull = open(os.devnull, 'w')
+        subprocess.check_call(['mke2fs', '-q', '-F', '-t', 'ext4', '-d',
+                               srcdir, image, '16M'], stdout=devnull)
+        devnull.close()
+        images.append(image)
+    return images
+
+def shell(cmd):
+    """Return a probe running `cmd' for a device, in a shell."""
+    def probe(dev):
+        process = subprocess.Popen(cmd % dev, shell=True,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        process.communicate()
+    return probe
+
+def run(probe, devices, repeat):
+    """Return best per-device latency of `probe'."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for dev in devices:
+            probe(dev)
+        elapsed = (time.time() - start) / len(devices)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--images', type='int', default=20)
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    options, devices = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='shine-bench-')
+    try:
+        if not devices:
+            devices = make_images(tmpdir, options.images)
+
+        probes = [('native', read_mountdata),
+                  ('fork only', shell('true %s'))]
+        if subprocess.call('which tunefs.lustre >/dev/null 2>&1',
+                           shell=True) == 0:
+            probes.append(('tunefs.lustre',
+                           shell('tunefs.lustre --dryrun %s')))
+        else:
+            print("tunefs.lustre not found, skipped")
+
+        print("%d devices" % len(devices))
+        for name, probe in probes:
+            latency = run(probe, devices, options.repeat)
+            print("%s: %.3f ms/device" % (name, latency * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# proxy_protocol.py -- Compare proxy message versions size and decoding time
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Measure bytes per event and admin-side decoding time of the proxy protocol
+versions (v3 pickle vs v4 compact, alone or batched), for a filesystem of N
+OSTs and M clients.
+
+Usage: PYTHONPATH=lib python bench/proxy_protocol.py [-o OSTS] [-c CLIENTS]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from optparse import OptionParser
+
+from Shine.Lustre.FileSystem import FileSystem
+from Shine.Lustre.Server import Server
+from Shine.Lustre.Component import MOUNTED
+from Shine.Lustre.Actions.StartTarget import StartTarget
+from Shine.Lustre.Actions.StartClient import StartClient
+from Shine.Lustre.Actions.Proxy import shine_msg_pack, \
+                                       shine_msg_pack_compact, \
+                                       shine_msg_dumps_compact, \
+                                       shine_msg_pack_batch, \
+                                       shine_msg_unpack
+
+
+def build_fs(osts, clients):
+    """Create a filesystem with one MGT, one MDT and the requested comps."""
+    fs = FileSystem('bench')
+    srv = Server('oss0', ['oss0@tcp'])
+    fs.new_target(srv, 'mgt', 0, '/dev/mgt')
+    fs.new_target(srv, 'mdt', 0, '/dev/mdt')
+    for idx in range(osts):
+        srv = Server('oss%d' % (idx // 8), ['oss%d@tcp' % (idx // 8)])
+        fs.new_target(srv, 'ost', idx, '/dev/ost%d' % idx)
+    for idx in range(clients):
+        srv = Server('cli%d' % idx, ['cli%d@tcp' % idx])
+        fs.new_client(srv, '/bench')
+    return fs
+
+def build_events(fs, pack):
+    """Build one 'done' message per component, as sent by remote nodes."""
+    events = []
+    for comp in fs.components:
+        comp.state = MOUNTED
+        if comp.TYPE == 'client':
+            info = StartClient(comp).info()
+        else:
+            info = StartTarget(comp).info()
+        node = str(comp.server.hostname)
+        events.append((node, pack(evtype='comp', info=info, status='done')))
+    return events
+
+def build_batches(events, size):
+    """Group compact payloads of each node by `size', like remote nodes."""
+    lines = []
+    pending = {}
+    for node, payload in events:
+        pending.setdefault(node, []).append(payload)
+        if len(pending[node]) == size:
+            lines.append((node, shine_msg_pack_batch(pending.pop(node))))
+    for node, payloads in pending.items():
+        lines.append((node, shine_msg_pack_batch(payloads)))
+    return lines
+
+def run(fs, lines):
+    """Decode all messages and apply them to `fs'. Return elapsed time."""
+    start = time.time()
+    for node, line in lines:
+        msg = shine_msg_unpack(line.rstrip('\n'))
+        if isinstance(msg, list):
+            fs.distant_events(node, msg)
+        else:
+            fs.distant_event(msg.pop('evtype'), node=node, **msg)
+    return time.time() - start
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-o', '--osts', type='int', default=1000)
+    parser.add_option('-c', '--clients', type='int', default=5000)
+    parser.add_option('-b', '--batch', type='int', default=32)
+    parser.add_option('-r', '--repeat', type='int', default=3)
+    options = parser.parse_args()[0]
+
+    print("%d OSTs, %d clients" % (options.osts, options.clients))
+    for name, pack, batch in (('v3', shine_msg_pack, None),
+                              ('v4', shine_msg_pack_compact, None),
+                              ('v4 batch', shine_msg_dumps_compact,
+                               options.batch)):
+        lines = build_events(build_fs(options.osts, options.clients), pack)
+        count = len(lines)
+        if batch:
+            lines = build_batches(lines, batch)
+        size = sum(len(line) for _, line in lines)
+        # Decode into a separate filesystem to mimic the admin node.
+        admin = build_fs(options.osts, options.clients)
+        elapsed = min(run(admin, lines) for _ in range(options.repeat))
+        print("%s: %d events in %d lines, %.1f bytes/event, %.1f us/event, "
+              "total %.3fs" % (name, count, len(lines), float(size) / count,
+                               elapsed * 1e6 / count, elapsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
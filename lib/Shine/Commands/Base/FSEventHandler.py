@@ -24,12 +24,16 @@ Command event handler classes used to display information when receiving events.
 
 from __future__ import print_function
 
+import time
 import datetime
+from collections import OrderedDict
 
+from ClusterShell.NodeSet import NodeSet
 from ClusterShell.Task import task_self
 
 from Shine.CLI.Display import display
 from Shine.Lustre.EventHandler import EventHandler as LustreEH
+from Shine.Lustre.Actions.Action import RetryResult
 from Shine.Lustre.FileSystem import INPROGRESS
 
 
@@ -58,6 +62,10 @@ class FSLocalEventHandler(LustreEH):
         self.fs_action = command.NAME
         self.verbose = self.command.options.verbose
         self.fs = None
+        # Nodes where actions timed out, by action name
+        self.stragglers = OrderedDict()
+        # Number of retries and nodes where actions were retried
+        self.retried = OrderedDict()
 
     #
     # Logging methods
@@ -146,11 +154,20 @@ class FSLocalEventHandler(LustreEH):
         self.log_warning(txt)
 
     def action_timeout(self, node, action, text):
-        """No-op when a component action timeout."""
+        """Remember `node' did not end `action' in time, see post()."""
+        self.action_log(node, action, text, 'timeout')
+        self.stragglers.setdefault(action, NodeSet()).add(node)
 
     def action_progress(self, node, action, text, result):
         """No-op when a component action progress is received."""
 
+    def action_retry(self, node, action, text, result):
+        """Display and count a component action run again, see post()."""
+        self.action_log(node, action, text, ' failed, retrying (%s)' % result)
+        count, nodes = self.retried.get(action, (0, NodeSet()))
+        nodes.add(node)
+        self.retried[action] = (count + 1, nodes)
+
     def event_callback(self, evtype, **kwargs):
         node = kwargs['node']
 
@@ -179,7 +196,10 @@ class FSLocalEventHandler(LustreEH):
             self.action_failed(node, action, text, result)
         elif status == 'progress':
             result = kwargs['result']
-            self.action_progress(node, action, text, result)
+            if isinstance(result, RetryResult):
+                self.action_retry(node, action, text, result)
+            else:
+                self.action_progress(node, action, text, result)
 
     def handle_pre(self):
         """Custom handler called before processing each filesystem."""
@@ -205,6 +225,18 @@ class FSLocalEventHandler(LustreEH):
     def post(self, fs):
         """Do any post-processing. This is called for each filesystem."""
         self.handle_post(fs)
+        self.display_stragglers()
+
+    def display_stragglers(self):
+        """Display and forget nodes where actions timed out or were retried."""
+        for action, (count, nodes) in self.retried.items():
+            self.log_warning("%s: %s retried %d time(s) on %d node(s)" %
+                             (nodes, action, count, len(nodes)))
+        self.retried.clear()
+        for action, nodes in self.stragglers.items():
+            self.log_warning("%s: %s timed out on %d node(s)" %
+                             (nodes, action, len(nodes)))
+        self.stragglers.clear()
 
 
 # Theorically, this class should inherit from ClusterShell EventHandler too.
@@ -230,7 +262,7 @@ class FSGlobalEventHandler(FSLocalEventHandler):
 
     def event_callback(self, evtype, **kwargs):
         FSLocalEventHandler.event_callback(self, evtype, **kwargs)
-        if kwargs.get('status') in ('start', 'done', 'failed'):
+        if kwargs.get('status') in ('start', 'done', 'timeout', 'failed'):
             self._update()
 
     def handle_pre(self):
@@ -254,13 +286,20 @@ class FSGlobalEventHandler(FSLocalEventHandler):
 
         if target_count > 0 and self.status_changed:
             self.status_changed = False
-            now = datetime.datetime.now().strftime("%H:%M")
+            now = datetime.datetime.now()
+            # Expected end, from the duration history
+            eta = ""
+            estimate = self.fs.estimate(now=time.time())
+            if estimate is not None and estimate[0] > 0:
+                end = now + datetime.timedelta(seconds=estimate[0])
+                eta = " (ETA %s)" % end.strftime("%H:%M")
+            now = now.strftime("%H:%M")
             if len(target_servers) > 8:
-                print("[%s] In progress for %d component(s) on %d servers ..."
-                      % (now, target_count, len(target_servers)))
+                print("[%s] In progress for %d component(s) on %d servers%s"
+                      " ..." % (now, target_count, len(target_servers), eta))
             else:
-                print("[%s] In progress for %d component(s) on %s ..." %
-                      (now, target_count, target_servers))
+                print("[%s] In progress for %d component(s) on %s%s ..." %
+                      (now, target_count, target_servers, eta))
 
     def _update(self):
         """
@@ -30,6 +30,8 @@ from Shine.Commands.Base.Command import RemoteCommand, CommandHelpException
 
 # Command helper
 from Shine.FSUtils import open_lustrefs
+from Shine.Lustre.FileSystem import FileSystem
+from Shine.Lustre.Actions.Proxy import ProxyMux
 
 # Error handling
 from Shine.Commands.Base.CommandRCDefs import RC_RUNTIME_ERROR
@@ -47,6 +49,10 @@ class FSLiveCommand(RemoteCommand):
 
     CRITICAL = False
 
+    # Commands which could run several filesystems in the same run loop
+    # implement launch_fs() and finish_fs(), see _execute_multi().
+    MULTI_FS = False
+
     TARGET_STATUS_RC_MAP = {}
 
     def fs_status_to_rc(self, status_set):
@@ -66,6 +72,17 @@ class FSLiveCommand(RemoteCommand):
     def execute_fs(self, fs, fs_conf, eh, vlevel):
         raise NotImplemented("Derived class must implement.")
 
+    def launch_fs(self, fs, fs_conf, eh, vlevel):
+        """
+        Launch `fs' actions without running them. Return an object given back
+        to finish_fs(), or None if nothing was launched.
+        """
+        raise NotImplementedError("Derived class must implement.")
+
+    def finish_fs(self, fs, fs_conf, eh, vlevel, launched):
+        """Check and display `fs' results, once its actions are run."""
+        raise NotImplementedError("Derived class must implement.")
+
     def execute(self):
         first = True
 
@@ -90,7 +107,11 @@ class FSLiveCommand(RemoteCommand):
             global_eh = self.GLOBAL_EH(self)
         eh = self.install_eventhandler(local_eh, global_eh)
 
-        for fsname in self.iter_fsname():
+        fsnames = list(self.iter_fsname())
+        if self.MULTI_FS and not self.options.remote and len(fsnames) > 1:
+            return self._execute_multi(fsnames, eh)
+
+        for fsname in fsnames:
 
             # Open configuration and instantiate a Lustre FS.
             fs_conf, fs = self._open_fs(fsname, eh)
@@ -98,8 +119,16 @@ class FSLiveCommand(RemoteCommand):
             # Define debuggin level
             fs.set_debug(self.options.debug)
 
+            # The admin node estimates action durations.
+            if not self.options.remote:
+                fs.enable_history()
+
+            # Tag events with their filesystem for the admin node.
+            if self.options.remote and len(fsnames) > 1:
+                eh.fsname = fsname
+
             # Separate each fsname with a blank line
-            if not first:
+            if not first and not self.options.remote:
                 print()
             first = False
 
@@ -108,3 +137,35 @@ class FSLiveCommand(RemoteCommand):
             result = max(result, self.execute_fs(fs, fs_conf, eh, vlevel))
 
         return result
+
+    def _execute_multi(self, fsnames, eh):
+        """
+        Run all filesystems in the same run loop.
+
+        Proxy actions of all filesystems are grouped by node, so each node is
+        contacted once, see ProxyMux. Results are then displayed for each
+        filesystem, as usual.
+        """
+        mux = ProxyMux()
+        vlevel = self.options.verbose
+        launched = []
+        for fsname in fsnames:
+            fs_conf, fs = self._open_fs(fsname, eh)
+            fs.set_debug(self.options.debug)
+            # The admin node estimates action durations.
+            fs.enable_history()
+            fs.proxy_mux = mux
+            launched.append((fs, fs_conf,
+                             self.launch_fs(fs, fs_conf, eh, vlevel)))
+
+        FileSystem.run_actions([fs for fs, _, pending in launched
+                                if pending is not None])
+
+        result = 0
+        for fs, fs_conf, pending in launched:
+            # Separate each fsname with a blank line
+            if fs is not launched[0][0]:
+                print()
+            result = max(result,
+                         self.finish_fs(fs, fs_conf, eh, vlevel, pending))
+        return result
@@ -18,24 +18,147 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
+import os
 import sys
+import time
+import atexit
+
+from ClusterShell.Event import EventHandler as TimerHandler
+from ClusterShell.Task import task_self
 
 from Shine.Lustre.EventHandler import EventHandler
-from Shine.Lustre.Actions.Proxy import shine_msg_pack
+from Shine.Lustre.Actions.Proxy import shine_msg_pack, \
+                                       shine_msg_pack_compact, \
+                                       shine_msg_dumps_compact, \
+                                       shine_msg_pack_batch, \
+                                       SHINE_MSG_ENV, SHINE_MSG_BATCH_ENV, \
+                                       SHINE_MSG_VERSION, \
+                                       SHINE_MSG_VERSION_COMPACT
+
+
+class _FlushTimer(TimerHandler):
+    """Send pending events when the batch delay expires."""
+
+    def __init__(self, handler):
+        TimerHandler.__init__(self)
+        self.handler = handler
+
+    def ev_timer(self, timer):
+        self.handler.flush()
+
+
+def _flush_at_exit():
+    """Send events still pending in the batch of the last handler."""
+    if RemoteCallEventHandler.batching is not None:
+        RemoteCallEventHandler.batching.flush()
+
+atexit.register(_flush_at_exit)
+
 
 class RemoteCallEventHandler(EventHandler):
     """
     Special shine EventHandler installed when called with -R (remote
     call), which aims to serialize all events instead of printing human
     output.
+
+    If asked by the admin node, compact events are grouped and sent in a
+    single line, when the batch is full, when its delay expires or at exit.
     """
 
+    # Last handler grouping events, flushed at exit. An agent creates one
+    # handler per request, only the last one could still have events.
+    batching = None
+
+    def __init__(self):
+        EventHandler.__init__(self)
+        # Use compact messages only if the admin node announced it
+        # supports them.
+        try:
+            version = int(os.environ.get(SHINE_MSG_ENV, SHINE_MSG_VERSION))
+        except ValueError:
+            version = SHINE_MSG_VERSION
+        self.compact = (version >= SHINE_MSG_VERSION_COMPACT)
+
+        # Batching parameters: "<events>:<milliseconds>"
+        self.batch_size = 0
+        self.batch_delay = 0
+        if self.compact and os.environ.get(SHINE_MSG_BATCH_ENV):
+            try:
+                size, delay = os.environ[SHINE_MSG_BATCH_ENV].split(':')
+                self.batch_size = int(size)
+                self.batch_delay = int(delay) / 1000.0
+            except ValueError:
+                self.batch_size = 0
+
+        # Set when several filesystems are run by the same command, so the
+        # admin node could give each event to the right filesystem.
+        self.fsname = None
+
+        self._pending = []
+        self._pending_time = None
+        self._timer = None
+        if self.batch_size > 1:
+            RemoteCallEventHandler.batching = self
+
+    def _write(self, msg):
+        sys.stdout.write(msg)
+        sys.stdout.flush()
+
+    def flush(self):
+        """Send all pending events."""
+        if self._timer is not None:
+            self._timer.invalidate()
+            self._timer = None
+        if self._pending:
+            self._write(shine_msg_pack_batch(self._pending))
+            self._pending = []
+            self._pending_time = None
+
+    def _batch(self, payload):
+        """Add a compact payload to the pending batch."""
+        now = time.time()
+        if not self._pending:
+            self._pending_time = now
+        self._pending.append(payload)
+
+        if len(self._pending) >= self.batch_size or \
+           now - self._pending_time >= self.batch_delay:
+            self.flush()
+        elif self._timer is None:
+            # Events raised while the run loop is idle are flushed when the
+            # loop runs again, or at exit.
+            self._timer = task_self().timer(self.batch_delay,
+                                            handler=_FlushTimer(self),
+                                            autoclose=True)
+
+    def pack(self, **kwargs):
+        """Encode an event using the negotiated message version."""
+        if self.compact:
+            try:
+                return shine_msg_pack_compact(**kwargs)
+            except (TypeError, ValueError):
+                # Not a plain value (or not UTF-8 text): v3 handles anything.
+                pass
+        return shine_msg_pack(**kwargs)
+
     def event_callback(self, evtype, **kwargs):
         """Convert each event it receives into an encoded line on stdout."""
         # For distant message, we do not need to send the node. It will
         # be extract from the incoming server name.
         if 'node' in kwargs:
             del kwargs['node']
-        msg = shine_msg_pack(evtype=evtype, **kwargs)
-        sys.stdout.write(msg)
-        sys.stdout.flush()
+        if self.fsname is not None:
+            kwargs['fsname'] = self.fsname
+
+        if self.batch_size > 1:
+            try:
+                self._batch(shine_msg_dumps_compact(evtype=evtype, **kwargs))
+                # The admin node is waiting for it.
+                if evtype == 'stage':
+                    self.flush()
+                return
+            except (TypeError, ValueError):
+                # Send it alone, after the previous events.
+                self.flush()
+
+        self._write(self.pack(evtype=evtype, **kwargs))
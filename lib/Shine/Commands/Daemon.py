@@ -0,0 +1,73 @@
+# Daemon.py -- Keep local component states for status
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Shine `daemon' command classes.
+
+Run the local state daemon, see Shine.Lustre.StateDaemon.
+"""
+
+from __future__ import print_function
+
+import sys
+import signal
+
+from ClusterShell.NodeSet import NodeSet
+
+from Shine.Configuration.Globals import Globals
+
+from Shine.Commands.Base.Command import Command, CommandException
+from Shine.FSUtils import open_lustrefs
+from Shine.Lustre.Server import Server
+from Shine.Lustre.StateDaemon import StateDaemon
+
+class Daemon(Command):
+    """
+    shine daemon
+    """
+
+    NAME = "daemon"
+    DESCRIPTION = "Keep local component states for status."
+
+    def execute(self):
+
+        # Option sanity check
+        self.forbidden(self.options.fsnames, "-f")
+        self.forbidden(self.options.model, "-m")
+        self.forbidden(self.options.labels, "-l")
+        self.forbidden(self.options.indexes, "-i")
+        self.forbidden(self.options.failover, "-F")
+
+        path = Globals().get('state_socket')
+        if not path:
+            raise CommandException("state_socket is not set in shine.conf")
+
+        def loader(fsname):
+            """Only local components are checked."""
+            return open_lustrefs(fsname,
+                                 nodes=NodeSet(Server.hostname_short()),
+                                 extended=True)[1]
+
+        # Exit cleanly, removing the socket
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        daemon = StateDaemon(path, Globals().get('state_interval'), loader)
+        daemon.serve()
+        return 0
@@ -94,6 +94,7 @@ class Start(FSLiveCommand):
                           fanout=self.options.fanout,
                           dryrun=self.options.dryrun,
                           mountdata=self.options.mountdata,
+                          stages=self.options.stages,
                           tunings=Tune.get_tuning(fs_conf, fs.components))
 
         rc = self.fs_status_to_rc(status)
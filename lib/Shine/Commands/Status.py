@@ -30,11 +30,17 @@ detailed states.
 
 from __future__ import print_function
 
+import os
+import sys
+import time
+import select
+
 # Command base class
 from Shine.Commands.Base.FSLiveCommand import FSLiveCommand
 from Shine.Commands.Base.CommandRCDefs import RC_ST_OFFLINE, RC_ST_EXTERNAL, \
                                               RC_ST_ONLINE, RC_ST_RECOVERING, \
                                               RC_ST_MIGRATED, \
+                                              RC_ST_UNREACHABLE, \
                                               RC_FAILURE, RC_TARGET_ERROR, \
                                               RC_CLIENT_ERROR, RC_RUNTIME_ERROR
 
@@ -43,10 +49,51 @@ from Shine.Commands.Base.FSEventHandler import FSGlobalEventHandler, \
                                                FSLocalEventHandler
 from Shine.Lustre.FileSystem import MOUNTED, RECOVERING, EXTERNAL, OFFLINE, \
                                     TARGET_ERROR, CLIENT_ERROR, RUNTIME_ERROR, \
-                                    MIGRATED
+                                    MIGRATED, UNREACHABLE
 
 from Shine.FSUtils import open_lustrefs
 
+
+class WatchEventHandler(FSGlobalEventHandler):
+    """
+    Event handler of 'status --watch', once the initial status is displayed.
+
+    A line is printed each time a component state changes.
+    """
+
+    def __init__(self, command, comps):
+        FSGlobalEventHandler.__init__(self, command)
+        self._states = dict((comp.uniqueid(), comp.text_status())
+                            for comp in comps)
+
+    def event_callback(self, evtype, **kwargs):
+        if evtype == 'log':
+            FSLocalEventHandler.event_callback(self, evtype, **kwargs)
+            return
+
+        if evtype != 'comp' or kwargs['status'] not in ('done', 'failed'):
+            return
+
+        # Remote v3 events give the local component apart.
+        comp = kwargs.get('comp') or kwargs['info'].elem
+        if comp.uniqueid() not in self._states:
+            return
+        comp.update_server()
+        state = comp.text_status()
+        previous = self._states[comp.uniqueid()]
+        if state == previous:
+            return
+        self._states[comp.uniqueid()] = state
+
+        line = "[%s] %s on %s: %s -> %s" % (time.strftime("%H:%M:%S"),
+                                            comp.label, comp.server,
+                                            previous, state)
+        if kwargs['status'] == 'failed':
+            line += " (%s)" % kwargs['result']
+        print(line)
+        sys.stdout.flush()
+
+
 class Status(FSLiveCommand):
     """
     shine status [-f <fsname>] [-t <target>] [-i <index(es)>] [-n <nodes>] [-qv]
@@ -66,14 +113,39 @@ class Status(FSLiveCommand):
             OFFLINE : RC_ST_OFFLINE,
             TARGET_ERROR : RC_TARGET_ERROR,
             CLIENT_ERROR : RC_CLIENT_ERROR,
+            UNREACHABLE : RC_ST_UNREACHABLE,
             RUNTIME_ERROR : RC_RUNTIME_ERROR }
 
+    MULTI_FS = True
+
+    def __init__(self, options=None, args=None):
+        FSLiveCommand.__init__(self, options, args)
+        # Age of results read from the status cache, for each filesystem
+        self._cache_ages = {}
+
+    def _cache_key(self):
+        """Return the status cache key of the selected components and view."""
+        opts = self.options
+        return ';'.join(str(value or '') for value in
+                        (opts.view, ','.join(opts.targets or []),
+                         opts.indexes, opts.labels, opts.nodes,
+                         opts.excludes, opts.failover, opts.local))
+
     def execute_fs(self, fs, fs_conf, eh, vlevel):
+        comps = self.launch_fs(fs, fs_conf, eh, vlevel)
+        if comps is not None:
+            fs.run_actions([fs])
+        result = self.finish_fs(fs, fs_conf, eh, vlevel, comps)
+        if comps is not None and self.options.watch and self.options.remote:
+            self._watch_remote(fs, comps)
+        return result
+
+    def launch_fs(self, fs, fs_conf, eh, vlevel):
 
         # Warn if trying to act on wrong nodes
         all_nodes = fs.components.managed().allservers()
         if not self.check_valid_list(fs.fs_name, all_nodes, "check"):
-            return RC_FAILURE
+            return None
 
         # Apply 'status' only to required components
         comps = fs.components
@@ -86,17 +158,61 @@ class Status(FSLiveCommand):
         if hasattr(eh, 'pre'):
             eh.pre(fs)
 
-        fs_result = fs.status(comps,
-                              failover=self.options.failover,
-                              dryrun=self.options.dryrun,
-                              fanout=self.options.fanout,
-                              mountdata=self.options.mountdata)
+        # Recent enough results of the same status, see StatusCache.
+        if self.options.max_age is not None and not self.options.remote \
+           and not self.options.watch:
+            cached = fs.cached_status(comps, self._cache_key(),
+                                      self.options.max_age)
+            if cached is not None:
+                comps, self._cache_ages[fs.fs_name] = cached
+                return comps
+
+        # Remote nodes watch their components after the status run, see
+        # _watch_remote().
+        watch = None
+        if self.options.watch and not self.options.remote:
+            watch = self.options.watch_interval
+
+        def ready(comps):
+            self._watch_ready(fs, fs_conf, eh, vlevel, comps)
+
+        # Remote nodes only check their local components.
+        deadline = None
+        if not self.options.remote:
+            deadline = self.options.deadline
+
+        return fs.launch_status(comps,
+                                failover=self.options.failover,
+                                dryrun=self.options.dryrun,
+                                fanout=self.options.fanout,
+                                mountdata=self.options.mountdata,
+                                watch=watch, ready=ready, daemon=True,
+                                deadline=deadline)
+
+    def finish_fs(self, fs, fs_conf, eh, vlevel, comps):
+        if comps is None:
+            return RC_FAILURE
+
+        fs_result = fs.check_status(comps)
 
         # Display error messages for each node that failed.
         if len(fs.proxy_errors) > 0:
             self.display_proxy_errors(fs)
             print()
 
+        if fs.unreachable:
+            print("%s: no answer within %d seconds, status of their "
+                  "components is unknown" % (fs.unreachable,
+                                             self.options.deadline))
+            print()
+
+        if fs.fs_name in self._cache_ages:
+            print("Status of %s from cache, %d seconds old" %
+                  (fs.fs_name, self._cache_ages[fs.fs_name]))
+        elif not self.options.remote and not self.options.dryrun and \
+             len(fs.proxy_errors) == 0 and not fs.unreachable:
+            fs.cache_status(comps, self._cache_key())
+
         result = self.fs_status_to_rc(fs_result)
 
         # Call a handle_post() method if defined by the event handler.
@@ -105,6 +221,35 @@ class Status(FSLiveCommand):
 
         return result
 
+    def _watch_ready(self, fs, fs_conf, eh, vlevel, comps):
+        """
+        Initial status of `fs' is known: display it, then only display
+        component state changes.
+        """
+        self.finish_fs(fs, fs_conf, eh, vlevel, comps)
+        print("Watching %s every %d seconds (^C to stop)" %
+              (fs.fs_name, self.options.watch_interval))
+        sys.stdout.flush()
+        fs.hdlr = WatchEventHandler(self, comps)
+
+    def _watch_remote(self, fs, comps):
+        """
+        Remote side of --watch: check local components again every interval
+        and only send the changes, until the admin node closes our standard
+        input.
+
+        The admin node runs a separate command for each filesystem watched.
+        """
+        fs.local_event('watch')
+        self.eventhandler.flush()
+        while True:
+            ready = select.select([sys.stdin], [], [],
+                                  self.options.watch_interval)[0]
+            if ready and not os.read(sys.stdin.fileno(), 4096):
+                break
+            fs.poll_status(comps)
+            self.eventhandler.flush()
+
     def _open_fs(self, fsname, eh):
         # Status command needs to open the filesystem in extended mode.
         # See FSUtils.instantiate_lustrefs() for the use of this argument.
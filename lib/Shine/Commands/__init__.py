@@ -40,7 +40,8 @@ for cmd in [ "Show",
              "Umount",
              "Tune",
              "Tunefs",
-             "Execute"]:
+             "Execute",
+             "Daemon"]:
 
     # Import command class file
     mod = __import__("Shine.Commands." + cmd, globals(), locals(), [cmd])
@@ -181,6 +181,9 @@ class Configuration:
     def get_default_mount_options(self):
         return self._fs.get('mount_options')
 
+    def get_action_limits(self):
+        return self._fs.get('action_limit', [])
+
     def get_target_mount_options(self, target):
         return self._fs.get('%s_mount_options' % str(target).lower())
 
@@ -419,7 +419,7 @@ class FileSystem(object):
             actions['restart'] = True
 
         # Only need to update cache file
-        copykeys = set(['description'])
+        copykeys = set(['description', 'action_limit'])
         if copykeys & anyset:
             actions['copyconf'] = True
 
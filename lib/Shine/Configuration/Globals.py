@@ -25,8 +25,10 @@ This is mostly done using the Globals singleton.
 """
 
 import os
+import re
 
-from Shine.Configuration.ModelFile import ModelFile, SimpleElement
+from Shine.Configuration.ModelFile import ModelFile, SimpleElement, \
+                                       ModelFileValueError
 
 
 class Globals(object):
@@ -65,6 +67,10 @@ class Globals(object):
                     default='/etc/shine/storage.conf')
             self.add_element('status_dir',          check='path',
                     default='/var/cache/shine/status')
+            self.add_element('status_cache_ttl',    check='digit',
+                    default=0)
+            self.add_element('history_dir',         check='path',
+                    default='/var/cache/shine/history')
 
             # Config dirs
             self.add_element('conf_dir',            check='path',
@@ -80,9 +86,42 @@ class Globals(object):
                     default=0)
             self.add_element('default_timeout',     check='digit',
                     default=30)
+            # Commands of these actions, 0 or unset for no timeout
+            self.add_element('start_timeout',       check='digit')
+            self.add_element('mount_timeout',       check='digit')
+            self.add_element('stop_timeout',        check='digit')
+            self.add_element('status_timeout',      check='digit')
+
+            # ClusterShell topology, to reach nodes through gateways
+            self.add_element('topology_file',       check='path')
+
+            # Keep one shine agent per node for the whole command
+            self.add_element('remote_agent',        check='boolean',
+                    default=False)
+
+            # Remote event batching (0 to disable)
+            self.add_element('msg_batch_size',      check='digit',
+                    default=0)
+            self.add_element('msg_batch_delay',     check='digit',
+                    default=200)
+
+            # Accept pickle messages from older remote nodes
+            self.add_element('msg_pickle',          check='boolean',
+                    default=False)
 
             # Commands
             self.add_element('command_path',        check='path')
+            self.add_element('mountdata_fanout',    check='digit',
+                    default=8)
+            self.add_element('mountdata_cache',     check='path',
+                    default='/var/cache/shine/mountdata')
+            self.add_custom('action_limit', ActionLimit(), multiple=True)
+            self.add_custom('action_retry', ActionRetry(), multiple=True)
+
+            # Local state daemon, see 'shine daemon'
+            self.add_element('state_socket',        check='path')
+            self.add_element('state_interval',      check='digit',
+                    default=10)
 
             # Lustre version
             self.add_element('lustre_version',      check='string')
@@ -92,10 +131,6 @@ class Globals(object):
                     default='auto', values=['never', 'always', 'auto'])
 
             # TO BE IMPLEMENTED
-            self.add_element('start_timeout',       check='digit')
-            self.add_element('mount_timeout',       check='digit')
-            self.add_element('stop_timeout',        check='digit')
-            self.add_element('status_timeout',      check='digit')
             self.add_element('log_file',            check='path')
             self.add_element('log_level',           check='string')
 
@@ -162,3 +197,103 @@ class DefaultElement(SimpleElement):
 
     def __len__(self):
         return int(self.get() is not None)
+
+
+class ActionLimit(SimpleElement):
+    """
+    Maximum number of commands of some actions run at the same time, for
+    each value of a resource: '<actions> <resource> <max>'.
+
+    <actions> is a comma-separated list of action names, or '*' for all of
+    them. <resource> is one of RESOURCES.
+    """
+
+    RESOURCES = ('server', 'group', 'tag', 'action')
+
+    def __init__(self, check='string', default=None, values=None):
+        SimpleElement.__init__(self, check, default, values)
+
+    @classmethod
+    def split(cls, value):
+        """
+        Return (action names or None for all of them, resource, max) of
+        `value'.
+        """
+        try:
+            actions, resource, limit = value.split()
+            limit = int(limit)
+        except ValueError:
+            raise ModelFileValueError("'%s' is not <actions> <resource> <max>"
+                                      % value)
+        if resource not in cls.RESOURCES:
+            raise ModelFileValueError("%s not in %s" %
+                                      (resource, list(cls.RESOURCES)))
+        if limit < 1:
+            raise ModelFileValueError("Limit should be at least 1: %s" % value)
+        if actions == '*':
+            actions = None
+        else:
+            actions = frozenset(actions.split(','))
+        return actions, resource, limit
+
+    def _validate(self, value):
+        value = ' '.join(SimpleElement._validate(self, value).split())
+        self.split(value)
+        return value
+
+
+class ActionRetry(SimpleElement):
+    """
+    Retry policy of some actions commands which failed with a transient
+    error: '<actions> <attempts> <delay> <retcodes> [<pattern>]'.
+
+    <actions> is a comma-separated list of action names, or '*' for all of
+    them. A command is run at most <attempts> times. Before each new
+    attempt, it waits for about <delay> seconds, doubled at each attempt.
+    A failure is transient if its return code is one of <retcodes>, a
+    comma-separated list or '*' for any of them, and if its output matches
+    <pattern> regular expression, when set.
+    """
+
+    def __init__(self, check='string', default=None, values=None):
+        SimpleElement.__init__(self, check, default, values)
+
+    @classmethod
+    def split(cls, value):
+        """
+        Return (action names or None for all of them, attempts, delay,
+        return codes or None for all of them, compiled pattern or None) of
+        `value'.
+        """
+        fields = value.split(None, 4)
+        try:
+            actions, attempts, delay, retcodes = fields[:4]
+            attempts = int(attempts)
+            delay = float(delay)
+            if retcodes == '*':
+                retcodes = None
+            else:
+                retcodes = frozenset(int(rc) for rc in retcodes.split(','))
+        except ValueError:
+            raise ModelFileValueError("'%s' is not <actions> <attempts> "
+                                      "<delay> <retcodes> [<pattern>]" % value)
+        if attempts < 1 or delay < 0:
+            raise ModelFileValueError("Attempts should be at least 1 and "
+                                      "delay not negative: %s" % value)
+        pattern = None
+        if len(fields) == 5:
+            try:
+                pattern = re.compile(fields[4])
+            except re.error as error:
+                raise ModelFileValueError("Bad pattern in '%s': %s" %
+                                          (value, error))
+        if actions == '*':
+            actions = None
+        else:
+            actions = frozenset(actions.split(','))
+        return actions, attempts, delay, retcodes, pattern
+
+    def _validate(self, value):
+        value = SimpleElement._validate(self, value).strip()
+        self.split(value)
+        return value
@@ -25,6 +25,7 @@ import re
 
 from Shine.Configuration.ModelFile import ModelFile, SimpleElement, \
                                           ModelFileValueError
+from Shine.Configuration.Globals import ActionLimit
 
 class Model(ModelFile):
     """Represent a Shine model file.
@@ -58,6 +59,9 @@ class Model(ModelFile):
         self.add_element('mount_options',     check='string')
         self.add_element('mount_path',        check='path')
 
+        # Concurrency of action commands, see shine.conf
+        self.add_custom('action_limit', ActionLimit(), multiple=True)
+
         # Quota
         self.add_element('quota',             check='boolean')
         self.add_element('quota_type',        check='string', default='ug')
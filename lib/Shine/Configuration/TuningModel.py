@@ -26,6 +26,7 @@ Tuning parameter alias class
 
 import re
 import glob
+import shlex
 
 from ClusterShell.NodeSet import NodeSet
 
@@ -87,10 +88,8 @@ class TuningParameter(object):
             output += " nodes=%s" % self.node_list
         return output
         
-    def build_tuning_command(self, fs_name):
-        """
-        This function aims to apply the tuning parameter to the local node
-        """
+    def _tuning_paths(self, fs_name):
+        """Return the local files matching this tuning parameter."""
         path_pattern = self.name
         
         # Replace variables in the command string
@@ -100,15 +99,35 @@ class TuningParameter(object):
         path_pattern = path_pattern.replace("${ost}", "%s-OST" % fs_name)
         path_pattern = path_pattern.replace("${mdt}", "%s-MDT" % fs_name)
         path_pattern = path_pattern.replace("${fsname}", "%s" % fs_name)
-                    
+
+        return glob.glob(path_pattern)
+
+    def build_tuning_command(self, fs_name):
+        """
+        This function aims to apply the tuning parameter to the local node
+        """
         # Walk through path list and create a command for each one
         command_list = []
-        for path in glob.glob(path_pattern):
+        for path in self._tuning_paths(fs_name):
             command_list.append("echo -n %s > %s" % (self.value, path))
 
         # Return the newly created commands to the caller
         return command_list
 
+    def build_tuning_writes(self, fs_name):
+        """
+        Return (path, content, command) of each file to write to apply the
+        tuning parameter to the local node. `content' is what `command',
+        the one of build_tuning_command(), would write.
+        """
+        # Value is given to echo through the shell, remove its quotes.
+        try:
+            content = ' '.join(shlex.split(str(self.value)))
+        except ValueError:
+            content = str(self.value)
+        return [(path, content, "echo -n %s > %s" % (self.value, path))
+                for path in self._tuning_paths(fs_name)]
+
 
 
 class TuningModel(object):
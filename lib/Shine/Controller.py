@@ -36,11 +36,24 @@ from Shine.CLI.Display import DisplayError
 from Shine.Commands import COMMAND_LIST
 from Shine.Commands.Base.Command import CommandHelpException, CommandException
 from Shine.Commands.Base.CommandRCDefs import RC_RUNTIME_ERROR
+from Shine.Commands.Base.RemoteCallEventHandler import RemoteCallEventHandler
+
+from Shine.Lustre.Actions.Action import CommonAction, MountdataProbe, \
+                                        ResourceLimits
+from Shine.Lustre.Actions.Proxy import shine_msg_unpack, shine_msg_pack_end, \
+                                       ProxyActionUnpackError, \
+                                       ProxyActionUnpickleError, \
+                                       FSProxyAction
+from Shine.Lustre.Actions.Barrier import AdminInput
 
 from Shine.Lustre.FileSystem import FSRemoteError
 from Shine.Lustre.Component import ComponentError
+from Shine.Lustre.ProcFS import proc_snapshot
+from Shine.Lustre.Trace import action_trace
+from Shine.FSUtils import reset_servers
 
 from ClusterShell.Task import task_self
+from ClusterShell.Topology import TopologyError
 from ClusterShell.NodeSet import NodeSet, NodeSetException, NodeSetParseError, \
                                  RangeSet, RangeSetParseError
 
@@ -69,7 +82,7 @@ class Controller(object):
         print("Error: %s" % msg, file=sys.stderr)
 
     @classmethod
-    def handle_options(cls):
+    def handle_options(cls, args=None):
 
         def check_nodeset(option, opt, value):
             try:
@@ -199,8 +212,28 @@ class Controller(object):
                           choices=['auto', 'never', 'always'], default='auto',
                           help="analyze target mountdata (never, always"
                                " or auto)", metavar='WHEN')
+        parser.add_option("--watch", dest="watch", action="store_true",
+                          help="keep on checking status, only displaying"
+                               " changes (status only)")
+        parser.add_option("--watch-interval", dest="watch_interval",
+                          type="int", default=10, metavar="SECONDS",
+                          help="seconds between two checks with --watch"
+                               " (default: 10)")
+        parser.add_option("--max-age", dest="max_age", type="int",
+                          metavar="SECONDS",
+                          help="use cached status results if they are not"
+                               " older (status only)")
+        parser.add_option("--deadline", dest="deadline", type="int",
+                          metavar="SECONDS",
+                          help="give up nodes which did not answer after"
+                               " this delay (status only)")
+        parser.add_option("--trace", dest="trace", metavar="FILE",
+                          help="write a timing trace of actions to FILE"
+                               " (Chrome trace format)")
+        # Ordered component groups of a remote plan, see FileSystem._prepare()
+        parser.add_option("--stages", dest="stages", help=SUPPRESS_HELP)
         # Parse command line
-        (options, args) = parser.parse_args()
+        (options, args) = parser.parse_args(args)
 
         # A command is mandatory
         if not args:
@@ -211,6 +244,14 @@ class Controller(object):
             parser.error("-O and -V option are mutually exclusive")
         if not options.view:
             options.view = 'fs'
+        if options.watch_interval < 1:
+            parser.error("--watch-interval should be at least 1 second")
+        if options.max_age is not None and options.max_age < 0:
+            parser.error("--max-age should not be negative")
+        if options.deadline is not None and options.deadline < 1:
+            parser.error("--deadline should be at least 1 second")
+        if options.deadline is not None and options.watch:
+            parser.error("--deadline and --watch are mutually exclusive")
 
         # Enable clustershell debugging too in debug mode
         if options.debug:
@@ -229,6 +270,9 @@ class Controller(object):
         elif cmdname == 'version':
             parser.print_version()
             parser.exit()
+        # Internal command, see run_agent()
+        elif cmdname == 'agent' and options.remote:
+            pass
         elif cmdname not in COMMAND_LIST:
             parser.error('Command "%s" not found' % cmdname)
         # XXX: Special handling for 'show' commands
@@ -237,20 +281,39 @@ class Controller(object):
                 parser.error('Too many arguments "%s"' % ' '.join(args[1:]))
         elif args:
             parser.error('Too many arguments "%s"' % ' '.join(args))
+        elif options.watch and cmdname != 'status':
+            parser.error('--watch is only supported by "status"')
+        elif options.max_age is not None and cmdname != 'status':
+            parser.error('--max-age is only supported by "status"')
+        elif options.deadline is not None and cmdname != 'status':
+            parser.error('--deadline is only supported by "status"')
 
         return (options, args, cmdname)
 
 
-    def run_command(self):
+    def run_command(self, args=None):
         # sys.exit() if error on command line (optparse behaviour)
         # rc=2
 
         rc = RC_RUNTIME_ERROR
+        command = None
+
+        (options, args, cmdname) = self.handle_options(args)
+
+        if cmdname == 'agent':
+            return self.run_agent()
 
-        (options, args, cmdname) = self.handle_options()
+        if options.trace and not options.remote:
+            action_trace().enable()
 
         try:
 
+            # Route remote commands through gateways, if configured. Remote
+            # calls only run local commands.
+            topology = Globals().get('topology_file')
+            if topology and not options.remote:
+                task_self().load_topology(topology)
+
             # Execute and filter rc
             command = COMMAND_LIST[cmdname](options, args)
             rc = command.filter_rc(command.execute())
@@ -269,6 +332,8 @@ class Controller(object):
             self.print_error("Configuration - %s" % error)
         except ModelFileValueError as error:
             self.print_error(error)
+        except TopologyError as error:
+            self.print_error("Configuration - %s" % error)
 
         # File system exceptions
         except FSRemoteError as error:
@@ -282,6 +347,20 @@ class Controller(object):
             print("Exiting.", file=sys.stderr)
             rc = 0
 
+        # Send events which could still be pending when called remotely
+        eventhandler = getattr(command, 'eventhandler', None)
+        if isinstance(eventhandler, RemoteCallEventHandler):
+            eventhandler.flush()
+
+        if action_trace().enabled:
+            try:
+                action_trace().save(options.trace)
+                summary = action_trace().summary()
+                if summary:
+                    print(summary)
+            except IOError as error:
+                self.print_error("Cannot write trace: %s" % error)
+
         # Avoid BrokenPipe error if stdout is closed before we exit
         try:
             sys.stdout.flush()
@@ -290,6 +369,46 @@ class Controller(object):
 
         return rc
 
+    def run_agent(self):
+        """
+        Run requests read on stdin, sent by FSProxyAction from an admin node,
+        until stdin is closed.
+
+        Each request is a command line. Its output is ended by a message with
+        its return code.
+        """
+        fanout = task_self().info('fanout')
+        # Plan stage answers could follow a request, they are read apart.
+        for line in iter(AdminInput.instance().readline, ''):
+            # Each request is run as a new command: forget what the previous
+            # one has left, even if it failed.
+            task_self().set_info('fanout', fanout)
+            CommonAction.reset_all()
+            MountdataProbe.reset_all()
+            ResourceLimits.reset_all()
+            FSProxyAction.reset_all()
+            proc_snapshot().invalidate()
+            reset_servers()
+
+            try:
+                args = shine_msg_unpack(line.rstrip('\n'))['argv']
+            except (ProxyActionUnpackError, ProxyActionUnpickleError,
+                    KeyError, TypeError) as error:
+                self.print_error("Bad agent request: %s" % error)
+                rc = RC_RUNTIME_ERROR
+            else:
+                # Always in remote mode, so the output could be parsed.
+                try:
+                    rc = self.run_command(['-R'] + args)
+                except SystemExit as error:
+                    # Command line errors
+                    rc = error.code
+                    if not isinstance(rc, int):
+                        rc = RC_RUNTIME_ERROR
+            sys.stdout.write(shine_msg_pack_end(rc))
+            sys.stdout.flush()
+        return 0
+
 def run():
     Controller().run_command()
 
@@ -64,6 +64,11 @@ def convert_comparison(fsconf, fs, actions):
 
 
 _SERVERS = {}
+
+def reset_servers():
+    """Forget servers, and their event handler, of a previous command."""
+    _SERVERS.clear()
+
 def _get_server(nodename, fs, fs_conf, handler, nodes=None, excluded=None):
     """Instantiate Server and cache them in _SERVERS"""
     if nodename not in _SERVERS:
@@ -93,6 +98,7 @@ def instantiate_lustrefs(fs_conf, target_types=None, nodes=None, excluded=None,
 
     # Create file system instance
     fs = FileSystem(fs_conf.get_fs_name(), event_handler)
+    fs.action_limits = fs_conf.get_action_limits()
 
     # Create attached file system targets...
     for cf_target in fs_conf.iter_targets():
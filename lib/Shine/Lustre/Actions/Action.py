@@ -28,14 +28,18 @@ An action must inherits from one of the base Action class.
 import os
 import time
 import re
+import random
 from string import Template
+from collections import deque
 
 from ClusterShell.Event import EventHandler
 from ClusterShell.Task import task_self
 
-from Shine.Configuration.Globals import Globals
+from Shine.Configuration.Globals import Globals, ActionLimit, ActionRetry
 
 from Shine.Lustre import ComponentError
+from Shine.Lustre.ProcFS import proc_snapshot
+from Shine.Lustre.Trace import action_trace
 
 # XXX: This is not really good to import stuff from CLI in Actions. This part
 # of Display should be generalized in some kind of Utility module and imported
@@ -49,6 +53,60 @@ ACT_OK = 2
 ACT_ERROR = 3
 
 
+def action_timeout(name):
+    """
+    Return the timeout in seconds of `name' action commands, from its
+    <name>_timeout setting, or None if they have none.
+    """
+    key = '%s_timeout' % name
+    if Globals().is_element(key):
+        return Globals().get(key) or None
+    return None
+
+
+class RetryPolicy(object):
+    """
+    How failed commands of an action are run again, from an action_retry
+    setting. See ActionRetry.
+    """
+
+    def __init__(self, attempts, delay, retcodes=None, pattern=None):
+        self.attempts = attempts
+        self.delay = delay
+        self.retcodes = retcodes
+        self.pattern = pattern
+
+    def retryable(self, retcode, output):
+        """Return True if a failure with `retcode' and `output' is transient."""
+        if self.retcodes is not None and retcode not in self.retcodes:
+            return False
+        return self.pattern is None or bool(self.pattern.search(output or ''))
+
+    def backoff(self, attempt):
+        """
+        Return the delay before running `attempt' (2 for the first retry),
+        doubled at each attempt, with jitter so that commands which failed
+        together are not run again all at the same time.
+        """
+        return self.delay * 2 ** (attempt - 2) * random.uniform(0.5, 1)
+
+
+def retry_policy(name):
+    """
+    Return the RetryPolicy of `name' action commands, from the first
+    action_retry setting naming it, or from the first one for all actions.
+    Return None if they are never retried.
+    """
+    default = None
+    for value in Globals().get('action_retry', []):
+        actions, attempts, delay, retcodes, pattern = ActionRetry.split(value)
+        if actions is not None and name in actions:
+            return RetryPolicy(attempts, delay, retcodes, pattern)
+        elif actions is None and default is None:
+            default = RetryPolicy(attempts, delay, retcodes, pattern)
+    return default
+
+
 class Result(object):
     """
     Data associated to an Event.
@@ -73,6 +131,26 @@ class ErrorResult(Result):
         else:
             return Result.__str__(self)
 
+class RetryResult(Result):
+    """
+    Result for a 'progress' event, sent when a command failed with a
+    transient error and is about to be run again.
+    """
+
+    def __init__(self, message=None, attempt=None, attempts=None, delay=None,
+                 retcode=None):
+        Result.__init__(self, message, retcode=retcode)
+        self.attempt = attempt
+        self.attempts = attempts
+        self.delay = delay
+
+    def __str__(self):
+        text = "attempt %s/%s in %.1fs" % (self.attempt, self.attempts,
+                                           self.delay)
+        if self.message:
+            text += ": %s" % str(self.message).strip().splitlines()[-1]
+        return text
+
 class ActionInfo(object):
     """Information describing an action event."""
 
@@ -104,6 +182,10 @@ class Action(EventHandler):
         """Return a ActionInfo describing this action."""
         return ActionInfo(self, None)
 
+    def trace_name(self):
+        """Return the name of this action in timing traces."""
+        return str(self.info())
+
     def ev_start(self, worker):
         """Store the start time."""
         self.start = time.time()
@@ -111,11 +193,54 @@ class Action(EventHandler):
     def ev_close(self, worker):
         """Compute the action whole duration."""
         self.duration = time.time() - self.start
+        # The command could have changed node state, forget what was read.
+        proc_snapshot().invalidate()
 
     def launch(self):
         """Run the action."""
         raise NotImplementedError("Derived classes must implement.")
 
+class DepCounter(object):
+    """
+    Number of actions of a dependency list which are not done yet, and of
+    those which are on error.
+
+    Counters are updated by the actions themselves when their status changes,
+    so checking a dependency list does not need to scan it.
+    """
+
+    def __init__(self):
+        self.left = 0
+        self.errors = 0
+        # Waiting actions of the list have been launched
+        self.pulled = False
+
+    def update(self, old, new):
+        """An action of the list went from `old' status to `new' one."""
+        for status, incr in ((old, -1), (new, 1)):
+            if status in (ACT_WAITING, ACT_RUNNING):
+                self.left += incr
+            elif status == ACT_ERROR:
+                self.errors += incr
+
+    def add(self, status):
+        """An action with `status' is added to the list."""
+        self.update(None, status)
+        if status == ACT_WAITING:
+            self.pulled = False
+
+
+class RetryTimer(EventHandler):
+    """Run an action command again, once the retry delay is over."""
+
+    def __init__(self, action):
+        EventHandler.__init__(self)
+        self.action = action
+
+    def ev_timer(self, timer):
+        self.action._retry()
+
+
 class CommonAction(Action):
     """
     Abstract class representing an Action with graph dependency features.
@@ -124,11 +249,20 @@ class CommonAction(Action):
     See GroupAction to group them.
     """
 
+    # Actions to launch, see _run_ready(). An action which ends only queues
+    # its followers: this costs no scan of their other dependencies, and
+    # the call stack does not grow with the graph depth.
+    _ready = deque()
+    _launching = False
+
     def __init__(self):
         Action.__init__(self)
         self.deps = set()
         self.followers = set()
         self._status = ACT_WAITING
+        self._deps_count = DepCounter()
+        # Number of times the command was run again, see _retry_later()
+        self.retries = 0
 
     def depends_on(self, other):
         """
@@ -136,7 +270,9 @@ class CommonAction(Action):
 
         This action should not be launched before `other' is run with success.
         """
-        self.deps.add(other)
+        if other not in self.deps:
+            self.deps.add(other)
+            self._deps_count.add(other.status())
         other.followers.add(self)
 
     def status(self):
@@ -149,15 +285,55 @@ class CommonAction(Action):
 
         If this is a final state, try to launch actions depending on it.
         """
-        self._status = status
+        old, self._status = self._status, status
+        if old == status:
+            return
+        if action_trace().enabled:
+            if status == ACT_RUNNING:
+                action_trace().begin(self)
+            elif status in (ACT_OK, ACT_ERROR):
+                action_trace().end(self, status == ACT_OK)
+        for action in self.followers:
+            action._dep_changed(self, old, status)
+
         # If it is a final states, propagate in the graph
         if self._status in (ACT_OK, ACT_ERROR):
-            for action in self.followers:
-                action.launch()
-
-    def _graph_ok(self, actions):
+            CommonAction._ready.extend(self.followers)
+            CommonAction._run_ready()
+
+    def _dep_changed(self, action, old, new):
+        """Status of `action', which I follow, went from `old' to `new'."""
+        if action in self.deps:
+            self._deps_count.update(old, new)
+
+    @staticmethod
+    def reset_all():
+        """Forget actions queued by a previous command, see run_agent()."""
+        CommonAction._ready.clear()
+        CommonAction._launching = False
+
+    @staticmethod
+    def _run_ready():
+        """
+        Launch queued actions, unless they are already being launched by a
+        caller.
         """
-        Return True if dependencies in action list are OK.
+        if CommonAction._launching:
+            return
+        CommonAction._launching = True
+        try:
+            while CommonAction._ready:
+                CommonAction._ready.popleft().launch()
+        except:
+            CommonAction._ready.clear()
+            raise
+        finally:
+            CommonAction._launching = False
+
+    def _graph_ok(self, actions, count):
+        """
+        Return True if dependencies in action list are OK. `count' is the
+        DepCounter of this list.
 
         Return False if
          - the group is not in WAITING state.
@@ -170,21 +346,19 @@ class CommonAction(Action):
         if self.status() != ACT_WAITING:
             return False
 
-        # If some deps are not yet run, launch them!
-        waiting = [dep for dep in actions if dep.status() == ACT_WAITING]
-        if waiting:
-            for dep in waiting:
-                dep.launch()
-            return False
+        # If some deps are not yet run, launch them! Only once: I will be
+        # launched again when they end.
+        if not count.pulled:
+            count.pulled = True
+            CommonAction._ready.extend(dep for dep in actions
+                                       if dep.status() == ACT_WAITING)
 
         # If all my deps are not in final state, wait
-        running = [dep for dep in actions if dep.status() == ACT_RUNNING]
-        if running:
+        if count.left > 0:
             return False
 
         # If some deps are in error, I'm too
-        error = [dep for dep in actions if dep.status() == ACT_ERROR]
-        if error:
+        if count.errors > 0:
             self.set_status(ACT_ERROR)
             return False
 
@@ -208,14 +382,45 @@ class CommonAction(Action):
         else:
             self.set_status(ACT_ERROR)
 
+    def retry_policy(self):
+        """Return the RetryPolicy of this action, or None."""
+        return retry_policy(self.NAME)
+
+    def _retry_later(self, retcode, output):
+        """
+        If a failure with `retcode' and `output' is transient, schedule
+        _retry() according to the action retry policy and return a
+        RetryResult describing it. Return None otherwise.
+        """
+        policy = self.retry_policy()
+        if policy is None or self.retries + 1 >= policy.attempts or \
+           not policy.retryable(retcode, output):
+            return None
+        self.retries += 1
+        delay = policy.backoff(self.retries + 1)
+        self.task.timer(delay, handler=RetryTimer(self))
+        return RetryResult(output, self.retries + 1, policy.attempts, delay,
+                           retcode)
+
+    def _retry(self):
+        """Run the failed command again, see _retry_later()."""
+        raise NotImplementedError
+
+    def timed_comps(self):
+        """
+        Return (action name, components) whose action durations this
+        action lasts, see DurationHistory.
+        """
+        return self.NAME, ()
+
     def launch(self):
         """Check dependencies and run the action."""
 
-        if not self._graph_ok(self.deps):
-            return
+        if self._graph_ok(self.deps, self._deps_count):
+            self.set_status(ACT_RUNNING)
+            self._launch()
 
-        self.set_status(ACT_RUNNING)
-        self._launch()
+        CommonAction._run_ready()
 
     def _launch(self):
         """
@@ -234,7 +439,10 @@ class ActionGroup(CommonAction):
 
     def __init__(self):
         CommonAction.__init__(self)
-        self._members = list()  # Ideally this should be an OrderedSet
+        # Ordered members, and the same as a set
+        self._members = list()
+        self._memberset = set()
+        self._members_count = DepCounter()
 
     def __len__(self):
         """Number or group members."""
@@ -250,11 +458,19 @@ class ActionGroup(CommonAction):
 
     def add(self, action):
         """Add an action to this group."""
-        if action not in self._members:  # _members should behave like a set
+        if action not in self._memberset:
             self._members.append(action)
+            self._memberset.add(action)
+            self._members_count.add(action.status())
             # Add a half-dependency
             action.followers.add(self)
 
+    def _dep_changed(self, action, old, new):
+        """Status of a member or a dependency has changed."""
+        if action in self._memberset:
+            self._members_count.update(old, new)
+        CommonAction._dep_changed(self, action, old, new)
+
     def sequential(self):
         """Create a dependency between each group element.
 
@@ -269,13 +485,131 @@ class ActionGroup(CommonAction):
         # _graph_ok() wants us WAITING but launch() set us RUNNING
         self.set_status(ACT_WAITING)
 
-        if not self._graph_ok(self._members):
+        if not self._graph_ok(self._members, self._members_count):
             return
 
         # So, all members are OK
         self.set_status(ACT_OK)
 
 
+class MountdataProbe(EventHandler):
+    """
+    Read the mountdata of an action component, running a separate command.
+
+    Probes do not block the other actions. At most mountdata_fanout of them
+    run at the same time, the others are queued.
+    """
+
+    _pending = deque()
+    _running = 0
+
+    def __init__(self, action, command):
+        EventHandler.__init__(self)
+        self.action = action
+        self.command = command
+
+    def schedule(self):
+        """Run the probe as soon as the concurrency limit allows it."""
+        MountdataProbe._pending.append(self)
+        MountdataProbe._start_pending()
+
+    @classmethod
+    def reset_all(cls):
+        """Forget probes of a previous command, see run_agent()."""
+        cls._pending.clear()
+        cls._running = 0
+
+    @classmethod
+    def _start_pending(cls):
+        """Start queued probes, up to the concurrency limit."""
+        limit = Globals().get('mountdata_fanout')
+        while cls._pending and (limit == 0 or cls._running < limit):
+            probe = cls._pending.popleft()
+            cls._running += 1
+            probe.action.task.shell(probe.command, handler=probe, stderr=True)
+
+    def ev_close(self, worker):
+        """Give the command output to the action and start the next probe."""
+        MountdataProbe._running -= 1
+        MountdataProbe._start_pending()
+        output = worker.read() or b''
+        if not isinstance(output, str):
+            output = output.decode()
+        self.action.mountdata_done(output, worker.retcode())
+
+
+class ResourceLimits(object):
+    """
+    Commands of actions which use limited resources, see
+    FSAction.resources().
+
+    An action command is run only when all its resources have a free slot,
+    it is queued otherwise. Other actions are not slowed down, unlike with a
+    lower task fanout.
+    """
+
+    _pending = deque()
+    _used = {}
+
+    @classmethod
+    def reset_all(cls):
+        """Forget commands of a previous command, see run_agent()."""
+        cls._pending.clear()
+        cls._used.clear()
+
+    @classmethod
+    def _available(cls, resources):
+        """Return True if all `resources' have a free slot."""
+        for name, limit in resources.items():
+            if cls._used.get(name, 0) >= limit:
+                return False
+        return True
+
+    @classmethod
+    def _acquire(cls, action, resources):
+        """Take a slot of each of `resources' for `action' and run it."""
+        for name in resources:
+            cls._used[name] = cls._used.get(name, 0) + 1
+        action.held_resources = resources
+        action.run_command()
+
+    @classmethod
+    def run(cls, action):
+        """Run `action' command as soon as its resources allow it."""
+        resources = action.resources()
+        if cls._available(resources):
+            cls._acquire(action, resources)
+        else:
+            cls._pending.append((action, resources))
+
+    @classmethod
+    def release(cls, action):
+        """`action' command ended, run queued commands it was blocking."""
+        for name in action.held_resources:
+            cls._used[name] -= 1
+            if not cls._used[name]:
+                del cls._used[name]
+        action.held_resources = {}
+        cls._start_pending()
+
+    @classmethod
+    def _start_pending(cls):
+        """
+        Run queued commands whose resources are free, in queue order.
+
+        A blocked command does not delay the ones queued after it, if they
+        use other resources.
+        """
+        blocked = deque()
+        while cls._pending:
+            action, resources = cls._pending.popleft()
+            if cls._available(resources):
+                cls._acquire(action, resources)
+            else:
+                blocked.append((action, resources))
+        cls._pending.extend(blocked)
+
+
 class FSAction(CommonAction):
     """
     Astract Shine action class for FileSystem actions.
@@ -286,10 +620,20 @@ class FSAction(CommonAction):
 
     NEEDED_MODULES = []
 
+    # Only one such command at a time per server on loop devices, see
+    # resources() (LBUG #18624).
+    LOOP_EXCLUSIVE = False
+
     def __init__(self, comp, **kwargs):
         CommonAction.__init__(self)
         self.comp = comp
 
+        # Resource slots used by the running command, see ResourceLimits
+        self.held_resources = {}
+        self._cmdline = None
+
+        self.timeout = action_timeout(self.NAME)
+
         # Command should have a separate stderr?
         self.stderr = False
 
@@ -304,6 +648,9 @@ class FSAction(CommonAction):
         else:
             self.check_mountdata = self.__class__.CHECK_MOUNTDATA
 
+        # 'always' reads mountdata from devices, 'auto' could use the cache.
+        self.refresh_mountdata = (kwargs.get('mountdata') == 'always')
+
     def info(self):
         """Return a ActionInfo describing this action."""
         desc = '%s of %s' % (self.NAME, self.comp.longtext())
@@ -356,6 +703,43 @@ class FSAction(CommonAction):
         """
         return None
 
+    def resources(self):
+        """
+        Return {resource: max} of the limited resources used by the action
+        command: action_limit values of the model and shine.conf which apply
+        to it.
+        """
+        resources = {}
+        for value in self.comp.fs.action_limits + \
+                     Globals().get('action_limit', []):
+            actions, resource, limit = ActionLimit.split(value)
+            if actions is not None and self.NAME not in actions:
+                continue
+            if resource == 'server':
+                key = str(self.comp.server.hostname)
+            elif resource == 'action':
+                key = self.NAME
+            else:
+                key = getattr(self.comp, resource, None)
+            if key is not None:
+                name = (','.join(sorted(actions or '*')), resource, key)
+                resources[name] = min(limit, resources.get(name, limit))
+
+        if self.LOOP_EXCLUSIVE and not getattr(self.comp, 'dev_isblk', True):
+            resources[('loop', 'server', str(self.comp.server.hostname))] = 1
+        return resources
+
+    def run_command(self):
+        """Schedule the command line to be run by self.task."""
+        self.task.shell(self._cmdline, handler=self, stderr=self.stderr,
+                        timeout=self.timeout)
+
+    def set_status(self, status):
+        """Update action status, freeing its resource slots once ended."""
+        if status in (ACT_OK, ACT_ERROR) and self.held_resources:
+            ResourceLimits.release(self)
+        CommonAction.set_status(self, status)
+
     def _shell(self):
         """Create a command line and schedule it to be run by self.task"""
 
@@ -376,29 +760,58 @@ class FSAction(CommonAction):
             self.comp.action_event(self, 'done')
             self.set_status(ACT_OK)
         else:
-            self.task.shell(cmdline, handler=self, stderr=self.stderr)
+            self._cmdline = cmdline
+            ResourceLimits.run(self)
 
     def _launch(self):
         """
         Run the command to process the action.
 
         It checks the command could be really be run and raises events.
+        If component mountdata should be read by a separate command, this
+        command is run asynchronously before going on.
         """
         self.comp.action_event(self, 'start')
         try:
-            self.comp.full_check(mountdata=self.check_mountdata)
+            probe = self.check_mountdata and self.comp.mountdata_command()
+            self.comp.full_check(mountdata=self.check_mountdata and not probe)
+
+            if probe and not self.refresh_mountdata and \
+               self.comp.mountdata_cached():
+                probe = None
+
+            # Reading them directly is faster than any command.
+            if probe and self.comp.mountdata_read():
+                probe = None
 
-            result = self._already_done()
-            if not result:
-                self._shell()
+            if probe:
+                MountdataProbe(self, probe).schedule()
             else:
-                self.comp.action_event(self, 'done', result)
-                self.set_status(ACT_OK)
+                self._launch_checked()
 
         except ComponentError as error:
             self.comp.action_event(self, 'failed', Result(str(error)))
             self.set_status(ACT_ERROR)
 
+    def mountdata_done(self, output, retcode):
+        """Component mountdata were read, go on if they are fine."""
+        try:
+            self.comp.mountdata_result(output, retcode)
+            self._launch_checked()
+
+        except ComponentError as error:
+            self.comp.action_event(self, 'failed', Result(str(error)))
+            self.set_status(ACT_ERROR)
+
+    def _launch_checked(self):
+        """Run the action command, unless its work is already done."""
+        result = self._already_done()
+        if not result:
+            self._shell()
+        else:
+            self.comp.action_event(self, 'done', result)
+            self.set_status(ACT_OK)
+
     def ev_close(self, worker):
         """
         Check process termination status and generate appropriate events.
@@ -420,10 +833,26 @@ class FSAction(CommonAction):
 
         # Action failed
         else:
+            output = worker.read()
+            if self.stderr and worker.error():
+                output = '\n'.join(filter(None, (output, worker.error())))
+            retry = self._retry_later(worker.retcode(), output)
+            if retry is not None:
+                if self.held_resources:
+                    ResourceLimits.release(self)
+                self.comp.action_event(self, 'progress', retry)
+                return
             result = ErrorResult(worker.read(), self.duration, worker.retcode())
             self.comp.action_event(self, 'failed', result)
             self.set_status(ACT_ERROR)
 
+    def _retry(self):
+        """Run the command again, as soon as its resources allow it."""
+        ResourceLimits.run(self)
+
+    def timed_comps(self):
+        return self.NAME, [self.comp]
+
     def needed_modules(self):
         """
         Some modules may need to be loaded before this action is performed.
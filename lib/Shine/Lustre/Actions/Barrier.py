@@ -0,0 +1,259 @@
+# Barrier.py -- Synchronize remote plans with the admin node
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Actions used when each server receives its whole plan in one request.
+
+A plan is made of stages, the component groups of this server. On the admin
+node, a PlanStage stands for each of them in the action graph: it is run
+when the components it needs, on any node, are ready. If the remote stage
+waits for it, it then sends an answer to the remote node, where a
+StageBarrier was waiting for it, without blocking the other stages. Once
+done, the remote StageGroup sends a 'stage' event which ends the PlanStage.
+"""
+
+import os
+import sys
+import itertools
+from collections import deque
+
+from ClusterShell.Event import EventHandler
+from ClusterShell.Task import task_self
+from ClusterShell.Worker.EngineClient import EngineClientEOF
+from ClusterShell.Worker.Worker import StreamWorker, StreamClient
+
+from Shine.Lustre.Actions.Action import CommonAction, ActionGroup, \
+                                        ACT_RUNNING, ACT_OK, ACT_ERROR
+from Shine.Lustre.Actions.Proxy import shine_msg_unpack, \
+                                       ProxyActionUnpackError, \
+                                       ProxyActionUnpickleError
+
+
+class _AdminClient(StreamClient):
+    """Give raw data to AdminInput, which splits the lines itself."""
+
+    def _handle_read(self, sname):
+        try:
+            data = self._read(sname)
+        except EngineClientEOF:
+            self.worker.eh.feed(b'')
+            raise
+        self.worker.eh.feed(data)
+
+    def _flush_read(self, sname):
+        """Incomplete lines are kept by AdminInput."""
+
+
+class AdminInput(EventHandler):
+    """
+    Lines sent by the admin node on the standard input of a remote shine.
+
+    Barrier answers are given to the StageBarrier waiting for them, or kept
+    until it is launched. Other lines are requests, see readline(). Standard
+    input is only read by the run loop while some barriers are waiting, so
+    the other actions are not blocked.
+    """
+
+    _instance = None
+
+    def __init__(self, stream):
+        EventHandler.__init__(self)
+        self.stream = stream
+        # Raw input, only complete lines are decoded.
+        self._buf = b''
+        self._lines = deque()
+        # Answers by stage index, and barriers waiting for one.
+        self._answers = {}
+        self._waiting = {}
+        self._worker = None
+        self.eof = False
+
+    @classmethod
+    def instance(cls):
+        """Return the reader of the current standard input."""
+        if cls._instance is None or cls._instance.stream is not sys.stdin:
+            cls._instance = cls(sys.stdin)
+        return cls._instance
+
+    def feed(self, data):
+        """Handle `data' bytes read on the input, an empty string at EOF."""
+        if not data:
+            self.eof = True
+            for barrier in list(self._waiting.values()):
+                self._answer(barrier, False)
+            return
+
+        self._buf += data
+        while b'\n' in self._buf:
+            line, self._buf = self._buf.split(b'\n', 1)
+            if not isinstance(line, str):
+                line = line.decode()
+            try:
+                msg = shine_msg_unpack(line)
+            except (ProxyActionUnpackError, ProxyActionUnpickleError):
+                msg = None
+            if isinstance(msg, dict) and msg.get('evtype') == 'barrier':
+                if msg.get('index') in self._waiting:
+                    self._answer(self._waiting[msg['index']], msg.get('go'))
+                else:
+                    self._answers[msg.get('index')] = msg.get('go')
+            else:
+                self._lines.append(line + '\n')
+
+    def readline(self):
+        """Return the next request line, blocking, or '' at EOF."""
+        while not self._lines and not self.eof:
+            self.feed(os.read(self.stream.fileno(), 4096))
+        if self._lines:
+            return self._lines.popleft()
+        return ''
+
+    def wait(self, barrier):
+        """Give `barrier' its answer, as soon as it is received."""
+        if barrier.index in self._answers:
+            barrier.answer(self._answers.pop(barrier.index))
+        elif self.eof:
+            barrier.answer(False)
+        else:
+            self._waiting[barrier.index] = barrier
+            if self._worker is None:
+                self._worker = StreamWorker(handler=self,
+                                            client_class=_AdminClient)
+                self._worker.set_reader('admin', self.stream.fileno(),
+                                        closefd=False)
+                task_self().schedule(self._worker)
+
+    def _answer(self, barrier, go):
+        """Release `barrier', and stop reading when nobody else waits."""
+        del self._waiting[barrier.index]
+        if not self._waiting and self._worker is not None:
+            worker, self._worker = self._worker, None
+            if not self.eof:
+                worker.abort()
+        barrier.answer(go)
+
+    def ev_close(self, worker):
+        """Input was closed while barriers were waiting."""
+        # Not aborted by _answer()
+        if self._worker is not None:
+            self._worker = None
+            if not self.eof:
+                self.feed(b'')
+
+
+class StageBarrier(CommonAction):
+    """
+    Remote side: wait for the admin node to start stage `index'.
+    """
+
+    NAME = 'barrier'
+
+    def __init__(self, index, admin=None):
+        CommonAction.__init__(self)
+        self.index = index
+        self._admin = admin
+
+    def _launch(self):
+        (self._admin or AdminInput.instance()).wait(self)
+
+    def answer(self, go):
+        """The admin node allows the stage to start, or aborts it."""
+        if go:
+            self.set_status(ACT_OK)
+        else:
+            self.set_status(ACT_ERROR)
+
+
+class StageGroup(ActionGroup):
+    """
+    Remote side: actions of stage `index'. The admin node is told when they
+    are done.
+    """
+
+    def __init__(self, fs, index):
+        ActionGroup.__init__(self)
+        self.fs = fs
+        self.index = index
+
+    def set_status(self, status):
+        if status in (ACT_OK, ACT_ERROR) and status != self.status():
+            self.fs.local_event('stage', index=self.index,
+                                ok=(status == ACT_OK))
+        ActionGroup.set_status(self, status)
+
+
+class PlanStage(CommonAction):
+    """
+    Admin side: stage of the plan run by `proxy', with components `comps'.
+
+    It is launched when the components it needs are ready. If the remote
+    stage waits for it (`wait'), the remote node is then told to start it.
+    If they failed, the remote stage is aborted.
+    """
+
+    NAME = 'stage'
+
+    # Unique indexes, several plans could be sent to the same agent.
+    _indexes = itertools.count()
+
+    def __init__(self, proxy, comps, wait):
+        CommonAction.__init__(self)
+        self.index = next(PlanStage._indexes)
+        self.proxy = proxy
+        self.comps = comps
+        self.wait = wait
+        self._answered = False
+        self._result = None
+        proxy.stages[self.index] = self
+
+    def __str__(self):
+        """Stage description for the remote command, see _prepare()."""
+        return "%s%d:%s" % ('+' if self.wait else '', self.index,
+                            self.comps.labels())
+
+    def trace_name(self):
+        return "stage %d on %s" % (self.index, self.proxy.nodes)
+
+    def timed_comps(self):
+        """Remote components of the stage run in parallel."""
+        return self.proxy.action, list(self.comps)
+
+    def _send(self, go):
+        """Answer the remote barrier, only once."""
+        if self.wait and not self._answered:
+            self._answered = True
+            self.proxy.answer(self.index, go)
+
+    def _launch(self):
+        self._send(True)
+        # Remote plan has already ended.
+        if self._result is not None:
+            self.set_status(self._result)
+
+    def done(self, ok):
+        """Remote node has run the stage, or will never run it."""
+        self._result = ACT_OK if ok else ACT_ERROR
+        if self.status() == ACT_RUNNING:
+            self.set_status(self._result)
+
+    def set_status(self, status):
+        if status == ACT_ERROR:
+            self._send(False)
+        CommonAction.set_status(self, status)
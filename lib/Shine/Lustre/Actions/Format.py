@@ -25,11 +25,10 @@ tunefs command as it is very close in behaviour.
 
 import re
 
-from ClusterShell.Task import task_self
-
 from Shine.Configuration.Globals import Globals
 
 from Shine.Lustre.Actions.Action import FSAction
+from Shine.Lustre.Mountdata import mountdata_cache
 
 import Shine.Lustre.Target
 
@@ -41,6 +40,9 @@ class CommonFormat(FSAction):
 
     NEEDED_MODULES = ['ldiskfs']
 
+    # LBUG #18624: "multiple mkfs.lustre on loop devices"
+    LOOP_EXCLUSIVE = True
+
     def __init__(self, target, **kwargs):
         FSAction.__init__(self, target, **kwargs)
 
@@ -73,13 +75,13 @@ class CommonFormat(FSAction):
         """Raise an exception if the target is mounted."""
         self.comp.raise_if_started("Cannot %s" % self.NAME)
 
-        # LBUG #18624 : workaround for "multiple mkfs.lustre on loop devices"
-        if not self.comp.dev_isblk:
-            # configure one engine client max per task (sequential, bah.)
-            task_self().set_info("fanout", 1)
-
         return None
 
+    def ev_close(self, worker):
+        """Device content has changed, forget its cached mountdata."""
+        mountdata_cache().invalidate(self.comp.dev)
+        FSAction.ev_close(self, worker)
+
     def _prepare_cmd(self):
 
         command = []
@@ -244,3 +246,9 @@ class JournalFormat(FSAction):
     def _prepare_cmd(self):
         """Return target journal device format command line."""
         return [ "mke2fs -q -F -O journal_dev -b 4096 %s" % self.comp.dev ]
+
+    def ev_close(self, worker):
+        """Journal and its target have changed, forget cached mountdata."""
+        mountdata_cache().invalidate(self.comp.dev)
+        mountdata_cache().invalidate(self.comp.target.dev)
+        FSAction.ev_close(self, worker)
@@ -24,6 +24,8 @@ import os
 Action classes for Lustre module managements.
 """
 
+from ClusterShell.NodeSet import NodeSet
+
 from Shine.Configuration.Globals import Globals
 
 from Shine.Lustre import ServerError
@@ -132,31 +134,95 @@ class LoadModules(ServerAction):
     Load some lustre modules using modprobe.
 
     By default, it is 'lustre', use `modname' if you want to load another one.
+    `modname' could also be a list of modules, loaded by a single
+    'modprobe -a'. Modules already loaded are skipped.
     """
 
     NAME = 'load modules'
 
     def __init__(self, srv, modname='lustre', options=None, **kwargs):
         ServerAction.__init__(self, srv, **kwargs)
-        self._modname = modname
+        if not isinstance(modname, (list, tuple)):
+            modname = [modname]
+        self._modnames = list(modname)
         self._options = options
+        assert options is None or len(self._modnames) == 1
 
     def info(self):
         """Return a ActionInfo describing this action."""
-        return ActionInfo(self, self.server,
-                          "load module '%s'" % self._modname)
+        if len(self._modnames) == 1:
+            desc = "load module '%s'" % self._modnames[0]
+        else:
+            desc = "load modules '%s'" % ', '.join(self._modnames)
+        return ActionInfo(self, self.server, desc)
+
+    def _missing(self):
+        """Return the modules which are not loaded yet."""
+        return [modname for modname in self._modnames
+                if modname not in self.server.modules]
 
     def _already_done(self):
-        if self._modname in self.server.modules:
-            return Result("'%s' is already loaded" % self._modname)
+        if not self._missing():
+            return Result("'%s' is already loaded" %
+                          ', '.join(self._modnames))
 
     def _prepare_cmd(self):
-        command = ['modprobe %s' % self._modname]
+        missing = self._missing()
+        if len(missing) > 1:
+            return ['modprobe -a %s' % ' '.join(missing)]
+        command = ['modprobe %s' % missing[0]]
         if self._options is not None:
             command.append(' "%s"' % self._options)
         return command
 
 
+class PreloadModules(CommonAction):
+    """
+    Load kernel modules on remote servers, with a single 'modprobe -a' per
+    node.
+
+    This only saves time to the actions which need these modules: they
+    still load them if needed. So, failures are only logged and this
+    action always succeeds. It is not used with remote agents, which load
+    their modules in the same way, without another connection.
+    """
+
+    NAME = 'preload modules'
+
+    def __init__(self, nodes, fs, modnames, **kwargs):
+        CommonAction.__init__(self)
+        self.nodes = nodes
+        self.fs = fs
+        self.modnames = sorted(modnames)
+        self.dryrun = kwargs.get('dryrun', False)
+
+    def _launch(self):
+        """Run modprobe on all nodes."""
+        command = ['modprobe -a %s' % ' '.join(self.modnames)]
+        path = Globals().get('command_path')
+        if path:
+            command.insert(0, "export PATH=%s:${PATH};" % path)
+        cmdline = ' '.join(command)
+
+        self.fs.hdlr.log('detail', msg='[RUN] %s on %s' % (cmdline,
+                                                           self.nodes))
+        if self.dryrun:
+            self.set_status(ACT_OK)
+        else:
+            self.task.shell(cmdline, nodes=self.nodes, handler=self)
+
+    def ev_close(self, worker):
+        """Log nodes where modules could not be loaded."""
+        Action.ev_close(self, worker)
+
+        for retcode, nodes in worker.iter_retcodes():
+            if retcode != 0:
+                nodes = NodeSet.fromlist(nodes)
+                self.fs.hdlr.log('verbose', "%s: module preload failed "
+                                 "[rc=%d]" % (nodes, retcode))
+        self.set_status(ACT_OK)
+
+
 class UnloadModules(ServerAction):
     """
     Unload all lustre modules using 'lustre_rmmod'
@@ -22,17 +22,37 @@ from __future__ import print_function
 
 import os
 import sys
+import json
+import time
+import shlex
+import types
 import binascii, pickle
+try:
+    import cPickle
+    from cStringIO import StringIO as _PickleIO
+except ImportError:
+    cPickle = None
+    from io import BytesIO as _PickleIO
+from collections import deque, OrderedDict
 
+from ClusterShell.Engine.Engine import FANOUT_UNLIMITED
+from ClusterShell.Event import EventHandler
 from ClusterShell.MsgTree import MsgTree
 from ClusterShell.NodeSet import NodeSet
+from ClusterShell.Task import task_self
 
-from Shine.Lustre.Component import INPROGRESS, RUNTIME_ERROR
+from Shine.Configuration.Globals import Globals
+
+from Shine.Lustre.Component import INPROGRESS, RUNTIME_ERROR, ComponentGroup
 from Shine.Lustre.Actions.Action import Action, CommonAction, ActionInfo, \
-                                        ACT_OK, ACT_ERROR
+                                        Result, ACT_WAITING, ACT_RUNNING, \
+                                        ACT_OK, ACT_ERROR, action_timeout
+from Shine.Lustre.Actions.Fsck import FsckProgress
+from Shine.Lustre.Trace import action_trace
 
 # For V2 Compat
-from Shine.Lustre.Actions.Action import ErrorResult
+from Shine.Lustre.Actions.Action import ErrorResult, RetryResult, \
+                                        retry_policy
 
 #
 # SHINE PROXY PROTOCOL
@@ -40,6 +60,59 @@ from Shine.Lustre.Actions.Action import ErrorResult
 SHINE_MSG_MAGIC = "SHINE:"
 SHINE_MSG_VERSION = 3
 
+# Compact messages only carry the serializable fields of each component.
+SHINE_MSG_VERSION_COMPACT = 4
+
+# Set by the admin node to announce the highest message version it supports.
+# Older remote nodes ignore it and keep on sending v3 messages.
+SHINE_MSG_ENV = 'SHINE_MSG_VERSION'
+
+# Set by the admin node to ask remote nodes to group events. Its value is
+# "<events>:<milliseconds>": a batch is sent when it contains this number of
+# events or when its first event is older than this delay.
+SHINE_MSG_BATCH_ENV = 'SHINE_MSG_BATCH'
+
+# Last message sent by an agent for each request, followed by the command
+# return code. It is a valid compact message, built by shine_msg_pack_end().
+SHINE_AGENT_END = '%s%d:{"evtype":"end","rc":' % (SHINE_MSG_MAGIC,
+                                                  SHINE_MSG_VERSION_COMPACT)
+
+# Non-Shine objects which could be found in a v3 message.
+_PICKLE_GLOBALS = {'ClusterShell.NodeSet': ('NodeSet',),
+                   'ClusterShell.RangeSet': ('RangeSet',),
+                   '__builtin__': ('set', 'frozenset', 'object'),
+                   'builtins': ('set', 'frozenset', 'object'),
+                   'copy_reg': ('_reconstructor',),
+                   'copyreg': ('_reconstructor',)}
+
+# Shine classes and old-style classes.
+_CLASS_TYPES = (type, getattr(types, 'ClassType', type))
+
+# Result classes which could be rebuilt from a compact message.
+_RESULT_CLASSES = dict((cls.__name__, cls)
+                       for cls in (Result, ErrorResult, FsckProgress,
+                                   RetryResult))
+
+try:
+    unicode
+    def _native(data):
+        """
+        JSON decoder returns unicode strings, convert them back to str, in
+        lists and dicts too.
+        """
+        if isinstance(data, unicode):
+            return data.encode('utf-8')
+        elif isinstance(data, list):
+            return [_native(item) for item in data]
+        elif isinstance(data, dict):
+            return dict((_native(key), _native(value))
+                        for key, value in data.items())
+        return data
+except NameError:
+    def _native(data):
+        """Nothing to convert with Python 3."""
+        return data
+
 class ProxyActionUnpackError(Exception):
     """An error occured while trying to unpack a shine event message."""
 
@@ -52,11 +125,124 @@ def shine_msg_pack(**kwargs):
     return "%s%d:%s" % (SHINE_MSG_MAGIC, SHINE_MSG_VERSION,
                         binascii.b2a_base64(pickle.dumps(kwargs, -1)))
 
+def shine_msg_dumps_compact(**kwargs):
+    """
+    Return the JSON payload of a compact message.
+
+    Components and servers are replaced by their type, id and serializable
+    fields, Result objects by their class name and attributes. Everything
+    else should already be a plain type.
+    """
+    for key in ('info', 'result'):
+        if kwargs.get(key) is not None:
+            kwargs[key] = _COMPACT_ENCODERS[key](kwargs[key])
+    return json.dumps(kwargs, separators=(',', ':'))
+
+def shine_msg_pack_compact(**kwargs):
+    """Compact shine event serialization method."""
+    return "%s%d:%s\n" % (SHINE_MSG_MAGIC, SHINE_MSG_VERSION_COMPACT,
+                          shine_msg_dumps_compact(**kwargs))
+
+def shine_msg_pack_batch(payloads):
+    """
+    Group several compact payloads, from shine_msg_dumps_compact(), in a
+    single message line.
+    """
+    return "%s%d:[%s]\n" % (SHINE_MSG_MAGIC, SHINE_MSG_VERSION_COMPACT,
+                            ','.join(payloads))
+
+def shine_msg_pack_request(args):
+    """Agent request to run shine with the command line arguments `args'."""
+    return shine_msg_pack_compact(argv=args)
+
+def shine_msg_pack_end(retcode):
+    """Agent message ending a request."""
+    return "%s%d}\n" % (SHINE_AGENT_END, retcode)
+
+def shine_msg_pack_barrier(index, go):
+    """Admin answer to the plan stage `index': start it or abort it."""
+    return shine_msg_pack_compact(evtype='barrier', index=index, go=go)
+
+def _encode_elem(elem):
+    """Return a [type, id, fields] list describing a component or server."""
+    if elem is None:
+        return None
+    elif hasattr(elem, 'serial_fields'):
+        return [elem.TYPE, elem.uniqueid(), elem.serial_fields()]
+    else:
+        return ['server', str(elem.hostname), []]
+
+def _encode_info(info):
+    """Return a list describing an ActionInfo."""
+    return [info.actname, info.description, _encode_elem(info.elem)]
+
+def _encode_result(result):
+    """Return a [class name, attributes] list describing a Result."""
+    return [result.__class__.__name__, result.__dict__]
+
+_COMPACT_ENCODERS = {'info': _encode_info, 'result': _encode_result}
+
+
+class ProxyElem(object):
+    """
+    Remote component or server, as described in a compact message.
+
+    It only carries the element type, id and the values of the serializable
+    fields declared by the element class on the remote node.
+    """
+
+    def __init__(self, elemtype, uid, values):
+        self.TYPE = elemtype
+        self.uid = uid
+        self.values = values
+
+    def uniqueid(self):
+        """Return the element unique id, as computed by the remote node."""
+        return self.uid
+
+def _decode_info(data):
+    """Rebuild an ActionInfo from a compact message."""
+    actname, description, elem = data
+    info = ActionInfo.__new__(ActionInfo)
+    info.actname = actname
+    info.description = description
+    info.elem = None
+    if elem is not None:
+        info.elem = ProxyElem(*elem)
+    return info
+
+def _decode_result(data):
+    """Rebuild a Result from a compact message."""
+    clsname, attrs = data
+    result = Result.__new__(_RESULT_CLASSES.get(clsname, Result))
+    result.__dict__.update(attrs)
+    return result
+
+def shine_msg_unpack_compact(data):
+    """
+    Parse the content of a compact (v4) message.
+
+    Return a dict, or a list of dicts if this is a batch message.
+    """
+    msg = _native(json.loads(data))
+    if isinstance(msg, list):
+        return [_decode_msg(item) for item in msg]
+    return _decode_msg(msg)
+
+def _decode_msg(msg):
+    """Rebuild the objects of a compact message dict."""
+    if msg.get('info') is not None:
+        msg['info'] = _decode_info(msg['info'])
+    if msg.get('result') is not None:
+        msg['result'] = _decode_result(msg['result'])
+    return msg
+
 def shine_msg_unpack(msg):
     """
     Parse a raw string from a remote shine command.
 
-    Return a dict containing the information put by shine_msg_pack().
+    Return a dict containing the information put by shine_msg_pack(), or a
+    list of such dicts for a message built by shine_msg_pack_batch().
     """
     # check for any shine msg
     if not msg.startswith(SHINE_MSG_MAGIC):
@@ -70,15 +256,24 @@ def shine_msg_unpack(msg):
         raise ProxyActionUnpackError("Malformed Shine message: %s" % exp)
 
     if version == SHINE_MSG_VERSION:
+        _check_pickle_allowed()
         try:
             # unpack and unpickle object
-            return pickle.loads(binascii.a2b_base64(data))
+            return _pickle_loads(binascii.a2b_base64(data))
         except Exception as exp:
             msg = "Cannot unpickle message (check Shine and ClusterShell " \
                   "versions): %s" % exp
             raise ProxyActionUnpickleError(msg)
 
+    elif version == SHINE_MSG_VERSION_COMPACT:
+        try:
+            return shine_msg_unpack_compact(data)
+        except Exception as exp:
+            msg = "Cannot decode message (check Shine versions): %s" % exp
+            raise ProxyActionUnpickleError(msg)
+
     elif version == 2:
+        _check_pickle_allowed()
         try:
             return shine_msg_unpack_v2(data)
         except Exception as exp:
@@ -87,6 +282,42 @@ def shine_msg_unpack(msg):
     else:
         raise ProxyActionUnpackError("Shine message version mismatch")
 
+def _check_pickle_allowed():
+    """Raise an error if pickle messages are not accepted."""
+    if not Globals().get('msg_pickle'):
+        raise ProxyActionUnpickleError("Pickle message refused, remote node "
+                                       "runs an older Shine version (see "
+                                       "msg_pickle in shine.conf)")
+
+def _find_class(module, name):
+    """Return `name' from `module', only if allowed in messages."""
+    if name in _PICKLE_GLOBALS.get(module, ()):
+        __import__(module)
+        return getattr(sys.modules[module], name)
+    elif module.split('.')[0] == 'Shine':
+        __import__(module)
+        obj = getattr(sys.modules[module], name, None)
+        # Only classes, Shine functions could have side effects.
+        if isinstance(obj, _CLASS_TYPES):
+            return obj
+    raise pickle.UnpicklingError("%s.%s is not allowed" % (module, name))
+
+if cPickle is not None:
+    def _pickle_loads(data):
+        """Unpickle data, only rebuilding allowed classes."""
+        unpickler = cPickle.Unpickler(_PickleIO(data))
+        unpickler.find_global = _find_class
+        return unpickler.load()
+else:
+    class _RestrictedUnpickler(pickle.Unpickler):
+        """Unpickler only rebuilding allowed classes."""
+        def find_class(self, module, name):
+            return _find_class(module, name)
+
+    def _pickle_loads(data):
+        """Unpickle data, only rebuilding allowed classes."""
+        return _RestrictedUnpickler(_PickleIO(data)).load()
+
 def shine_msg_unpack_v2(msg):
     """
     Compatibility function to unpack old-style v2 messages.
@@ -98,7 +329,7 @@ def shine_msg_unpack_v2(msg):
     # SHINE:2:ev_starttarget_done:{node:, comp:, rc:, message:}
 
     event, msg = msg.split(':', 1)
-    data = pickle.loads(binascii.a2b_base64(msg))
+    data = _pickle_loads(binascii.a2b_base64(msg))
     dummy, actioncomp, data['status'] = event.split('_', 3)
     for name in ('router', 'client', 'target', 'journal'):
         if actioncomp.endswith(name):
@@ -120,12 +351,16 @@ class FSProxyAction(CommonAction):
 
     NAME = 'proxy'
 
+    # Proxy actions running remote commands, see abandon_all().
+    _running = set()
+
     def __init__(self, fs, action, nodes, debug, comps=None, **kwargs):
 
         CommonAction.__init__(self)
 
         self.progpath = os.path.abspath(sys.argv[0])
         self.fs = fs
+        self.fsnames = [fs.fs_name]
         self.action = action
         self.nodes = nodes
         self.debug = debug
@@ -134,25 +369,77 @@ class FSProxyAction(CommonAction):
 
         self.options = {}
         for optname in ('addopts', 'failover', 'mountdata', 'fanout',
-                        'dryrun'):
+                        'dryrun', 'watch'):
             self.options[optname] = kwargs.get(optname)
 
+        # Plan mode: PlanStage of each stage, by index, and their answers
+        # waiting for the request to be sent, see answer().
+        self.stages = OrderedDict()
+        self._answers = []
+        self._worker = None
+
         self._outputs = MsgTree()
         self._errpickle = MsgTree()
         self._silentnodes = NodeSet() # Error nodes without output
 
+        # Nodes still running the command. Nodes by return code.
+        self._pending = NodeSet()
+        self._retcodes = {}
+
+        # Watch mode: nodes which have sent their initial status.
+        self._watching = NodeSet()
+
+        # Remote commands time out with the action commands they run, a
+        # watching one never ends.
+        self.timeout = None
+        if not self.options['watch']:
+            self.timeout = action_timeout(action)
+        self._timedout = NodeSet()
+        self._timer = None
+
+        # Nodes where the command is run again, see _retry_nodes().
+        self._retrying = NodeSet()
+
+        # Nodes given up by abandon(), their components are unreachable.
+        self._unreachable = NodeSet()
+
         if self.fs.debug:
             print("FSProxyAction %s on %s" % (action, nodes))
 
     def info(self):
         return ActionInfo(self, description='Proxy action')
 
+    def trace_name(self):
+        return "%s on %s" % (self.action, self.nodes)
+
+    def timed_comps(self):
+        """Remote components run in parallel, the longest one counts."""
+        # In plan mode, they are timed by their stages.
+        if self.stages:
+            return self.action, []
+        return self.action, list(self._comps or ())
+
+    def _prepare_env(self):
+        """Return the remote command prefix setting proxy protocol options."""
+        # Announce we support compact messages. 'env' is used to be
+        # independent of the remote login shell.
+        command = ["env %s=%d" % (SHINE_MSG_ENV, SHINE_MSG_VERSION_COMPACT)]
+        if Globals().get('msg_batch_size'):
+            command.append("%s=%d:%d" % (SHINE_MSG_BATCH_ENV,
+                                        Globals().get('msg_batch_size'),
+                                        Globals().get('msg_batch_delay')))
+        command.append(self.progpath)
+        return command
+
     def _prepare_cmd(self):
         """Create the command line base on proxy properties."""
+        return self._prepare_env() + self._prepare_args()
 
-        command = ["%s" % self.progpath]
-        command.append(self.action)
-        command.append("-f %s" % self.fs.fs_name)
+    def _prepare_args(self):
+        """Create the shine command arguments based on proxy properties."""
+        command = [self.action]
+        for fsname in self.fsnames:
+            command.append("-f %s" % fsname)
         command.append("-R")
 
         if self.debug:
@@ -178,18 +465,103 @@ class FSProxyAction(CommonAction):
         if self.options['mountdata'] not in (None, 'auto'):
             command.append('--mountdata=%s' % self.options['mountdata'])
 
+        if self.stages:
+            command.append("--stages='%s'" % ';'.join(
+                                str(stage) for stage in self.stages.values()))
+
+        if self.options['watch']:
+            command.append('--watch --watch-interval=%d' %
+                           self.options['watch'])
+
         return command
 
+    def mux_key(self):
+        """Proxy actions with the same key could be run by the same command."""
+        return (self.action, str(self.nodes), bool(self._comps),
+                tuple(sorted((name, str(value))
+                             for name, value in self.options.items())))
+
     def _launch(self):
         """Launch FS proxy command."""
-        command = self._prepare_cmd()
+        # Several filesystems are run together, let ProxyMux group us.
+        if self.fs.proxy_mux is not None and not self.stages and \
+           not self.options['watch']:
+            self.fs.proxy_mux.add(self)
+        else:
+            self._run()
 
-        # Schedule cluster command.
-        self.task.shell(' '.join(command), nodes=self.nodes, handler=self)
+    def _run(self):
+        """Start the remote command."""
+        self._start(self.nodes)
 
         # Launch events
         self._actions_start()
 
+    def _start(self, nodes):
+        """Start the remote command on `nodes'."""
+        # Remote nodes also need to connect and to start shine.
+        timeout = None
+        if self.timeout:
+            timeout = self.timeout + Globals().get_ssh_connect_timeout()
+
+        FSProxyAction._running.add(self)
+        self._pending = NodeSet(nodes)
+
+        # A watching command never ends, it would hold the agent session.
+        if Globals().get('remote_agent') and not self.options['watch']:
+            # Arguments are shell-quoted, split them as the shell would do.
+            args = shlex.split(' '.join(self._prepare_args()))
+            agentcmd = ' '.join(self._prepare_env() + ['agent', '-R'])
+            self.start = time.time()
+            if timeout:
+                self._timer = self.task.timer(timeout, handler=self)
+            for node in NodeSet(nodes):
+                ProxyAgent.session(node, agentcmd).request(self, args)
+        else:
+            command = self._prepare_cmd()
+
+            # Schedule cluster command.
+            self._worker = self.task.shell(' '.join(command), nodes=nodes,
+                                           handler=self, timeout=timeout)
+
+        # Stages already allowed to start, see answer().
+        for buf in self._answers:
+            for node in NodeSet(nodes):
+                self.write(node, buf)
+        self._answers = []
+
+    def set_status(self, status):
+        if status in (ACT_OK, ACT_ERROR):
+            FSProxyAction._running.discard(self)
+            if self._timer is not None:
+                self._timer.invalidate()
+                self._timer = None
+        CommonAction.set_status(self, status)
+        # Once done, the remote plan will not run any other stage.
+        if status in (ACT_OK, ACT_ERROR):
+            for stage in self.stages.values():
+                stage.done(False)
+
+    def write(self, node, buf):
+        """Send `buf' on the standard input of the command running on `node'."""
+        if self._worker is not None:
+            # Plan proxies run on a single node.
+            self._worker.write(buf)
+        else:
+            ProxyAgent._sessions[node].worker.write(buf)
+
+    def answer(self, index, go):
+        """
+        Tell the remote plan if stage `index' could start. Answers are sent
+        once the request is, and only while the remote plan runs.
+        """
+        buf = shine_msg_pack_barrier(index, go)
+        if self.status() == ACT_WAITING:
+            self._answers.append(buf)
+        elif self.status() == ACT_RUNNING:
+            for node in NodeSet(self._pending):
+                self.write(node, buf)
+
     def _actions_start(self):
         """
         Raise 'proxy' events for all components related to this ProxyAction.
@@ -203,25 +575,14 @@ class FSProxyAction(CommonAction):
                 comp.action_event(self, 'start')
 
     def ev_read(self, worker):
-        node = worker.current_node
-        buf = worker.current_msg
-        try:
-            data = shine_msg_unpack(buf)
-
-            # COMPAT: Prior to 1.4, 'comp'+'action' was used.
-            # 1.4+ uses ActionInfo
-            if 'comp' in data:
-                action = Action()
-                action.NAME = data.pop('action')
-                comp = data.pop('comp')
-                comp.fs = self.fs
-                desc = "%s of %s" % (action.NAME, comp.longtext())
-                data['info'] = ActionInfo(action, comp, desc)
-                evtype = 'comp'
-            else:
-                evtype = data.pop('evtype')
+        self._read(worker.current_node, worker.current_msg)
 
-            self.fs.distant_event(evtype, node=node, **data)
+    def _read(self, node, buf):
+        """Handle a message line sent by `node'."""
+        if action_trace().enabled:
+            action_trace().remote_output(self, node)
+        try:
+            self._dispatch(node, shine_msg_unpack(buf))
         except ProxyActionUnpickleError as exp:
             # Maintain a standalone list of unpickling errors.
             # Node could have unpickling error but still exit with 0
@@ -237,28 +598,206 @@ class FSProxyAction(CommonAction):
             # Store output that is not a shine message
             self._outputs.add(node, buf)
 
+    def _dispatch(self, node, data):
+        """Process a decoded message, or list of messages, from `node'."""
+        # A batch of events, all of them are compact messages.
+        if isinstance(data, list):
+            controls = [evt for evt in data
+                        if evt['evtype'] in ('stage', 'watch')]
+            self.fs.distant_events(node, [evt for evt in data
+                                          if evt not in controls])
+            for evt in controls:
+                self._dispatch(node, evt)
+            return
+
+        # Remote plan has run a stage.
+        if data.get('evtype') == 'stage':
+            self.stages[data['index']].done(data['ok'])
+            return
+
+        # Remote status is known, only changes will follow.
+        if data.get('evtype') == 'watch':
+            self._watch_ready(node)
+            return
+
+        # COMPAT: Prior to 1.4, 'comp'+'action' was used.
+        # 1.4+ uses ActionInfo
+        if 'comp' in data:
+            action = Action()
+            action.NAME = data.pop('action')
+            comp = data.pop('comp')
+            comp.fs = self.fs
+            desc = "%s of %s" % (action.NAME, comp.longtext())
+            data['info'] = ActionInfo(action, comp, desc)
+            evtype = 'comp'
+        else:
+            evtype = data.pop('evtype')
+
+        self.fs.distant_event(evtype, node=node, **data)
+
+    def _watch_ready(self, node):
+        """
+        `node' has sent the initial status. When all nodes did, the action is
+        closed as if the commands were done, though they keep on running.
+        """
+        self._watching.add(node)
+        if self._watching == NodeSet(self.nodes):
+            self.duration = time.time() - self.start
+            self._close(self._watching, [(0, self._watching)])
+
     def ev_hup(self, worker):
+        node = worker.current_node
+        self._pending.difference_update(node)
+        if node in self._watching:
+            msg = "Status watch ended (rc=%d)" % worker.current_rc
+            self.fs.distant_event('log', node=node, level='warning', msg=msg)
+        else:
+            self._hup(node, worker.current_rc)
+
+    def _hup(self, node, retcode):
         """Keep a list of node, without output, with a return code != 0"""
         # If this node was on error
-        if worker.current_rc != 0:
+        if retcode != 0:
             # If there is no known outputs
-            if self._outputs.get(worker.current_node) is None:
-                self._silentnodes.add(worker.current_node)
+            if self._outputs.get(node) is None:
+                self._silentnodes.add(node)
+
+    def agent_done(self, node, retcode):
+        """An agent session has finished to run this request on `node'."""
+        self._hup(node, retcode)
+        self._retcodes.setdefault(retcode, NodeSet()).add(node)
+        self._agent_end(node)
+
+    def agent_timeout(self, node):
+        """The agent session on `node' was given up, as it did not answer."""
+        if node not in self._unreachable:
+            self._timedout.add(node)
+        self._agent_end(node)
+
+    def _agent_end(self, node):
+        """Close the action once the request is over on all nodes."""
+        self._pending.remove(node)
+        if not self._pending:
+            self.duration = time.time() - self.start
+            if not self._retry_nodes():
+                self._close(NodeSet(self.nodes), self._retcodes.items())
+
+    def ev_timer(self, timer):
+        """Agent requests did not end in time, give up their sessions."""
+        self._timer = None
+        for node in NodeSet(self._pending):
+            ProxyAgent._sessions[node].abort()
 
     def ev_close(self, worker):
         """End of proxy command."""
         Action.ev_close(self, worker)
 
+        # Action timed out on some nodes, others results are still valid.
+        if worker.did_timeout():
+            self._timedout.update(NodeSet.fromlist(worker.iter_keys_timeout()))
+
+        # Already closed, once all nodes have sent their status to watch.
+        if self.status() in (ACT_OK, ACT_ERROR):
+            return
+
+        for retcode, nodes in worker.iter_retcodes():
+            self._retcodes.setdefault(retcode, NodeSet()).updaten(nodes)
+        if not self._retry_nodes():
+            self._close(NodeSet(self.nodes), self._retcodes.items())
+
+    def retry_policy(self):
+        """Remote commands are retried as the action they run."""
+        return retry_policy(self.action)
+
+    def _retry_nodes(self):
+        """
+        Run the remote command again, later, on nodes which failed with a
+        transient error, see _retry_later(). Their results are forgotten.
+
+        Return True if some nodes will be retried, the action is closed once
+        they are done.
+        """
+        # Stages and watch cannot be run again on some of the nodes only.
+        policy = self.retry_policy()
+        if policy is None or self.stages or self.options['watch'] or \
+           self._unreachable:
+            return False
+
+        retry = None
+        nodes = NodeSet()
+        for retcode, rcnodes in self._retcodes.items():
+            for node in rcnodes:
+                output = self._outputs.get(node)
+                output = '' if output is None else str(output)
+                if retcode != 0 and policy.retryable(retcode, output):
+                    nodes.add(node)
+                    retry = retry or (retcode, output)
+        if not nodes:
+            return False
+
+        result = self._retry_later(*retry)
+        if result is None:
+            return False
+
+        self._retrying = nodes
+        for retcode in list(self._retcodes):
+            self._retcodes[retcode].difference_update(nodes)
+            if not self._retcodes[retcode]:
+                del self._retcodes[retcode]
+        self._outputs.remove(nodes.__contains__)
+        self._errpickle.remove(nodes.__contains__)
+        self._silentnodes.difference_update(nodes)
+
+        if self._comps:
+            self._comp_events(nodes, 'progress', result)
+        else:
+            msg = "Remote action %s failed, retrying: %s" % (self.action,
+                                                              result)
+            self.fs.distant_event('log', node=str(nodes), level='warning',
+                                  msg=msg)
+        return True
+
+    def _retry(self):
+        """Run the remote command again on nodes to retry."""
+        if self.status() == ACT_RUNNING:
+            nodes, self._retrying = self._retrying, NodeSet()
+            self._start(nodes)
+
+    @classmethod
+    def reset_all(cls):
+        """Forget proxy actions of a previous command, see run_agent()."""
+        cls._running.clear()
+
+    @classmethod
+    def abandon_all(cls):
+        """Give up all remote commands still running, see abandon()."""
+        for action in list(cls._running):
+            action.abandon()
+
+    def abandon(self):
+        """
+        Stop waiting for nodes which did not answer yet. The action is closed
+        with the results of the other nodes. Components of the given up nodes
+        are UNREACHABLE, instead of being on error.
+        """
+        self._unreachable.update(self._pending)
+        self._unreachable.update(self._retrying)
+        if self._worker is not None and self._pending:
+            self._worker.abort()
+        elif self._pending:
+            for node in NodeSet(self._pending):
+                ProxyAgent._sessions[node].abort()
+        elif self._retrying:
+            self._retrying = NodeSet()
+            self._close(NodeSet(self.nodes), self._retcodes.items())
+
+    def _close(self, allnodes, retcodes):
+        """Check the remote commands results, when all of them are done."""
         # Before all, we must check if shine command ran without bugs, node
         # crash, etc...
         # So we need to verify all node retcodes and change the component state
         # on the bad nodes.
 
-        # Action timed out
-        if worker.did_timeout():
-            self.set_status(ACT_ERROR)
-            return
-
         status = ACT_OK
 
         # Remove the 'proxy' running action for each component.
@@ -267,10 +806,13 @@ class FSProxyAction(CommonAction):
                 # This special event helps to keep track of undergoing actions
                 # (see ev_start())
                 comp.action_event(self, 'done')
-                comp.sanitize_state(nodes=worker.nodes)
+                comp.mark_unreachable(comp.allservers().nodeset() &
+                                      self._unreachable)
+                comp.sanitize_state(nodes=allnodes)
+        self.fs.unreachable.update(self._unreachable)
 
         # Gather nodes by return code
-        for rc, nodes in worker.iter_retcodes():
+        for rc, nodes in retcodes:
             # Remote command returns only RUNTIME_ERROR (See RemoteCommand)
             # some common remote errors:
             # rc 127 = command not found
@@ -290,6 +832,15 @@ class FSProxyAction(CommonAction):
                                                         (self.action, buffers)
                     self.fs._handle_shine_proxy_error(nodes, msg)
 
+        # Nodes which did not answer in time
+        if self._timedout:
+            status = ACT_ERROR
+            if self._comps:
+                self._comp_events(self._timedout, 'timeout')
+            else:
+                msg = "Remote action %s timed out" % self.action
+                self.fs._handle_shine_proxy_error(self._timedout, msg)
+
         # Raise errors for each unpickling error,
         # which could happen mostly when Shine exits with 0.
         for buffers, nodes in self._errpickle.walk():
@@ -302,3 +853,232 @@ class FSProxyAction(CommonAction):
             self.fs._handle_shine_proxy_error(self._silentnodes, msg)
 
         self.set_status(status)
+
+    def _comp_events(self, nodes, status, result=None):
+        """Raise a `status' event for each component on `nodes'."""
+        action = Action()
+        action.NAME = self.action
+        for comp in self._comps:
+            desc = "%s of %s" % (self.action, comp.longtext())
+            info = ActionInfo(action, comp, desc)
+            for node in comp.allservers().nodeset() & nodes:
+                self.fs.hdlr.event_callback('comp', node=node, comp=comp,
+                                            info=info, status=status,
+                                            result=result)
+
+
+class MultiFSProxyAction(FSProxyAction):
+    """
+    Proxy actions of several filesystems, run by a single remote command.
+
+    The remote command tags each event with its filesystem name. Events are
+    given back to the proxy action of this filesystem, which is then closed as
+    if it had run its own command.
+    """
+
+    def __init__(self, proxies):
+        first = proxies[0]
+        FSProxyAction.__init__(self, first.fs, first.action, first.nodes,
+                               first.debug, **first.options)
+        self._proxies = OrderedDict((proxy.fs.fs_name, proxy)
+                                    for proxy in proxies)
+        self.fsnames = list(self._proxies)
+        if first._comps:
+            self._comps = ComponentGroup()
+            for proxy in proxies:
+                self._comps.update(proxy._comps)
+
+        # Command outputs and errors are reported by each filesystem.
+        for proxy in proxies:
+            proxy._outputs = self._outputs
+            proxy._errpickle = self._errpickle
+            proxy._silentnodes = self._silentnodes
+            proxy._timedout = self._timedout
+            proxy._unreachable = self._unreachable
+
+    def _launch(self):
+        self._run()
+
+    def _actions_start(self):
+        for proxy in self._proxies.values():
+            proxy._actions_start()
+
+    def _dispatch(self, node, data):
+        """Give each message to the proxy action of its filesystem."""
+        if isinstance(data, list):
+            events = OrderedDict()
+            for evt in data:
+                events.setdefault(evt.pop('fsname', None), []).append(evt)
+        else:
+            events = {data.pop('fsname', None): data}
+
+        for fsname, data in events.items():
+            if fsname not in self._proxies:
+                msg = "Cannot dispatch message without filesystem name " \
+                      "(check Shine versions)"
+                if msg not in self._errpickle.get(node, ""):
+                    self._errpickle.add(node, msg)
+                continue
+            self._proxies[fsname]._dispatch(node, data)
+
+    def _close(self, allnodes, retcodes):
+        retcodes = list(retcodes)
+        status = ACT_OK
+        for proxy in self._proxies.values():
+            proxy.duration = self.duration
+            proxy._close(allnodes, retcodes)
+            if proxy.status() == ACT_ERROR:
+                status = ACT_ERROR
+        self.set_status(status)
+
+    def set_status(self, status):
+        # On timeout, proxy actions are not closed.
+        if status == ACT_ERROR:
+            for proxy in self._proxies.values():
+                if proxy.status() not in (ACT_OK, ACT_ERROR):
+                    proxy.set_status(ACT_ERROR)
+        FSProxyAction.set_status(self, status)
+
+
+class ProxyDeadline(EventHandler):
+    """Give up remote commands still running when the timer fires."""
+
+    def ev_timer(self, timer):
+        FSProxyAction.abandon_all()
+
+
+class ProxyMux(EventHandler):
+    """
+    Group the proxy actions of several filesystems run in the same run loop.
+
+    Proxy actions launched during the same run loop iteration, with the same
+    action, nodes and options, are run by a single MultiFSProxyAction.
+    """
+
+    def __init__(self):
+        EventHandler.__init__(self)
+        self._pending = []
+        self._timer = None
+
+    def add(self, proxy):
+        """Run `proxy' at the end of the current run loop iteration."""
+        self._pending.append(proxy)
+        if self._timer is None:
+            self._timer = task_self().timer(0, handler=self)
+
+    def ev_timer(self, timer):
+        """Group and run pending proxy actions."""
+        self._timer = None
+        groups = OrderedDict()
+        for proxy in self._pending:
+            # Each group contains at most one proxy per filesystem.
+            candidates = groups.setdefault(proxy.mux_key(), [])
+            for group in candidates:
+                if proxy.fs.fs_name not in group:
+                    group[proxy.fs.fs_name] = proxy
+                    break
+            else:
+                candidates.append(OrderedDict([(proxy.fs.fs_name, proxy)]))
+        self._pending = []
+
+        for candidates in groups.values():
+            for group in candidates:
+                proxies = list(group.values())
+                if len(proxies) == 1:
+                    proxies[0]._run()
+                else:
+                    MultiFSProxyAction(proxies).launch()
+
+
+class ProxyAgent(EventHandler):
+    """
+    Persistent 'shine agent -R' session on a remote node.
+
+    The agent reads requests on its standard input and runs them one after
+    the other. Each request output ends with a SHINE_AGENT_END message.
+    Sessions are kept open for the whole admin command, across run loops, so
+    ssh connection and shine startup are only paid once per node.
+    """
+
+    # Opened sessions, by node name.
+    _sessions = {}
+
+    # While requests are pending, a timer keeps the run loop alive, as the
+    # session worker itself does not.
+    KEEPALIVE = 60
+
+    def __init__(self, node, command):
+        EventHandler.__init__(self)
+        self.node = node
+        self._requests = deque()
+        self._keepalive = None
+        task = task_self()
+        if task.topology is not None and task.default('auto_tree'):
+            # Gateway channels are already out of the fanout count.
+            self.worker = task.shell(command, nodes=node, handler=self,
+                                     autoclose=True)
+        else:
+            wrkcls = task.default('distant_worker')
+            self.worker = wrkcls(NodeSet(node), command=command, handler=self,
+                                 stderr=task.default('stderr'), timeout=None,
+                                 autoclose=True)
+            # An idle session should not prevent other commands from
+            # running, do not count it in the task fanout.
+            self.worker._fanout = FANOUT_UNLIMITED
+            task.schedule(self.worker)
+
+    @classmethod
+    def session(cls, node, command):
+        """Return the session opened on `node', starting it if needed."""
+        if node not in cls._sessions:
+            cls._sessions[node] = cls(node, command)
+        return cls._sessions[node]
+
+    def request(self, proxy, args):
+        """Ask the agent to run shine with `args', on behalf of `proxy'."""
+        self._requests.append(proxy)
+        self.worker.write(shine_msg_pack_request(args))
+        if self._keepalive is None:
+            self._keepalive = task_self().timer(self.KEEPALIVE, handler=self,
+                                                interval=self.KEEPALIVE)
+
+    def _pop(self):
+        """Remove the oldest request, as it is completed."""
+        proxy = self._requests.popleft()
+        if not self._requests:
+            self._keepalive.invalidate()
+            self._keepalive = None
+        return proxy
+
+    def ev_read(self, worker):
+        buf = worker.current_msg
+        if buf.startswith(SHINE_AGENT_END):
+            retcode = int(buf[len(SHINE_AGENT_END):].rstrip('}'))
+            self._pop().agent_done(self.node, retcode)
+        elif self._requests:
+            self._requests[0]._read(self.node, buf)
+
+    def _forget(self):
+        """Remove the session from the opened ones."""
+        del self._sessions[self.node]
+
+    def abort(self):
+        """Give up the session, as requests did not end in time."""
+        self._forget()
+        self.worker.abort()
+        while self._requests:
+            self._pop().agent_timeout(self.node)
+
+    def ev_hup(self, worker):
+        """Agent is gone, all pending requests have failed."""
+        # Already given up, see abort()
+        if self._sessions.get(self.node) is not self:
+            return
+        self._forget()
+        # Exiting with 0 is not expected with pending requests
+        retcode = worker.current_rc or 1
+        while self._requests:
+            self._pop().agent_done(self.node, retcode)
+
+    def ev_timer(self, timer):
+        """Nothing to do, only used to keep the run loop alive."""
@@ -24,8 +24,6 @@ This module contains a FSAction class to start a Lustre target.
 
 import os
 
-from ClusterShell.Task import task_self
-
 from Shine.Configuration.Globals import Globals
 
 from Shine.Lustre.Actions.Action import FSAction, Result
@@ -39,6 +37,8 @@ class StartTarget(FSAction):
 
     NAME = 'start'
 
+    LOOP_EXCLUSIVE = True
+
     def __init__(self, target, **kwargs):
         FSAction.__init__(self, target, **kwargs)
         self.mount_options = kwargs.get('mount_options')
@@ -51,10 +51,6 @@ class StartTarget(FSAction):
         if self.comp.is_started():
             return Result("%s is already started" % self.comp.label)
 
-        # LBUG #18624
-        if not self.comp.dev_isblk:
-            task_self().set_info("fanout", 1)
-
         return None
 
     def _prepare_cmd(self):
@@ -23,7 +23,8 @@ This module contains the version of FSAction class to implement component
 status checking.
 """
 
-from Shine.Lustre.Actions.Action import FSAction, ACT_OK
+from Shine.Lustre.Actions.Action import CommonAction, FSAction, Result, \
+                                        ACT_WAITING, ACT_RUNNING, ACT_OK
 
 class Status(FSAction):
     """
@@ -34,9 +35,72 @@ class Status(FSAction):
 
     NAME = 'status'
 
+    def _launch(self):
+        """
+        Use the component state given by the state daemon, if any, see
+        FileSystem.launch_status(). Otherwise, check it.
+        """
+        fields = None
+        if self.comp.fs.daemon_states is not None:
+            age, states = self.comp.fs.daemon_states
+            fields = states.get(self.comp.uniqueid())
+
+        # Unknown by the daemon, or sent by another Shine version
+        if fields is None or len(fields) != len(self.comp.SERIAL_FIELDS):
+            FSAction._launch(self)
+            return
+
+        self.comp.action_event(self, 'start')
+        self.comp.update_fields(self.comp.fs.local_server,
+                                dict(zip(self.comp.SERIAL_FIELDS, fields)))
+        self.set_status(ACT_OK)
+        self.comp.action_event(self, 'done',
+                               Result("from state daemon, %d seconds old" % age))
+
     def _shell(self):
         """
         No-op method. Status command does not need to run an external command.
         """
         self.set_status(ACT_OK)
         self.comp.action_event(self, 'done')
+
+
+class StatusWatch(CommonAction):
+    """
+    Keep on following components once their status is known.
+
+    When all status actions it depends on are done, whatever their result,
+    `ready' is called with the watched components. Then local components are
+    checked again every `interval' seconds, see FileSystem.poll_status().
+    Remote nodes do it by themselves, as their status command keeps on
+    running.
+
+    This action never ends, the command has to be interrupted.
+    """
+
+    NAME = 'watch'
+
+    def __init__(self, fs, comps, interval, ready=None):
+        CommonAction.__init__(self)
+        self.fs = fs
+        self.comps = comps
+        self.interval = interval
+        self.ready = ready
+        self._timer = None
+
+    def launch(self):
+        """Start watching when dependencies are done, even on error."""
+        if self.status() != ACT_WAITING or self._deps_count.left > 0:
+            return
+        self.set_status(ACT_RUNNING)
+        self._launch()
+
+    def _launch(self):
+        if self.ready is not None:
+            self.ready(self.comps)
+        self._timer = self.task.timer(self.interval, handler=self,
+                                      interval=self.interval)
+
+    def ev_timer(self, timer):
+        """Check local components again."""
+        self.fs.poll_status(self.comps)
@@ -22,8 +22,6 @@
 Action class to stop Lustre target.
 """
 
-from ClusterShell.Task import task_self
-
 from Shine.Lustre.Actions.Action import FSAction, Result
 
 class StopTarget(FSAction):
@@ -33,15 +31,13 @@ class StopTarget(FSAction):
 
     NAME = 'stop'
 
+    LOOP_EXCLUSIVE = True
+
     def _already_done(self):
         """Return a Result object is the target is already unmounted."""
         if self.comp.is_stopped():
             return Result(message="%s is already stopped" % self.comp.label)
 
-        # LBUG #18624
-        if not self.comp.dev_isblk:
-            task_self().set_info("fanout", 1)
-
         return None
 
     def _prepare_cmd(self):
@@ -23,8 +23,7 @@ Classes used the apply tuning on local node, either from tuning.conf or
 dynamically created.
 """
 
-from Shine.Lustre.Actions.Action import CommonAction, ActionGroup, \
-                                        ActionInfo, \
+from Shine.Lustre.Actions.Action import CommonAction, ActionInfo, \
                                         ACT_OK, ACT_ERROR, ErrorResult
 
 _SRVTYPE_MAP = {
@@ -35,88 +34,67 @@ _SRVTYPE_MAP = {
         'router': 'router'
     }
 
-class _TuningAction(CommonAction):
-    """Action handling the command to modify only 1 tuning."""
 
-    NAME = "tuning"
+class Tune(CommonAction):
+    """
+    Action to apply all tunings for the local node.
 
-    def __init__(self, action, command):
-        CommonAction.__init__(self)
-        self._tune = action
-        self._command = command
-        self.dryrun = action.dryrun
-
-    def _launch(self):
-        self._tune._server.hdlr.log('detail',
-                                    msg='[RUN] %s' % self._command)
-        if self.dryrun:
-            self.set_status(ACT_OK)
-        else:
-            self.task.shell(self._command, handler=self)
-
-
-class Tune(ActionGroup):
-    """Action to apply all tunings for the local node."""
+    Tuning files are written directly, in one pass, instead of running a
+    shell command for each of them. Logs and errors still show the
+    equivalent commands.
+    """
 
     NAME = "tune"
 
     def __init__(self, srv, tuning_conf, comps, fsname, **kwargs):
-        ActionGroup.__init__(self)
+        CommonAction.__init__(self)
         self._server = srv
         self._comps = comps
         self._conf = tuning_conf
         self._fsname = fsname
-        self._init = False
         self.dryrun = kwargs.get('dryrun', False)
+        # Commands of the tunings which could not be applied
+        self._errors = []
 
     def info(self):
         """Return a ActionInfo describing this action."""
         return ActionInfo(self, self._server, 'apply tunings')
 
-    def _add_actions(self):
-        """
-        Create all individual tunings Action.
-
-        To be run before this fake group action is really launched.
-        """
+    def _writes(self):
+        """Return (path, content, command) of all tunings to apply."""
         srvtypes = set([_SRVTYPE_MAP.get(comp.TYPE) for comp in self._comps])
         srvname = str(self._server.hostname)
 
+        writes = []
         tunings = self._conf.get_params_for_name(srvname, srvtypes)
         for tuning in tunings:
-            cmds = tuning.build_tuning_command(self._fsname)
-            for command in cmds:
-                self.add(_TuningAction(self, command))
-
-    def set_status(self, status):
-        """
-        Update action status.
-
-        If this is a final state, raise corresponding events.
-        """
-        # Do not raise events if start event was not raised.
-        # Start event is raised when init is set.
-        if self._init:
-            if status == ACT_OK:
-                self._server.action_event(self, 'done')
-            elif status == ACT_ERROR:
-                # Build an error string
-                errors = []
-                for act in self:
-                    if act.status() == ACT_ERROR:
-                        errors.append("'%s' failed" % act._command)
-                result = ErrorResult("\n".join(errors))
-                self._server.action_event(self, 'failed', result)
+            writes += tuning.build_tuning_writes(self._fsname)
+        return writes
 
-        ActionGroup.set_status(self, status)
+    def _apply(self, path, content, command):
+        """Write `content' to `path', the way `command' would."""
+        self._server.hdlr.log('detail', msg='[RUN] %s' % command)
+        if self.dryrun:
+            return
+        try:
+            fobj = open(path, 'w')
+            try:
+                fobj.write(content)
+            finally:
+                fobj.close()
+        except (IOError, OSError):
+            self._errors.append(command)
 
     def _launch(self):
-        # First time launch is called, we need to create all the sub actions.
-        # As the graph is calling launch a couple of times, we need to do this
-        # only once.
-        if not self._init:
-            self._server.action_event(self, 'start')
-            self._add_actions()
-            self._init = True
-        # Then call the real _launch()
-        ActionGroup._launch(self)
+        self._server.action_event(self, 'start')
+        for path, content, command in self._writes():
+            self._apply(path, content, command)
+        if self._errors:
+            # Build an error string
+            errors = ["'%s' failed" % command for command in self._errors]
+            result = ErrorResult("\n".join(errors))
+            self._server.action_event(self, 'failed', result)
+            self.set_status(ACT_ERROR)
+        else:
+            self._server.action_event(self, 'done')
+            self.set_status(ACT_OK)
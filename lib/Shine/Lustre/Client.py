@@ -22,17 +22,17 @@
 Classes for Shine framework to manage Lustre clients.
 """
 
-from glob import glob
 import os 
-import re
 
 from Shine.Lustre.Component import Component, ComponentError, \
-                                   MOUNTED, OFFLINE, CLIENT_ERROR, RUNTIME_ERROR
+                                   MOUNTED, OFFLINE, CLIENT_ERROR, \
+                                   RUNTIME_ERROR, UNREACHABLE
 
 from Shine.Lustre.Actions.StartClient import StartClient
 from Shine.Lustre.Actions.StopClient import StopClient
 
 from Shine.Lustre.Target import MDT, OST
+from Shine.Lustre.ProcFS import proc_snapshot
 
 
 class Client(Component):
@@ -59,9 +59,12 @@ class Client(Component):
         OFFLINE: "offline", 
         CLIENT_ERROR: "ERROR", 
         MOUNTED: "mounted", 
-        RUNTIME_ERROR: "CHECK FAILURE" 
+        RUNTIME_ERROR: "CHECK FAILURE",
+        UNREACHABLE: "unreachable"
     }
 
+    SERIAL_FIELDS = Component.SERIAL_FIELDS + ('mount_path', 'mount_options',
+                                               'mtpt', 'proc_states', 'subdir')
 
     def __init__(self, fs, server, mount_path, mount_options=None,
                  subdir=None, enabled=True):
@@ -120,8 +123,8 @@ class Client(Component):
 
         self.state = None   # Undefined
 
-        proc_lov_match = glob("/proc/fs/lustre/lov/%s-clilov-*" %
-                              self.fs.fs_name)
+        snapshot = proc_snapshot()
+        proc_lov_match = snapshot.clilov(self.fs.fs_name)
 
         if not proc_lov_match:
             self.state = OFFLINE
@@ -130,32 +133,27 @@ class Client(Component):
         #
         # There is at least one clilov declared. Check for coherence.
         #
-        loaded = os.path.isdir(proc_lov_match[0])
+        loaded = os.path.isdir(snapshot.root + proc_lov_match[0])
 
         # check for presence in /proc/mounts
-        f_proc_mounts = open("/proc/mounts", 'r')
-        try:
-            curr_lnetdev = None
-            for line in f_proc_mounts:
-                if line.find(" %s lustre " % self.mount_path) > 0:
-                    lnetdev, mntp = line.split(' ', 2)[0:2]
-                    if loaded:
-                        curr_lnetdev = lnetdev
-                        self.state = MOUNTED
-                        self.mtpt = mntp
+        curr_lnetdev = None
+        for lnetdev, fstype in snapshot.mounts_by_path(self.mount_path):
+            if fstype == 'lustre':
+                if loaded:
+                    curr_lnetdev = lnetdev
+                    self.state = MOUNTED
+                    self.mtpt = self.mount_path
+                else:
+                    self.state = CLIENT_ERROR
+                    if lnetdev != curr_lnetdev:
+                        raise ComponentError(self, "conflicting mounts "
+                                            "detected for %s and %s on %s" %
+                                             (lnetdev, curr_lnetdev,
+                                              self.mount_path))
                     else:
-                        self.state = CLIENT_ERROR
-                        if lnetdev != curr_lnetdev:
-                            raise ComponentError(self, "conflicting mounts "
-                                                "detected for %s and %s on %s" %
-                                                 (lnetdev, curr_lnetdev,
-                                                  self.mount_path))
-                        else:
-                            raise ComponentError(self, "multiple mounts "
-                                                 "detected for %s (%s)" %
-                                                 (lnetdev, self.mount_path))
-        finally:
-            f_proc_mounts.close()
+                        raise ComponentError(self, "multiple mounts "
+                                             "detected for %s (%s)" %
+                                             (lnetdev, self.mount_path))
 
         if loaded and self.state != MOUNTED:
             # up but not mounted = incoherent state
@@ -172,27 +170,23 @@ class Client(Component):
         """Check current target status in /proc/fs/lustre/*/*/state"""
 
         self.proc_states = {}
-        for entry in glob("/proc/fs/lustre/??c/%s-*/state" % self.fs.fs_name):
-            f_state = open(entry, 'r')
-            for line in f_state:
-                if line.startswith('current_state:'):
-                    state_name = line.split(None, 1)[1].strip()
-
-                    # Ignore inactive targets
-                    if state_name != 'FULL':
-                        mo = re.search(r'/(%s-\w{3}[0-9a-fA-F]{4})-' %
-                                       self.fs.fs_name, entry)
-                        try:
-                            if not self.fs.components[mo.group(1)].is_active():
-                                break
-                        except (AttributeError, KeyError):
-                            pass
-
-                    self.proc_states.setdefault(state_name, 0)
-                    self.proc_states[state_name] += 1
-                    # Stop reading other file lines
-                    break
-            f_state.close()
+        imports = proc_snapshot().import_states(self.fs.fs_name)
+        for counts, others in imports.values():
+            for state_name, total in counts.items():
+                self.proc_states.setdefault(state_name, 0)
+                self.proc_states[state_name] += total
+
+            # Ignore inactive targets
+            for label, state_name in others:
+                try:
+                    if not self.fs.components[label].is_active():
+                        self.proc_states[state_name] -= 1
+                except KeyError:
+                    pass
+
+        for state_name, total in list(self.proc_states.items()):
+            if total == 0:
+                del self.proc_states[state_name]
 
         if 'EVICTED' in self.proc_states:
             self.state = CLIENT_ERROR
@@ -39,6 +39,8 @@ TARGET_ERROR = 6
 RUNTIME_ERROR = 7
 INACTIVE = 8
 MIGRATED = 9
+# Server did not answer before the status deadline
+UNREACHABLE = 10
 
 from Shine.Lustre import ComponentError
 from Shine.Lustre.Server import ServerGroup
@@ -64,6 +66,11 @@ class Component(object):
     # Text mapping for each possible states
     STATE_TEXT_MAP = {}
 
+    # Attributes sent by remote nodes to update the matching component, when
+    # using compact proxy messages. New fields should be appended at the end
+    # to stay compatible with older nodes.
+    SERIAL_FIELDS = ('state',)
+
     def __init__(self, fs, server, enabled = True, mode = 'managed',
                  active = 'manual'):
 
@@ -126,6 +133,26 @@ class Component(object):
         """
         self.state = other.state
 
+    def serial_fields(self):
+        """Return the values of SERIAL_FIELDS, in the same order."""
+        return [getattr(self, name) for name in self.SERIAL_FIELDS]
+
+    def server_fields(self):
+        """
+        Return SERIAL_FIELDS values, as sent by each server, keyed by server
+        name.
+        """
+        return {str(self.server.hostname): self.serial_fields()}
+
+    def update_fields(self, server, fields):
+        """
+        Update my serializable fields from a dict sent by `server'.
+
+        This is the compact message version of update().
+        """
+        for name, value in fields.items():
+            setattr(self, name, value)
+
     def sanitize_state(self, nodes=None):
         """
         Clean component state if it is wrong.
@@ -147,6 +174,14 @@ class Component(object):
                   (self.label, self.state, actions), file=sys.stderr)
             self.state = RUNTIME_ERROR
 
+    def mark_unreachable(self, nodes):
+        """
+        `nodes' did not answer in time: the component state is unknown,
+        which is not an error of the component.
+        """
+        if nodes and self.state is None:
+            self.state = UNREACHABLE
+
     def __getstate__(self):
         odict = self.__dict__.copy()
         del odict['fs']
@@ -203,6 +238,30 @@ class Component(object):
         """
         self.lustre_check()
 
+    def mountdata_command(self):
+        """
+        Return the command line reading component mountdata, if it has some.
+
+        If so, mountdata_result() will be called with the command output.
+        """
+        return None
+
+    def mountdata_result(self, output, retcode):
+        """Analyze the output of mountdata_command()."""
+        raise NotImplementedError("Component must implement this.")
+
+    def mountdata_cached(self):
+        """
+        Use cached mountdata, if any. Return False if they should be read.
+        """
+        return False
+
+    def mountdata_read(self):
+        """
+        Read mountdata without running mountdata_command(), if possible.
+        """
+        return False
+
     #
     # Inprogress action methods
     #
@@ -29,6 +29,9 @@ import stat
 import subprocess
 
 from Shine.Configuration.Globals import Globals
+from Shine.Lustre.ProcFS import proc_snapshot
+from Shine.Lustre.Mountdata import mountdata_cache, device_uuid, \
+                                   read_mountdata, MountdataUnsupported
 
 ### From lustre/include/lustre_disk.h:
 
@@ -57,6 +60,9 @@ class Disk:
     lustre_disk.h. Base class for Lustre Target (see Target.py).
     """
 
+    # Fields copied by update()
+    SERIAL_FIELDS = ('dev_isblk', 'dev_size', 'ldd_svname', '_ldd_flags')
+
     def __init__(self, dev):
         self.dev = dev
 
@@ -92,16 +98,10 @@ class Disk:
             # block device
             self.dev_isblk = True
             # get dev size
-            partitions = open("/proc/partitions", 'r')
-            try:
-                dev = os.path.basename(os.path.realpath(self.dev))
-                for line in partitions:
-                    d_info = line.rstrip('\n').split(' ')
-                    if len(d_info) > 1 and d_info[-1] == dev:
-                        self.dev_size = int(d_info[-2]) * 1024
-                        break
-            finally:
-                partitions.close()
+            dev = os.path.basename(os.path.realpath(self.dev))
+            size = proc_snapshot().partition_size(dev)
+            if size is not None:
+                self.dev_size = size
 
         elif stat.S_ISREG(mode):
             # regular file
@@ -111,20 +111,32 @@ class Disk:
             # unsupported
             raise DiskDeviceError(self, "unsupported device type")
 
-    def _mountdata_check(self, label_check=None):
-        """Read device flags using 'tunefs.lustre'"""
-
+    def mountdata_command(self):
+        """Return the command line used to read device mountdata."""
         cmd = "tunefs.lustre --dryrun %s" % self.dev
         path = Globals().get('command_path')
         if path:
             cmd = "export PATH=%s:${PATH}; %s" % (path, cmd)
+        return cmd
 
-        process = subprocess.Popen([cmd], stdout=subprocess.PIPE,
+    def _mountdata_check(self, label_check=None):
+        """Read device flags, directly or using 'tunefs.lustre'"""
+
+        if self._mountdata_read(label_check):
+            return
+
+        process = subprocess.Popen([self.mountdata_command()],
+                                   stdout=subprocess.PIPE,
                                    stderr=subprocess.PIPE, shell=True)
         output = process.communicate()[0]
-        if process.returncode > 0:
+        self._mountdata_parse(output, process.returncode, label_check)
+
+    def _mountdata_parse(self, output, retcode, label_check=None):
+        """Analyze 'tunefs.lustre' output and set device flags and label."""
+
+        if retcode > 0:
             raise DiskDeviceError(self, "Failed to run 'tunefs.lustre' to " +
-                                  "read flags (rc=%d)" % process.returncode)
+                                  "read flags (rc=%d)" % retcode)
 
         for line in output.splitlines():
             line = line.strip()
@@ -135,6 +147,61 @@ class Disk:
             elif line.startswith('Permanent disk data:'):
                 break
 
+        mountdata_cache().set(self.dev, self._device_identity(),
+                              self.ldd_svname, self._ldd_flags)
+        self._mountdata_label_check(label_check)
+
+    def _mountdata_read(self, label_check=None):
+        """
+        Read device flags and label directly from an ldiskfs device.
+
+        Return False if device layout is not supported and 'tunefs.lustre'
+        should be used instead.
+        """
+        try:
+            self.ldd_svname, self._ldd_flags = read_mountdata(self.dev)
+        except MountdataUnsupported:
+            return False
+
+        mountdata_cache().set(self.dev, self._device_identity(),
+                              self.ldd_svname, self._ldd_flags)
+        self._mountdata_label_check(label_check)
+        return True
+
+    def _mountdata_cached(self, label_check=None):
+        """
+        Set device flags and label from the on-node cache.
+
+        Return False if they are not cached or device has changed.
+        """
+        entry = mountdata_cache().get(self.dev, self._device_identity())
+        if entry is None:
+            return False
+        self.ldd_svname = str(entry[0])
+        self._ldd_flags = entry[1]
+        self._mountdata_label_check(label_check)
+        return True
+
+    def _device_identity(self):
+        """
+        Return what identifies device content, to validate cached mountdata.
+
+        Should be called after _device_check().
+        """
+        try:
+            info = os.stat(self.dev)
+        except OSError as error:
+            raise DiskDeviceError(self, str(error))
+
+        if stat.S_ISBLK(info[stat.ST_MODE]):
+            return [info.st_rdev, self.dev_size, device_uuid(self.dev)]
+        else:
+            # Image file: it could be rewritten without changing its inode.
+            return [info.st_dev, info.st_ino, self.dev_size,
+                    int(info.st_mtime)]
+
+    def _mountdata_label_check(self, label_check):
+        """Raise a DiskDeviceError if device label is not `label_check'."""
         if label_check:
             # Lustre 2.3 changed the label patterns.
             # fsname and svname could be separated by '-', ':' and '='
@@ -0,0 +1,202 @@
+# DurationHistory.py -- Admin node history of component action durations
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Durations of the actions run on each component are kept on the admin node,
+so the time an action graph needs could be estimated before running it
+(--dry-run) and while it runs (ETA of the progress lines).
+
+Each filesystem has its own file in history_dir. For each action name and
+component id, it gives the last durations reported by the successful
+commands. An action is expected to last the median of them.
+"""
+
+import os
+import json
+import time
+import tempfile
+
+from Shine.Configuration.Globals import Globals
+from Shine.Lustre.Actions.Action import ActionGroup, ACT_OK, ACT_ERROR
+
+
+class DurationHistory(object):
+    """
+    Action durations of filesystem `fsname'.
+
+    Read or write errors are ignored: without history, no estimate is
+    given.
+    """
+
+    # Durations kept for each action of each component
+    SIZE = 5
+
+    def __init__(self, fsname):
+        self.path = os.path.join(Globals().get('history_dir'),
+                                 '%s.durations' % fsname)
+        self._entries = self._load()
+        self._changed = False
+        # Start time of running actions, and ended ones, by (action, id)
+        self._started = {}
+        self._ended = set()
+
+    def _load(self):
+        """Return all entries of the history file."""
+        try:
+            fobj = open(self.path)
+            try:
+                return json.load(fobj)
+            finally:
+                fobj.close()
+        except (IOError, ValueError):
+            return {}
+
+    def save(self):
+        """Atomically replace the history file, if durations were added."""
+        if not self._changed:
+            return
+        dirname = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.durations')
+            fobj = os.fdopen(fd, 'w')
+            try:
+                json.dump(self._entries, fobj, sort_keys=True)
+            finally:
+                fobj.close()
+            os.rename(tmpname, self.path)
+            self._changed = False
+        except (IOError, OSError):
+            pass
+
+    #
+    # Recording
+    #
+
+    def started(self, action, compid):
+        """`action' of component `compid' is running."""
+        self._started[(action, compid)] = time.time()
+        self._ended.discard((action, compid))
+
+    def ended(self, action, compid, duration=None):
+        """
+        `action' of component `compid' has ended. `duration' is given if
+        its command succeeded.
+        """
+        self._ended.add((action, compid))
+        if duration is not None:
+            self.add(action, compid, duration)
+
+    def add(self, action, compid, duration):
+        """Record `action' of component `compid' lasted `duration' seconds."""
+        durations = self._entries.setdefault(action, {}).get(compid, [])
+        durations = (durations + [duration])[-self.SIZE:]
+        self._entries[action][compid] = durations
+        self._changed = True
+
+    #
+    # Estimates
+    #
+
+    def estimate(self, action, compid):
+        """Return expected duration of `action' of `compid', or None."""
+        durations = sorted(self._entries.get(action, {}).get(compid, ()))
+        if not durations:
+            return None
+        middle = len(durations) // 2
+        if len(durations) % 2:
+            return durations[middle]
+        return (durations[middle - 1] + durations[middle]) / 2.0
+
+    def remaining(self, action, compid, now):
+        """
+        Return how long `action' of `compid' should still run at `now', or
+        None if it is unknown.
+        """
+        if (action, compid) in self._ended:
+            return 0
+        expected = self.estimate(action, compid)
+        started = self._started.get((action, compid))
+        if expected is None or started is None:
+            return expected
+        return max(0, expected - (now - started))
+
+    def plan(self, graph, now=None):
+        """
+        Return (seconds, number of components without history) needed to
+        run action `graph', following its dependencies.
+
+        With `now', ended actions are not counted anymore and running
+        ones only for the time they still need.
+        """
+        parents = {}
+        todo = [graph]
+        while todo:
+            group = todo.pop()
+            for member in group:
+                parents.setdefault(member, []).append(group)
+                if isinstance(member, ActionGroup):
+                    todo.append(member)
+
+        unknown = set()
+
+        def own(action):
+            """Expected duration of a single action."""
+            if now is not None and action.status() in (ACT_OK, ACT_ERROR):
+                return 0
+            longest = 0
+            name, comps = action.timed_comps()
+            for comp in comps:
+                if now is None:
+                    duration = self.estimate(name, comp.uniqueid())
+                else:
+                    duration = self.remaining(name, comp.uniqueid(), now)
+                if duration is None:
+                    unknown.add(comp.uniqueid())
+                else:
+                    longest = max(longest, duration)
+            return longest
+
+        begins = {}
+        ends = {}
+
+        def begin(action):
+            """Expected start of `action', once its dependencies ended."""
+            if action not in begins:
+                start = 0
+                for parent in parents.get(action, ()):
+                    start = max(start, begin(parent))
+                for dep in action.deps:
+                    start = max(start, end(dep))
+                begins[action] = start
+            return begins[action]
+
+        def end(action):
+            """Expected end of `action'."""
+            if action not in ends:
+                if isinstance(action, ActionGroup):
+                    ends[action] = max([begin(action)] +
+                                       [end(member) for member in action])
+                else:
+                    ends[action] = begin(action) + own(action)
+            return ends[action]
+
+        return end(graph), len(unknown)
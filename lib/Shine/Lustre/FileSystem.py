@@ -31,28 +31,42 @@ import sys
 import socket
 import logging
 import logging.handlers
+from collections import OrderedDict
 
 from ClusterShell.MsgTree import MsgTree
 from ClusterShell.NodeSet import NodeSet
 from ClusterShell.Task import task_self
+from ClusterShell.Propagation import RouteResolvingError
 
 from Shine.Configuration.Globals import Globals
 
-from Shine.Lustre.Actions.Action import ActionGroup, ACT_ERROR
-from Shine.Lustre.Actions.Proxy import FSProxyAction
+from Shine.Lustre import ComponentError
+from Shine.Lustre.Actions.Action import ActionGroup, Result, ACT_ERROR
+from Shine.Lustre.Actions.Proxy import FSProxyAction, ProxyElem, \
+                                       ProxyDeadline
 from Shine.Lustre.Actions.Install import Install
+from Shine.Lustre.Actions.Modules import PreloadModules
+from Shine.Lustre.Actions.Barrier import StageBarrier, StageGroup, \
+                                         PlanStage
+from Shine.Lustre.Actions.Status import StatusWatch
 
 from Shine.Lustre.EventHandler import EventHandler
 from Shine.Lustre.Component import ComponentGroup
 from Shine.Lustre.Server import Server
 from Shine.Lustre.Client import Client
 from Shine.Lustre.Router import Router
+from Shine.Lustre.ProcFS import proc_snapshot
+from Shine.Lustre.StateDaemon import query_states, invalidate_states
+from Shine.Lustre.StatusCache import StatusCache
+from Shine.Lustre.DurationHistory import DurationHistory
+from Shine.Lustre.Trace import action_trace
 from Shine.Lustre.Target import MGT, MDT, OST, Journal
 # FileSystem class needs to re-export all Target status, they are used in
 # Shine.Commands.*
 from Shine.Lustre.Component import INPROGRESS, EXTERNAL, MOUNTED, \
                                    RECOVERING, OFFLINE, RUNTIME_ERROR, \
-                                   CLIENT_ERROR, TARGET_ERROR, MIGRATED
+                                   CLIENT_ERROR, TARGET_ERROR, MIGRATED, \
+                                   UNREACHABLE
 
 
 class FSError(Exception):
@@ -83,6 +97,9 @@ class FileSystem:
         self.fs_name = fs_name
         self.hdlr = event_handler or EventHandler()
         self.proxy_errors = MsgTree()
+        # Nodes which did not answer before the status deadline
+        self.unreachable = NodeSet()
+        self._deadline = None
 
         # All FS components (MGT, MDT, OST, Clients, ...)
         self.components = ComponentGroup()
@@ -93,6 +110,23 @@ class FileSystem:
         # Local server reference
         self.local_server = None
 
+        # Model action_limit values, see FSAction.resources()
+        self.action_limits = []
+
+        # Shared with other filesystems run in the same run loop, see
+        # ProxyMux.
+        self.proxy_mux = None
+
+        # Local component states given by the state daemon, see
+        # launch_status(), and whether actions could have changed them.
+        self.daemon_states = None
+        self.state_changed = False
+
+        # Action durations kept by the admin node, see enable_history(),
+        # and the graph of the last prepared actions.
+        self.durations = None
+        self._plan = None
+
         self.debug = False
         self.logger = self._setup_logging()
 
@@ -143,36 +177,40 @@ class FileSystem:
     def local_event(self, evtype, **params):
         # Currently, all event callbacks need a node.
         # When localy called, add the current node
+        if evtype == 'comp' and self.durations is not None:
+            self._record_duration(params)
         self.hdlr.local_event(evtype, **params)
 
     def distant_event(self, evtype, node, **params):
+        """Process an event received from `node'."""
+        self._distant_event(evtype, node, params)
+
+    def distant_events(self, node, events):
+        """
+        Process a batch of events received from `node'.
+
+        Events are handled in the order they were raised. The server of
+        `node' is resolved only once per component for the whole batch.
+        """
+        servers = {}
+        for params in events:
+            self._distant_event(params.pop('evtype'), node, params, servers)
+
+    def _distant_event(self, evtype, node, params, servers=None):
 
         # Update the local component instance with the provided instance
         # if one is available in params.
         if evtype == 'comp':
             other = params['info'].elem
-            other.fs = self
             try:
-                # Special hack for Journal object as they are not put in
-                # components list.
-                if other.TYPE == Journal.TYPE:
-                    other.target.fs = self
-                    target = self.components[other.target.uniqueid()]
-                    target.journal.update(other)
-                    comp = target.journal
+                if isinstance(other, ProxyElem):
+                    comp = self._update_from_fields(node, other,
+                                                    params['status'],
+                                                    servers)
+                    params['info'].elem = comp
                 else:
-                    comp = self.components[other.uniqueid()]
-                    # comp.update() updates the component state
-                    # and disk information if the component is a target.
-                    # These information don't need to be updated unless
-                    # we are on a completion event.
-                    if params['status'] not in ('start', 'progress'):
-                        # ensure other.server is the actual distant server
-                        other.server = comp.allservers().select(
-                                                            NodeSet(node))[0]
-
-                        # update target from remote one
-                        comp.update(other)
+                    comp = self._update_from_object(node, other,
+                                                    params['status'])
 
                 # substitute target parameter by local one
                 params['comp'] = comp
@@ -180,8 +218,101 @@ class FileSystem:
                 print("ERROR: Component update failed (%s)" % str(error),
                       file=sys.stderr)
 
+            if action_trace().enabled:
+                action_trace().remote_event(node, params['status'],
+                                            params['info'],
+                                            params.get('result'))
+            if self.durations is not None:
+                self._record_duration(params)
+
         self.hdlr.event_callback(evtype, node=node, **params)
 
+    def _record_duration(self, params):
+        """Keep track of component action durations, see DurationHistory."""
+        info = params['info']
+        if info.actname in ('proxy', 'status') or \
+           not hasattr(info.elem, 'uniqueid'):
+            return
+        if params['status'] == 'start':
+            self.durations.started(info.actname, info.elem.uniqueid())
+        elif params['status'] in ('done', 'failed', 'timeout'):
+            duration = None
+            if params['status'] == 'done':
+                duration = getattr(params.get('result'), 'duration', None)
+            self.durations.ended(info.actname, info.elem.uniqueid(), duration)
+
+    def enable_history(self):
+        """
+        Record action durations, to estimate how long actions take. This is
+        for the admin node, remote nodes only report them.
+        """
+        self.durations = DurationHistory(self.fs_name)
+
+    def estimate(self, graph=None, now=None):
+        """
+        Return (seconds, number of components without history) needed to run
+        `graph', by default the last prepared actions. With `now', it is the
+        time they still need, see DurationHistory.plan(). Return None if
+        durations are not recorded.
+        """
+        if graph is None:
+            graph = self._plan
+        if self.durations is None or graph is None:
+            return None
+        return self.durations.plan(graph, now)
+
+    def _update_from_object(self, node, other, status):
+        """Update the local component matching `other', a remote instance."""
+        other.fs = self
+        # Special hack for Journal object as they are not put in
+        # components list.
+        if other.TYPE == Journal.TYPE:
+            other.target.fs = self
+            target = self.components[other.target.uniqueid()]
+            target.journal.update(other)
+            return target.journal
+
+        comp = self.components[other.uniqueid()]
+        # comp.update() updates the component state
+        # and disk information if the component is a target.
+        # These information don't need to be updated unless
+        # we are on a completion event.
+        if status not in ('start', 'progress'):
+            # ensure other.server is the actual distant server
+            other.server = comp.allservers().select(NodeSet(node))[0]
+
+            # update target from remote one
+            comp.update(other)
+        return comp
+
+    def _update_from_fields(self, node, elem, status, servers=None):
+        """
+        Update the local component matching `elem', from a compact message.
+
+        If provided, `servers' caches the server matching `node' for each
+        component id.
+        """
+        # Journal are not in components list, find them through their target.
+        if elem.TYPE == Journal.TYPE:
+            tgtid = elem.uniqueid()[:-len(Journal.ID_SUFFIX)]
+            comp = self.components[tgtid].journal
+            server = comp.server
+        else:
+            comp = self.components[elem.uniqueid()]
+            server = None
+
+        # See _update_from_object()
+        if status not in ('start', 'progress'):
+            if server is None:
+                servers = {} if servers is None else servers
+                if elem.uniqueid() not in servers:
+                    servers[elem.uniqueid()] = \
+                            comp.allservers().select(NodeSet(node))[0]
+                server = servers[elem.uniqueid()]
+            comp.update_fields(server, dict(zip(comp.SERIAL_FIELDS,
+                                                elem.values)))
+        return comp
+
     def _handle_shine_proxy_error(self, nodes, message):
         """
         Store error messages, for later processing.
@@ -254,12 +385,48 @@ class FileSystem:
 
         It clears all previous proxy errors and starts task run-loop. This
         launches all FSProxyAction prepared before by example.
+
+        If remote_agent is enabled, agent sessions opened by a previous call
+        are reused, see ProxyAgent.
         """
-        self.proxy_errors = MsgTree()
+        self.run_actions([self])
+
+    @staticmethod
+    def run_actions(filesystems):
+        """
+        Start actions run-loop for all actions launched by `filesystems'.
+
+        This is how several filesystems are run at once, see launch_status().
+        """
+        for fs in filesystems:
+            fs.proxy_errors = MsgTree()
+            fs.unreachable = NodeSet()
         task_self().set_default("stderr_msgtree", False)
         task_self().set_info('connect_timeout', 
                              Globals().get_ssh_connect_timeout())
-        task_self().resume()
+        try:
+            task_self().resume()
+        except RouteResolvingError as error:
+            # In tree mode, ClusterShell gives up if all the gateways to a
+            # node have failed.
+            msg = "No gateway available: %s" % error
+            nodes = NodeSet()
+            for fs in filesystems:
+                nodes.update(fs.components.managed().allservers())
+            raise FSRemoteError(nodes, 255, msg)
+        finally:
+            # The state daemon should check them again, and cached status
+            # results are obsolete.
+            for fs in filesystems:
+                if fs._deadline is not None:
+                    fs._deadline.invalidate()
+                    fs._deadline = None
+                if fs.state_changed:
+                    invalidate_states(fs.fs_name)
+                    StatusCache(fs.fs_name).clear()
+                    fs.state_changed = False
+                if fs.durations is not None:
+                    fs.durations.save()
 
     def _check_errors(self, expected_states, components=None, actions=None):
         """
@@ -381,34 +548,96 @@ class FileSystem:
         return result
 
     def _prepare(self, action, comps=None, groupby=None, reverse=False,
-                 need_unload=False, tunings=None, allservers=False, **kwargs):
+                 need_unload=False, tunings=None, allservers=False,
+                 stages=None, depends=None, **kwargs):
         """
         Instanciate all actions for the component list and but them in a graph
         of ActionGroup().
 
         Action could be local or proxy actions.
         Components list is filtered, based on action name.
+
+        Groups of components are run one after the other. With `depends', a
+        {component: components to run before} dict, components are grouped
+        by their dependencies instead, and each group only waits for the
+        actions of the components it needs.
+
+        With `depends' and remote agents, each remote server receives all its
+        groups in a single proxy action, as the stages of a plan. A PlanStage
+        stands for each of them, see Barrier. `stages' are the groups given
+        to the remote node, which waits for the admin node before running the
+        ones needing other components.
         """
 
         graph = ActionGroup()
 
+        # Each action phase reads node state again.
+        proc_snapshot().invalidate()
+        self.state_changed |= (action != 'status')
+
         comps = comps or self.components
+        agents = Globals().get('remote_agent')
 
         first_comps = None
         last_comps = None
         localsrv = None
         modules = set()
         localcomps = None
-
-        if groupby:
-            iterable = comps.groupby(attr=groupby, reverse=reverse)
+        localgrps = []
+        localdeps = []
+
+        # Modules needed by remote servers, see _needed_modules().
+        remotemods = OrderedDict()
+        modcache = {}
+
+        # Action running each component, for `depends'.
+        holders = {}
+
+        # Groups are run one after the other.
+        ordered = depends is None and stages is None
+
+        if stages is not None:
+            # Remote part of a plan, see PlanStage. Groups which wait for
+            # the admin node are marked.
+            iterable = []
+            indexes = []
+            for stage in stages.split(';'):
+                index, labels = stage.split(':', 1)
+                indexes.append(int(index.lstrip('+')))
+                labels = NodeSet(labels)
+                key = lambda comp: comp.label in labels
+                iterable.append((index.startswith('+'),
+                                 comps.filter(key=key)))
+        elif depends is not None:
+            iterable = []
+            for _order, ordered_comps in comps.groupby(attr='START_ORDER',
+                                                       reverse=reverse):
+                bydeps = OrderedDict()
+                for comp in ordered_comps:
+                    deps = frozenset(depends.get(comp, ()))
+                    bydeps.setdefault(deps, []).append(comp)
+                iterable.extend((deps, ComponentGroup(members))
+                                for deps, members in bydeps.items())
+        elif groupby:
+            iterable = list(comps.groupby(attr=groupby, reverse=reverse))
         else:
             iterable = [(None, comps)]
 
+        # Plan mode: proxy action of each remote server.
+        plan = None
+        if depends is not None and stages is None and agents:
+            plan = OrderedDict()
+
         # Iterate over targets, grouping them by start order and server.
-        for _order, comps in iterable:
+        for index, (_key, comps) in enumerate(iterable):
 
-            graph.add(ActionGroup())
+            if stages is not None:
+                graph.add(StageGroup(self, indexes[index]))
+                # Wait for the admin node to start it.
+                if _key:
+                    graph[-1].depends_on(StageBarrier(indexes[index]))
+            else:
+                graph.add(ActionGroup())
             compgrp = ActionGroup()
             proxygrp = ActionGroup()
 
@@ -418,10 +647,29 @@ class FileSystem:
                         localsrv = srv
                         localcomps = comps
                         for comp in comps:
-                            compgrp.add(getattr(comp, action)(**kwargs))
+                            act = getattr(comp, action)(**kwargs)
+                            holders[comp] = act
+                            compgrp.add(act)
+                    elif plan is not None:
+                        if srv not in plan:
+                            plan[srv] = self._proxy_action(action,
+                                                           srv.hostname,
+                                                           ComponentGroup(),
+                                                           **kwargs)
+                        plan[srv]._comps.update(comps)
+                        stage = PlanStage(plan[srv], comps, bool(_key))
+                        holders.update((comp, stage) for comp in comps)
+                        proxygrp.add(stage)
                     else:
+                        # Agents load the modules with the action itself.
+                        if not agents:
+                            remotemods.setdefault(str(srv.hostname),
+                                                  set()).update(
+                                self._needed_modules(action, comps, modcache,
+                                                     kwargs))
                         act = self._proxy_action(action, srv.hostname,
                                                  comps, **kwargs)
+                        holders.update((comp, act) for comp in comps)
                         if tunings and tunings.filename:
                             copy = Install(srv.hostname, self, tunings.filename,
                                            comps=comps, **kwargs)
@@ -431,6 +679,8 @@ class FileSystem:
 
             if len(compgrp) > 0:
                 graph[-1].add(compgrp)
+                localgrps.append(compgrp)
+                localdeps.append(_key)
                 # Keep track of first comp group
                 if first_comps is None:
                     first_comps = compgrp
@@ -446,36 +696,154 @@ class FileSystem:
             if len(proxygrp) > 0:
                 graph[-1].add(proxygrp)
 
-
-        # Add module loading, if needed.
+        # Load all modules at once, beside the first components: they load
+        # what they need by themselves. The next ones wait for it.
         if first_comps is not None and len(modules) > 0:
-            modgrp = ActionGroup()
-            for module in modules:
-                modgrp.add(localsrv.load_modules(modname=module, **kwargs))
-
-            # Serialize modules loading actions
-            modgrp.sequential()
-
-            first_comps.parent.add(modgrp)
-            first_comps.depends_on(modgrp)
+            preload = localsrv.load_modules(modname=sorted(modules), **kwargs)
+            if ordered:
+                first_comps.parent.add(preload)
+            else:
+                graph.add(preload)
+                for compgrp, deps in zip(localgrps, localdeps):
+                    if deps:
+                        compgrp.depends_on(preload)
 
         # Apply tuning to last component group, if needed
         if tunings is not None and last_comps is not None:
             tune = localsrv.tune(tunings, localcomps, self.fs_name, **kwargs)
-            last_comps.parent.add(tune)
-            tune.depends_on(last_comps)
+            self._add_after(graph, ordered, tune, localgrps)
 
         # Add module unloading to last component group, if needed.
         if need_unload and last_comps is not None:
             unload = localsrv.unload_modules(**kwargs)
-            last_comps.parent.add(unload)
-            unload.depends_on(last_comps)
+            self._add_after(graph, ordered, unload, localgrps)
+
+        # Join the different part together. Remote stages only wait for the
+        # admin node.
+        if ordered:
+            graph.sequential()
+        elif stages is None:
+            for index, (deps, _comps) in enumerate(iterable):
+                for dep in deps:
+                    if dep in holders:
+                        graph[index].depends_on(holders[dep])
+
+        # Plan proxies run beside the stages, for all of them. They are
+        # launched first, so the remote plans start as soon as possible.
+        if plan:
+            root = ActionGroup()
+            for srv, act in plan.items():
+                if tunings and tunings.filename:
+                    copy = Install(srv.hostname, self, tunings.filename,
+                                   comps=act._comps, **kwargs)
+                    act.depends_on(copy)
+                    root.add(copy)
+                root.add(act)
+            root.add(graph)
+            graph = root
+
+        # Remote servers load their modules as soon as the command starts,
+        # nothing waits for it.
+        bymodules = OrderedDict()
+        for node, modnames in remotemods.items():
+            if modnames:
+                bymodules.setdefault(frozenset(modnames), NodeSet()).add(node)
+        if bymodules:
+            root = ActionGroup()
+            root.add(graph)
+            graph = root
+            for modnames, nodes in bymodules.items():
+                graph.add(PreloadModules(nodes, self, modnames, **kwargs))
+
+        self._plan = graph
+        if kwargs.get('dryrun') and action != 'status':
+            self._log_estimate(action, graph)
+        return graph
+
+    def _log_estimate(self, action, graph):
+        """Tell how long `graph' of `action' should take, from history."""
+        estimate = self.estimate(graph)
+        if estimate is None:
+            return
+        seconds, unknown = estimate
+        if seconds >= 100:
+            msg = "%.1f min" % (seconds / 60.0)
+        else:
+            msg = "%.1f sec" % seconds
+        msg = "Estimated %s time: %s" % (action, msg)
+        if unknown:
+            msg += " (%d component(s) without history)" % unknown
+        self.hdlr.log('info', msg)
+
+    @staticmethod
+    def _needed_modules(action, comps, cache, kwargs):
+        """
+        Return the modules needed to run `action' on `comps'. They only
+        depend on the component class, `cache' keeps them for each one.
+        """
+        modules = set()
+        for comp in comps:
+            if comp.__class__ not in cache:
+                cache[comp.__class__] = []
+                if hasattr(comp, action):
+                    act = getattr(comp, action)(**kwargs)
+                    if hasattr(act, 'needed_modules'):
+                        cache[comp.__class__] = act.needed_modules()
+            modules.update(cache[comp.__class__])
+        return modules
+
+    @staticmethod
+    def _add_after(graph, ordered, action, localgrps):
+        """
+        Add `action' to `graph', to be run after all local component groups.
+        If they are `ordered', the last one is run after the others.
+        """
+        if ordered:
+            localgrps[-1].parent.add(action)
+            action.depends_on(localgrps[-1])
+        else:
+            graph.add(action)
+            for compgrp in localgrps:
+                action.depends_on(compgrp)
 
-        # Join the different part together
-        graph.sequential()
+    @staticmethod
+    def _start_depends(comps, first_time=False):
+        """
+        Return {component: components to start before it} for `comps'.
 
-        return graph
+        Targets register with the MGS, and MDTs other than MDT0 with MDT0.
+        On first start or after a writeconf, OSTs also wait for MDT0.
+        Routers do not wait for anything.
+        """
+        mgts = set(comps.filter(key=lambda comp: comp.TYPE == MGT.TYPE))
+        mdt0 = set(comps.filter(key=lambda comp: comp.TYPE == MDT.TYPE and
+                                                 comp.index == 0))
+        depends = {}
+        for comp in comps:
+            if comp.TYPE == MDT.TYPE:
+                depends[comp] = mgts | (mdt0 - set([comp]))
+            elif comp.TYPE == OST.TYPE:
+                depends[comp] = mgts | (mdt0 if first_time else set())
+        return depends
+
+    @classmethod
+    def _stop_depends(cls, comps):
+        """
+        Return {component: components to stop before it} for `comps', the
+        reverse of start dependencies.
 
+        OSTs are also stopped after all MDTs, as they always were, so clients
+        requests are stopped on MDTs before OSTs go away.
+        """
+        depends = {}
+        for comp, needed in cls._start_depends(comps).items():
+            for other in needed:
+                depends.setdefault(other, set()).add(comp)
+        mdts = set(comps.filter(key=lambda comp: comp.TYPE == MDT.TYPE))
+        for comp in comps:
+            if comp.TYPE == OST.TYPE and mdts:
+                depends.setdefault(comp, set()).update(mdts)
+        return depends
 
     def format(self, comps=None, **kwargs):
         """Format filesystem targets."""
@@ -511,11 +879,127 @@ class FileSystem:
 
     def status(self, comps=None, **kwargs):
         """Get status of filesystem."""
+        comps = self.launch_status(comps, **kwargs)
+        self._run_actions()
+        return self.check_status(comps)
+
+    def launch_status(self, comps=None, watch=None, ready=None, daemon=False,
+                      deadline=None, **kwargs):
+        """
+        Launch status actions, without running them.
+
+        Several filesystems could be launched this way, then run together with
+        run_actions(). Return the components to give to check_status().
+
+        If `daemon' is set, local component states kept by the state daemon
+        are used, if it runs and they are recent enough.
+
+        If `watch' is set, components are checked again every `watch' seconds
+        once their status is known, and only changes are raised. `ready' is
+        then called with the components, when their initial status is known.
+        The run loop never ends, see StatusWatch.
+
+        If `deadline' is set, remote commands still running after `deadline'
+        seconds are given up. Components of these nodes are UNREACHABLE and
+        the nodes are listed in self.unreachable.
+        """
         comps = (comps or self.components).managed(supports='status')
-        actions = self._prepare('status', comps, allservers=True, **kwargs)
+        self.daemon_states = None
+        if daemon and kwargs.get('mountdata') != 'always':
+            self.daemon_states = self._query_state_daemon()
+        actions = self._prepare('status', comps, allservers=True, watch=watch,
+                                **kwargs)
+        if watch:
+            watcher = StatusWatch(self, comps, watch, ready)
+            watcher.depends_on(actions)
+        elif deadline:
+            self._deadline = task_self().timer(deadline,
+                                               handler=ProxyDeadline(),
+                                               autoclose=True)
         actions.launch()
-        self._run_actions()
+        return comps
+
+    def _query_state_daemon(self):
+        """
+        Return local component states and their age from the state daemon,
+        or None if it does not run or if they are too old.
+        """
+        answer = query_states(self.fs_name)
+        if answer is not None:
+            age = answer[0]
+            if age > 2 * Globals().get('state_interval'):
+                msg = "State daemon data are %d seconds old, checking " \
+                      "components" % age
+                self.hdlr.log('warning', msg)
+                return None
+        return answer
+
+    def cache_status(self, comps, key):
+        """
+        Record status of `comps', once checked, as `key' entry of the status
+        cache, see StatusCache.
+        """
+        StatusCache(self.fs_name).set(key, dict((comp.uniqueid(),
+                                                 comp.server_fields())
+                                                for comp in comps))
 
+    def cached_status(self, comps, key, max_age):
+        """
+        Set status of `comps' from `key' entry of the status cache, if it is
+        not older than `max_age' seconds.
+
+        Return the components to give to check_status() and the entry age,
+        or None if they are not cached.
+        """
+        comps = (comps or self.components).managed(supports='status')
+        entry = StatusCache(self.fs_name).get(key, max_age)
+        if entry is None:
+            return None
+        age, states = entry
+
+        # Components could have been changed by an update since.
+        updates = []
+        for comp in comps:
+            if comp.uniqueid() not in states:
+                return None
+            for srvname, fields in states[comp.uniqueid()].items():
+                servers = comp.allservers().select(NodeSet(srvname))
+                if not servers or len(fields) != len(comp.SERIAL_FIELDS):
+                    return None
+                updates.append((comp, servers[0], fields))
+
+        for comp, server, fields in updates:
+            comp.update_fields(server, dict(zip(comp.SERIAL_FIELDS, fields)))
+        return comps, age
+
+    def poll_status(self, comps):
+        """
+        Check local `comps' again and raise a 'status' event only for those
+        whose state changed.
+
+        This is cheaper than status(): no action is run and mountdata are not
+        read. Return the list of changed components.
+        """
+        proc_snapshot().invalidate()
+        changed = []
+        for srv, srvcomps in comps.groupbyserver(allservers=True):
+            if srv.action_enabled is not True or not srv.is_local():
+                continue
+            for comp in srvcomps:
+                before = comp.serial_fields()
+                status, result = 'done', None
+                try:
+                    comp.full_check(mountdata=False)
+                except ComponentError as error:
+                    status, result = 'failed', Result(str(error))
+                if comp.serial_fields() != before:
+                    changed.append(comp)
+                    self.local_event('comp', info=comp.status().info(),
+                                     status=status, result=result)
+        return changed
+
+    def check_status(self, comps):
+        """Return the status of `comps', once status actions are run."""
         # Here we check MOUNTED but in fact, any status is OK.
         return self._check_errors([MOUNTED], comps)
 
@@ -523,18 +1007,20 @@ class FileSystem:
         """Start Lustre file system servers."""
         comps = (comps or self.components).managed(supports='start')
 
-        # What starting order to use?
+        # Do OSTs need to wait for MDT0?
         key = lambda t: t.TYPE == MDT.TYPE
         mdt_comps = comps.filter(key=key)
         if mdt_comps:
             # Found enabled MDT(s): perform writeconf check.
             self.status(comps=mdt_comps)
+        first_time = False
         for target in mdt_comps:
             if target.has_first_time_flag() or target.has_writeconf_flag():
-                MDT.START_ORDER, OST.START_ORDER = OST.START_ORDER, MDT.START_ORDER
+                first_time = True
                 break
 
-        actions = self._prepare('start', comps, groupby='START_ORDER', **kwargs)
+        depends = self._start_depends(comps, first_time)
+        actions = self._prepare('start', comps, depends=depends, **kwargs)
         actions.launch()
         self._run_actions()
 
@@ -543,8 +1029,8 @@ class FileSystem:
     def stop(self, comps=None, **kwargs):
         """Stop file system."""
         comps = (comps or self.components).managed(supports='stop')
-        actions = self._prepare('stop', comps, groupby='START_ORDER',
-                                reverse=True, need_unload=True, **kwargs)
+        actions = self._prepare('stop', comps, reverse=True, need_unload=True,
+                                depends=self._stop_depends(comps), **kwargs)
         actions.launch()
         self._run_actions()
 
@@ -0,0 +1,347 @@
+# Mountdata.py -- On-node cache of Lustre target mountdata
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Device mountdata (target name and flags) almost never change, but reading
+them costs one 'tunefs.lustre' run per device. They are kept in a file, on
+each node, keyed by device path.
+
+An entry is only used if the device identity did not change: device number
+or inode, size, and filesystem UUID when available. Format and tunefs
+actions explicitly drop the entries of the devices they modify.
+
+When possible, mountdata are read directly from ldiskfs devices, without
+running 'tunefs.lustre'.
+"""
+
+import os
+import json
+import struct
+import tempfile
+
+from Shine.Configuration.Globals import Globals
+
+
+def device_uuid(dev, bydir='/dev/disk/by-uuid'):
+    """Return the filesystem UUID of block device `dev', or None."""
+    try:
+        names = os.listdir(bydir)
+    except OSError:
+        return None
+    realdev = os.path.realpath(dev)
+    for name in names:
+        if os.path.realpath(os.path.join(bydir, name)) == realdev:
+            return name
+    return None
+
+
+class MountdataCache(object):
+    """
+    Mountdata cache stored in `path'.
+
+    The file is read again only if it was modified by another process. It is
+    written after each change. Read or write errors are ignored: without a
+    usable cache file, mountdata are simply read from devices.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._mtime = None
+
+    def _load(self):
+        """Read the cache file if it changed since last read."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            # No file: entries in memory are kept if it could never be
+            # written. If it was removed since it was read or written, the
+            # cache was cleared, forget them too.
+            if self._mtime is not None:
+                self._entries = {}
+                self._mtime = None
+            return
+
+        if mtime != self._mtime:
+            try:
+                fobj = open(self.path)
+                try:
+                    self._entries = json.load(fobj)
+                finally:
+                    fobj.close()
+            except (IOError, ValueError):
+                self._entries = {}
+            self._mtime = mtime
+
+    def _save(self):
+        """Atomically replace the cache file with current entries."""
+        dirname = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.mountdata')
+            fobj = os.fdopen(fd, 'w')
+            try:
+                json.dump(self._entries, fobj, sort_keys=True)
+            finally:
+                fobj.close()
+            os.rename(tmpname, self.path)
+            self._mtime = os.stat(self.path).st_mtime
+        except (IOError, OSError):
+            pass
+
+    def get(self, dev, identity):
+        """
+        Return (svname, flags) of `dev' if cached for the same `identity'.
+        """
+        self._load()
+        entry = self._entries.get(dev)
+        if entry is None or entry['identity'] != list(identity):
+            return None
+        return entry['svname'], entry['flags']
+
+    def set(self, dev, identity, svname, flags):
+        """Record `dev' mountdata, read when its identity was `identity'."""
+        self._load()
+        self._entries[dev] = {'identity': list(identity),
+                              'svname': svname, 'flags': flags}
+        self._save()
+
+    def invalidate(self, dev):
+        """Forget `dev' mountdata, its content has been modified."""
+        self._load()
+        if self._entries.pop(dev, None) is not None:
+            self._save()
+
+
+_CACHES = {}
+
+def mountdata_cache():
+    """Return the cache using the configured mountdata_cache file."""
+    path = Globals().get('mountdata_cache')
+    if path not in _CACHES:
+        _CACHES[path] = MountdataCache(path)
+    return _CACHES[path]
+
+
+#
+# Native mountdata reader
+#
+
+LDD_MAGIC = 0x1dd00001
+
+class MountdataUnsupported(Exception):
+    """Device layout could not be read, 'tunefs.lustre' should be used."""
+
+
+class LdiskfsReader(object):
+    """
+    Read files of an ldiskfs (ext4) device or image, without mounting it.
+
+    Only what is needed to reach CONFIGS/mountdata is supported: block maps
+    and extent trees, linear or hashed directories. Anything else raises
+    MountdataUnsupported.
+    """
+
+    EXT_MAGIC = 0xEF53
+    EXTENT_MAGIC = 0xF30A
+    INCOMPAT_FILETYPE = 0x0002
+    INCOMPAT_META_BG = 0x0010
+    INCOMPAT_64BIT = 0x0080
+    EXTENTS_FL = 0x00080000
+    INLINE_DATA_FL = 0x10000000
+    ROOT_INO = 2
+
+    def __init__(self, fobj):
+        self._fobj = fobj
+        sblock = self._read(1024, 1024)
+        (magic,) = struct.unpack_from('<H', sblock, 56)
+        if magic != self.EXT_MAGIC:
+            raise MountdataUnsupported("not an ldiskfs device")
+
+        (self.first_data_block, log_block_size) = \
+            struct.unpack_from('<II', sblock, 20)
+        self.block_size = 1024 << log_block_size
+        (self.inodes_per_group,) = struct.unpack_from('<I', sblock, 40)
+        (rev_level,) = struct.unpack_from('<I', sblock, 76)
+        self.inode_size = 128
+        if rev_level > 0:
+            (self.inode_size,) = struct.unpack_from('<H', sblock, 88)
+        (self.incompat,) = struct.unpack_from('<I', sblock, 96)
+        if self.incompat & self.INCOMPAT_META_BG:
+            raise MountdataUnsupported("meta_bg layout")
+        self.desc_size = 32
+        if self.incompat & self.INCOMPAT_64BIT:
+            (self.desc_size,) = struct.unpack_from('<H', sblock, 254)
+
+    def _read(self, offset, size):
+        """Read `size' bytes at `offset', fail if device is too short."""
+        self._fobj.seek(offset)
+        data = self._fobj.read(size)
+        if len(data) != size:
+            raise MountdataUnsupported("short read at offset %d" % offset)
+        return data
+
+    def _block(self, blocknr):
+        return self._read(blocknr * self.block_size, self.block_size)
+
+    def _inode(self, ino):
+        """Return raw content of inode `ino'."""
+        group, index = divmod(ino - 1, self.inodes_per_group)
+        desc = self._read((self.first_data_block + 1) * self.block_size +
+                          group * self.desc_size, self.desc_size)
+        (table,) = struct.unpack_from('<I', desc, 8)
+        if self.desc_size >= 64:
+            table |= struct.unpack_from('<I', desc, 0x28)[0] << 32
+        return self._read(table * self.block_size + index * self.inode_size,
+                          128)
+
+    def _extent_blocks(self, node):
+        """Yield (logical, physical, count) of an extent tree node."""
+        magic, entries, _, depth = struct.unpack_from('<HHHH', node, 0)
+        if magic != self.EXTENT_MAGIC:
+            raise MountdataUnsupported("bad extent header")
+        for idx in range(entries):
+            offset = 12 + idx * 12
+            if depth == 0:
+                lblk, length, start_hi, start_lo = \
+                    struct.unpack_from('<IHHI', node, offset)
+                if length > 32768:
+                    # Uninitialized extent, reads as zeros
+                    continue
+                yield lblk, (start_hi << 32) | start_lo, length
+            else:
+                _, leaf_lo, leaf_hi = struct.unpack_from('<IIH', node, offset)
+                child = self._block((leaf_hi << 32) | leaf_lo)
+                for extent in self._extent_blocks(child):
+                    yield extent
+
+    def _mapped_blocks(self, iblock):
+        """Yield (logical, physical, 1) of a block map, up to double level."""
+        pointers = struct.unpack('<15I', iblock)
+        per_block = self.block_size // 4
+        lblk = 0
+        for blocknr in pointers[:12]:
+            if blocknr:
+                yield lblk, blocknr, 1
+            lblk += 1
+        for level, blocknr in ((1, pointers[12]), (2, pointers[13])):
+            if not blocknr:
+                lblk += per_block ** level
+                continue
+            for sub in struct.unpack('<%dI' % per_block, self._block(blocknr)):
+                if level == 1:
+                    if sub:
+                        yield lblk, sub, 1
+                    lblk += 1
+                elif sub:
+                    table = self._block(sub)
+                    for leaf in struct.unpack('<%dI' % per_block, table):
+                        if leaf:
+                            yield lblk, leaf, 1
+                        lblk += 1
+                else:
+                    lblk += per_block
+        if pointers[14]:
+            raise MountdataUnsupported("triple indirect blocks")
+
+    def read_file(self, ino):
+        """Return the whole content of inode `ino'."""
+        inode = self._inode(ino)
+        size_lo, = struct.unpack_from('<I', inode, 4)
+        flags, = struct.unpack_from('<I', inode, 0x20)
+        size_hi, = struct.unpack_from('<I', inode, 0x6C)
+        size = (size_hi << 32) | size_lo
+        iblock = inode[0x28:0x28 + 60]
+
+        if flags & self.INLINE_DATA_FL:
+            raise MountdataUnsupported("inline data")
+        elif flags & self.EXTENTS_FL:
+            extents = self._extent_blocks(iblock)
+        else:
+            extents = self._mapped_blocks(iblock)
+
+        data = bytearray(size)
+        for lblk, pblk, count in extents:
+            start = lblk * self.block_size
+            if start >= size:
+                continue
+            length = min(count * self.block_size, size - start)
+            data[start:start + length] = self._read(pblk * self.block_size,
+                                                    length)
+        return bytes(data)
+
+    def lookup(self, dir_ino, name):
+        """Return inode number of `name' in directory `dir_ino', or None."""
+        data = self.read_file(dir_ino)
+        offset = 0
+        while offset + 8 <= len(data):
+            ino, rec_len, name_len = struct.unpack_from('<IHH', data, offset)
+            if self.incompat & self.INCOMPAT_FILETYPE:
+                name_len &= 0xff
+            if rec_len in (0, 65535) and self.block_size == 65536:
+                rec_len = 65536
+            if rec_len < 8:
+                raise MountdataUnsupported("bad directory entry")
+            if ino and data[offset + 8:offset + 8 + name_len] == name:
+                return ino
+            offset += rec_len
+        return None
+
+    def read_path(self, path):
+        """Return content of file `path', relative to the root directory."""
+        ino = self.ROOT_INO
+        for name in path.encode().split(b'/'):
+            ino = self.lookup(ino, name)
+            if ino is None:
+                raise MountdataUnsupported("%s not found" % path)
+        return self.read_file(ino)
+
+
+def read_mountdata(dev):
+    """
+    Return (svname, flags) from the lustre_disk_data of ldiskfs device `dev'.
+
+    Raise MountdataUnsupported if they could not be read this way.
+    """
+    try:
+        fobj = open(dev, 'rb')
+    except IOError as error:
+        raise MountdataUnsupported(str(error))
+    try:
+        try:
+            ldd = LdiskfsReader(fobj).read_path('CONFIGS/mountdata')
+        except (IOError, struct.error) as error:
+            raise MountdataUnsupported(str(error))
+    finally:
+        fobj.close()
+
+    # struct lustre_disk_data: magic, compat, rocompat, incompat, config_ver,
+    # flags, svindex, mount_type, fsname[64], svname[64], ...
+    if len(ldd) < 160:
+        raise MountdataUnsupported("mountdata too short")
+    magic, = struct.unpack_from('<I', ldd, 0)
+    if magic != LDD_MAGIC:
+        raise MountdataUnsupported("bad mountdata magic")
+    flags, = struct.unpack_from('<I', ldd, 20)
+    svname = ldd[96:160].split(b'\0', 1)[0]
+    if not isinstance(svname, str):
+        svname = svname.decode()
+    return svname, flags
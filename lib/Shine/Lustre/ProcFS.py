@@ -0,0 +1,227 @@
+# ProcFS.py -- Snapshot of Lustre related procfs and sysfs content
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Snapshot of the procfs and sysfs files read by component checks.
+
+Each source (/proc/mounts, /proc/partitions, /proc/modules, Lustre obd
+directories, ...) is read once, on first use, and indexed. All components
+checked during the same action phase share the same snapshot.
+
+The snapshot should be invalidated when the node state could have changed:
+at the beginning of each action phase and when a command has been run.
+"""
+
+import os
+from glob import glob
+
+
+class ProcSnapshot(object):
+    """
+    Lazily read and index Lustre related procfs and sysfs content.
+
+    `root' is prepended to all paths, for testing purpose.
+    """
+
+    # Current state is at the beginning of import state files, do not
+    # read their whole history.
+    STATE_HEAD_SIZE = 512
+
+    def __init__(self, root=''):
+        self.root = root
+        self._cache = {}
+
+    def invalidate(self):
+        """Forget everything, next queries will read files again."""
+        self._cache.clear()
+
+    def _get(self, name, builder):
+        """Return `name' index, building it if needed."""
+        if name not in self._cache:
+            self._cache[name] = builder()
+        return self._cache[name]
+
+    def _lines(self, path):
+        """Return the lines of `path', or nothing if it does not exist."""
+        try:
+            fobj = open(self.root + path)
+        except IOError:
+            return []
+        try:
+            return fobj.readlines()
+        finally:
+            fobj.close()
+
+    def _glob(self, pattern):
+        """Return paths matching `pattern', without root."""
+        return [path[len(self.root):] for path in glob(self.root + pattern)]
+
+    #
+    # /proc/mounts
+    #
+
+    def _build_mounts(self):
+        bydev = {}
+        bypath = {}
+        for line in self._lines('/proc/mounts'):
+            fields = line.split(' ', 3)
+            if len(fields) < 3:
+                continue
+            dev, mntpt, fstype = fields[:3]
+            bydev.setdefault(dev, []).append((mntpt, fstype))
+            bypath.setdefault(mntpt, []).append((dev, fstype))
+        return bydev, bypath
+
+    def mounts_by_device(self, dev):
+        """Return (mount point, fs type) list for all mounts of `dev'."""
+        return self._get('mounts', self._build_mounts)[0].get(dev, [])
+
+    def mounts_by_path(self, mntpt):
+        """Return (device, fs type) list for all mounts on `mntpt'."""
+        return self._get('mounts', self._build_mounts)[1].get(mntpt, [])
+
+    #
+    # /proc/partitions
+    #
+
+    def _build_partitions(self):
+        partitions = {}
+        for line in self._lines('/proc/partitions'):
+            d_info = line.split()
+            if len(d_info) == 4 and d_info[2].isdigit():
+                partitions[d_info[3]] = int(d_info[2])
+        return partitions
+
+    def partition_size(self, name):
+        """Return the size in bytes of partition `name', or None."""
+        blocks = self._get('partitions', self._build_partitions).get(name)
+        if blocks is None:
+            return None
+        return blocks * 1024
+
+    #
+    # /proc/modules
+    #
+
+    def _build_modules(self):
+        modules = {}
+        for line in self._lines('/proc/modules'):
+            fields = line.split(' ', 3)
+            if len(fields) == 4:
+                modules[fields[0]] = int(fields[2])
+        return modules
+
+    def modules(self):
+        """Return a dict of loaded modules and their usage count."""
+        return self._get('modules', self._build_modules)
+
+    #
+    # Lustre obd devices
+    #
+
+    def _build_obds(self):
+        obds = {}
+        # Since Lustre 2.13, mntdev is in sysfs. Since Lustre 2.4, more than
+        # one path could exist for the same label. The first one is fine.
+        for name in ('mntdev', 'recovery_status'):
+            paths = {}
+            for base in ('/sys/fs/lustre', '/proc/fs/lustre'):
+                if name == 'recovery_status' and base.startswith('/sys'):
+                    continue
+                found = {}
+                for path in self._glob('%s/*/*/%s' % (base, name)):
+                    found.setdefault(path.split('/')[-2], []).append(path)
+                for label, labelpaths in found.items():
+                    paths.setdefault(label, labelpaths)
+            obds[name] = paths
+        return obds
+
+    def obd_paths(self, label, name):
+        """
+        Return paths of file `name' (mntdev or recovery_status) of Lustre
+        device `label'.
+        """
+        return self._get('obds', self._build_obds)[name].get(label, [])
+
+    def read_obd_file(self, path):
+        """Return the first line of `path', as read by obd_paths()."""
+        lines = self._lines(path)
+        return lines and lines[0].rstrip('\n') or ''
+
+    #
+    # Lustre client devices
+    #
+
+    def _current_state(self, path):
+        """Return the current_state of import `path', reading its head only."""
+        try:
+            fobj = open(self.root + path)
+        except IOError:
+            return None
+        try:
+            head = fobj.read(self.STATE_HEAD_SIZE)
+        finally:
+            fobj.close()
+        for line in head.splitlines():
+            if line.startswith('current_state:'):
+                return line.split(None, 1)[1].strip()
+        return None
+
+    def _build_clients(self):
+        clilov = {}
+        for path in self._glob('/proc/fs/lustre/lov/*-clilov-*'):
+            fsname = os.path.basename(path).split('-clilov-')[0]
+            clilov.setdefault(fsname, []).append(path)
+
+        # Import directories are named <label>-<osc|mdc>-<mount instance>
+        imports = {}
+        for path in self._glob('/proc/fs/lustre/??c/*-*/state'):
+            dirname = path.split('/')[-2]
+            fsname = dirname.split('-', 1)[0]
+            label, _, instance = dirname.rsplit('-', 2)
+            state = self._current_state(path)
+            if state is None:
+                continue
+            counts, others = imports.setdefault(fsname, {}).setdefault(
+                                                        instance, ({}, []))
+            counts[state] = counts.get(state, 0) + 1
+            if state != 'FULL':
+                others.append((label, state))
+        return clilov, imports
+
+    def clilov(self, fsname):
+        """Return /proc/fs/lustre/lov paths of `fsname' clients."""
+        return self._get('clients', self._build_clients)[0].get(fsname, [])
+
+    def import_states(self, fsname):
+        """
+        Return import states of `fsname' clients, for each mount instance.
+
+        For each instance, state counts and (target label, state) list of
+        imports which are not FULL are returned.
+        """
+        return self._get('clients', self._build_clients)[1].get(fsname, {})
+
+
+_SNAPSHOT = ProcSnapshot()
+
+def proc_snapshot():
+    """Return the snapshot shared by all components."""
+    return _SNAPSHOT
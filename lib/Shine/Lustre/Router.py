@@ -25,7 +25,8 @@ Classes for Shine framework to manage Lustre LNET routers.
 import os 
 
 from Shine.Lustre.Component import Component, ComponentError, \
-                                   MOUNTED, OFFLINE, TARGET_ERROR, RUNTIME_ERROR
+                                   MOUNTED, OFFLINE, TARGET_ERROR, \
+                                   RUNTIME_ERROR, UNREACHABLE
 
 from Shine.Lustre.Actions.StartRouter import StartRouter
 from Shine.Lustre.Actions.StopRouter import StopRouter
@@ -49,7 +50,8 @@ class Router(Component):
         OFFLINE: "offline", 
         TARGET_ERROR: "ERROR", 
         MOUNTED: "online", 
-        RUNTIME_ERROR: "CHECK FAILURE" 
+        RUNTIME_ERROR: "CHECK FAILURE",
+        UNREACHABLE: "unreachable"
     }
 
     def longtext(self):
@@ -28,6 +28,7 @@ from ClusterShell.Task import NodeSet
 
 from Shine.Lustre import ServerError
 from Shine.Lustre.EventHandler import EventHandler
+from Shine.Lustre.ProcFS import proc_snapshot
 from Shine.Lustre.Actions.Modules import LoadModules, UnloadModules
 from Shine.Lustre.Actions.Tune import Tune
 
@@ -147,14 +148,9 @@ class Server(object):
         It analyzes which Lustre module is loaded and keeps it in self.modules
         """
         self.modules.clear()
-        try:
-            modlist = open('/proc/modules')
-            for line in modlist:
-                modname, _, count, _ = line.split(' ', 3)
-                if modname in ('libcfs', 'lustre', 'ldiskfs', 'fsfilt_ldiskfs'):
-                    self.modules[modname] = int(count)
-        finally:
-            modlist.close()
+        for modname, count in proc_snapshot().modules().items():
+            if modname in ('libcfs', 'lustre', 'ldiskfs', 'fsfilt_ldiskfs'):
+                self.modules[modname] = count
     #
     # Inprogress action methods
     #
@@ -0,0 +1,186 @@
+# StateDaemon.py -- Local component states kept up to date for status
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+A 'shine daemon' process, running on a server, keeps the state of its local
+components and answers status requests on a Unix socket (state_socket), so a
+status does not need to check them again.
+
+Each filesystem is loaded on its first request. Its local components are then
+checked every state_interval seconds, running a regular status, and when a
+shine command run on this node has changed them.
+
+Requests and answers are JSON lines:
+    {"fsname": NAME}        ->  {"age": SECONDS, "comps": {ID: FIELDS}}
+    {"invalidate": NAME}    ->  {}
+FIELDS are the values of component SERIAL_FIELDS, as in compact messages.
+"""
+
+import os
+import json
+import time
+import errno
+import select
+import socket
+
+from Shine.Configuration.Globals import Globals
+
+
+# Do not wait for a busy daemon, components could be checked instead.
+CLIENT_TIMEOUT = 2.0
+
+
+class StateDaemon(object):
+    """
+    Keep local component states of filesystems returned by `loader', a
+    function called with a filesystem name, and answer requests on `path'.
+    """
+
+    def __init__(self, path, interval, loader):
+        self.path = path
+        self.interval = interval
+        self.loader = loader
+        # For each filesystem name: FileSystem, components, last refresh time
+        self._filesystems = {}
+        self._sock = None
+
+    def listen(self):
+        """Create the Unix socket, replacing the one of a previous daemon."""
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        try:
+            os.unlink(self.path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(16)
+
+    def close(self):
+        """Remove the socket."""
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def serve(self):
+        """Answer requests and refresh states, until killed."""
+        self.listen()
+        try:
+            while True:
+                self.handle()
+        finally:
+            self.close()
+
+    def handle(self):
+        """Wait for a request until next refresh, then do what is due."""
+        timeout = None
+        if self._filesystems:
+            nextrefresh = min(entry[2] for entry in self._filesystems.values())
+            timeout = max(0, nextrefresh + self.interval - time.time())
+        if select.select([self._sock], [], [], timeout)[0]:
+            conn = self._sock.accept()[0]
+            try:
+                self._answer(conn)
+            except Exception:
+                # A bad request or a gone client should not stop the daemon.
+                pass
+            finally:
+                conn.close()
+
+        now = time.time()
+        for fsname, entry in self._filesystems.items():
+            if entry[2] + self.interval <= now:
+                self.refresh(fsname)
+
+    def _answer(self, conn):
+        """Read a request on `conn' and send the answer."""
+        conn.settimeout(CLIENT_TIMEOUT)
+        request = json.loads(conn.makefile('rb').readline().decode())
+        if 'invalidate' in request:
+            if request['invalidate'] in self._filesystems:
+                # Refreshed as soon as the answer is sent
+                self._filesystems[request['invalidate']][2] = 0
+            answer = {}
+        else:
+            answer = self.states(str(request['fsname']))
+        conn.sendall((json.dumps(answer, separators=(',', ':')) +
+                      '\n').encode())
+
+    def states(self, fsname):
+        """Return the answer to a request for `fsname' states."""
+        if fsname not in self._filesystems:
+            try:
+                fs = self.loader(fsname)
+            except Exception as error:
+                return {'error': str(error)}
+            comps = fs.components.managed(supports='status')
+            self._filesystems[fsname] = [fs, comps, 0]
+            self.refresh(fsname)
+
+        fs, comps, last = self._filesystems[fsname]
+        states = dict((comp.uniqueid(), comp.serial_fields())
+                      for srv, srvcomps in comps.groupbyserver(allservers=True)
+                      if srv.action_enabled is True and srv.is_local()
+                      for comp in srvcomps)
+        return {'age': time.time() - last, 'comps': states}
+
+    def refresh(self, fsname):
+        """Check `fsname' local components again, running a status."""
+        fs, comps, _ = self._filesystems[fsname]
+        fs.status(comps)
+        self._filesystems[fsname][2] = time.time()
+
+
+def _request(request):
+    """Send `request' to the state daemon, return its answer or None."""
+    path = Globals().get('state_socket')
+    if not path:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CLIENT_TIMEOUT)
+    try:
+        try:
+            sock.connect(path)
+            sock.sendall((json.dumps(request) + '\n').encode())
+            return json.loads(sock.makefile('rb').readline().decode())
+        except Exception:
+            # Whatever the daemon does, components are checked instead.
+            return None
+    finally:
+        sock.close()
+
+def query_states(fsname):
+    """
+    Return (age, {component id: fields}) of `fsname' local components, as
+    kept by the state daemon, or None if it could not answer.
+    """
+    answer = _request({'fsname': fsname})
+    if answer is None or 'comps' not in answer:
+        return None
+    return answer['age'], answer['comps']
+
+def invalidate_states(fsname):
+    """Tell the state daemon `fsname' local components have changed."""
+    _request({'invalidate': fsname})
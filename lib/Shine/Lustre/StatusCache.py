@@ -0,0 +1,112 @@
+# StatusCache.py -- Admin node cache of filesystem status results
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Status results are kept on the admin node, so 'shine status --max-age' run
+again a few seconds later does not contact all servers.
+
+Each filesystem has its own file in status_dir. Entries are keyed by the
+component selection and the view. For each component, they give the fields
+reported by each of its servers, see Component.server_fields(). Entries
+expire after status_cache_ttl seconds, 0 disables the cache.
+
+Any action other than status run on a filesystem removes its file, see
+FileSystem.run_actions().
+"""
+
+import os
+import json
+import time
+import tempfile
+
+from Shine.Configuration.Globals import Globals
+
+
+class StatusCache(object):
+    """
+    Status results of filesystem `fsname'.
+
+    Read or write errors are ignored: without a usable cache file, status
+    is simply checked on servers.
+    """
+
+    def __init__(self, fsname):
+        self.path = os.path.join(Globals().get_status_dir(),
+                                 '%s.cache' % fsname)
+        self.ttl = Globals().get('status_cache_ttl')
+
+    def _load(self):
+        """Return all entries of the cache file."""
+        try:
+            fobj = open(self.path)
+            try:
+                return json.load(fobj)
+            finally:
+                fobj.close()
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        """Atomically replace the cache file with `entries'."""
+        dirname = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.status')
+            fobj = os.fdopen(fd, 'w')
+            try:
+                json.dump(entries, fobj, sort_keys=True)
+            finally:
+                fobj.close()
+            os.rename(tmpname, self.path)
+        except (IOError, OSError):
+            pass
+
+    def get(self, key, max_age):
+        """
+        Return (age, {component id: {server name: fields}}) of `key' entry,
+        if it is not older than `max_age' seconds. Otherwise, return None.
+        """
+        if not self.ttl:
+            return None
+        entry = self._load().get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry['time']
+        if age < 0 or age > min(max_age, self.ttl):
+            return None
+        return age, entry['comps']
+
+    def set(self, key, comps):
+        """Record `comps' fields for `key', dropping expired entries."""
+        if not self.ttl:
+            return
+        now = time.time()
+        entries = dict((name, entry) for name, entry in self._load().items()
+                       if 0 <= now - entry['time'] <= self.ttl)
+        entries[key] = {'time': now, 'comps': comps}
+        self._save(entries)
+
+    def clear(self):
+        """Forget all entries, filesystem state has changed."""
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -20,7 +20,6 @@
 
 import os
 import stat
-from glob import glob
 
 from ClusterShell.NodeSet import NodeSet
 
@@ -33,8 +32,9 @@ from Shine.Lustre.Disk import Disk, DiskDeviceError
 from Shine.Lustre.Component import Component, ComponentError, \
                                    MOUNTED, EXTERNAL, RECOVERING, OFFLINE, \
                                    TARGET_ERROR, RUNTIME_ERROR, INACTIVE, \
-                                   MIGRATED
+                                   MIGRATED, UNREACHABLE
 from Shine.Lustre.Server import Server, ServerGroup
+from Shine.Lustre.ProcFS import proc_snapshot
 from operator import itemgetter
 from itertools import groupby
 
@@ -55,9 +55,14 @@ class Target(Component, Disk):
         MOUNTED:       "online", 
         RUNTIME_ERROR: "CHECK FAILURE",
         INACTIVE:      "inactive",
-        MIGRATED:      "migrated"
+        MIGRATED:      "migrated",
+        UNREACHABLE:   "unreachable"
     }
 
+    # Only the state of the sending node is meaningful, see update_fields().
+    SERIAL_FIELDS = ('local_state', 'recov_info', 'index') + \
+                    Disk.SERIAL_FIELDS
+
     def __init__(self, fs, server, index, dev, jdev=None, group=None,
             tag=None, enabled=True, mode='managed', network=None,
             active='yes'):
@@ -139,6 +144,10 @@ class Target(Component, Disk):
             else:
                 return RECOVERING
 
+        # It could be started on a server which did not answer.
+        elif UNREACHABLE in sdict:
+            return UNREACHABLE
+
         elif OFFLINE in sdict:
             return OFFLINE
 
@@ -176,6 +185,12 @@ class Target(Component, Disk):
             if self._states[nodename] is None:
                 self._states[nodename] = RUNTIME_ERROR
 
+    def mark_unreachable(self, nodes):
+        """`nodes' did not answer in time, their target state is unknown."""
+        for nodename in nodes:
+            if self._states.get(nodename) is None:
+                self._states[nodename] = UNREACHABLE
+
     def update(self, other):
         """
         Update my serializable fields from other/distant object.
@@ -198,6 +213,31 @@ class Target(Component, Disk):
                   "\tTo avoid this, please synchronize shine versions."
             self.fs._handle_shine_proxy_error(srvname, msg)
 
+    def server_fields(self):
+        """
+        Return SERIAL_FIELDS values, as sent by each server, keyed by server
+        name.
+        """
+        result = {}
+        for srvname, state in self._states.items():
+            result[srvname] = [state if name == 'local_state'
+                               else getattr(self, name)
+                               for name in self.SERIAL_FIELDS]
+        return result
+
+    def update_fields(self, server, fields):
+        """
+        Update my serializable fields from a dict sent by `server'.
+
+        This is the compact message version of update().
+        """
+        srvname = str(server.hostname)
+        self._states[srvname] = fields.pop('local_state', None)
+        recov_info = fields.pop('recov_info', None)
+        if self._states[srvname] == RECOVERING:
+            self.recov_info = recov_info
+        Component.update_fields(self, server, fields)
+
     def add_server(self, server):
         assert isinstance(server, Server)
         self.failservers.append(server)
@@ -325,6 +365,39 @@ class Target(Component, Disk):
         # check for Lustre level status
         self.lustre_check()
 
+    def mountdata_command(self):
+        return Disk.mountdata_command(self)
+
+    def mountdata_cached(self):
+        """
+        Use cached mountdata, if any. Return False if they should be read.
+        """
+        try:
+            return self._mountdata_cached(self.label)
+        except DiskDeviceError as error:
+            self.local_state = TARGET_ERROR
+            raise ComponentError(self, str(error))
+
+    def mountdata_read(self):
+        """
+        Read mountdata without running mountdata_command(), if possible.
+        """
+        try:
+            return self._mountdata_read(self.label)
+        except DiskDeviceError as error:
+            self.local_state = TARGET_ERROR
+            raise ComponentError(self, str(error))
+
+    def mountdata_result(self, output, retcode):
+        """
+        Analyze mountdata read by running mountdata_command() asynchronously.
+        """
+        try:
+            self._mountdata_parse(output, retcode, self.label)
+        except DiskDeviceError as error:
+            self.local_state = TARGET_ERROR
+            raise ComponentError(self, str(error))
+
     def lustre_check(self):
         """
         Check target health at Lustre level.
@@ -335,11 +408,9 @@ class Target(Component, Disk):
         # find lustre parameters in procfs or sysfs
         # (Since Lustre 2.4, more than one path could be returned.
         #  The first one is fine. Since 2.13 it will be in sysfs.)
-        mntdev_path = glob('/sys/fs/lustre/*/%s/mntdev' % self.label)
-        if len(mntdev_path) == 0:
-            mntdev_path = glob('/proc/fs/lustre/*/%s/mntdev' % self.label)
-
-        recov_path = glob('/proc/fs/lustre/*/%s/recovery_status' % self.label)
+        snapshot = proc_snapshot()
+        mntdev_path = snapshot.obd_paths(self.label, 'mntdev')
+        recov_path = snapshot.obd_paths(self.label, 'recovery_status')
         assert len(recov_path) <= 1
 
         # check for label presence in /proc : is this lustre target started?
@@ -351,28 +422,19 @@ class Target(Component, Disk):
                                        "/proc/fs/lustre for %s" % self.label)
         else:
             # get target's real device
-            fproc = open(mntdev_path[0])
-            try:
-                self.mntdev = fproc.readline().rstrip('\n')
-            finally:
-                fproc.close()
+            self.mntdev = snapshot.read_obd_file(mntdev_path[0])
 
             loaded = True
 
             # check for presence in /proc/mounts
-            f_proc_mounts = open("/proc/mounts", 'r')
-            try:
-                for line in f_proc_mounts:
-                    if line.find("%s " % self.mntdev) == 0:
-                        if line.split(' ', 3)[2] == "lustre":
-                            if loaded:
-                                self.local_state = MOUNTED
-                            else:
-                                self.local_state = TARGET_ERROR
-                                raise ComponentError(self, "multiple " \
-                                        " mounts detected for %s" % self.label)
-            finally:
-                f_proc_mounts.close()
+            for _, fstype in snapshot.mounts_by_device(self.mntdev):
+                if fstype == "lustre":
+                    if loaded:
+                        self.local_state = MOUNTED
+                    else:
+                        self.local_state = TARGET_ERROR
+                        raise ComponentError(self, "multiple " \
+                                " mounts detected for %s" % self.label)
 
             if self.local_state != MOUNTED and loaded:
                 self.local_state = TARGET_ERROR
@@ -391,7 +453,7 @@ class Target(Component, Disk):
             if self.local_state == MOUNTED and self.TYPE != MGT.TYPE:
                 # check for MDT or OST recovery (MGS doesn't make any recovery)
                 try:
-                    fproc = open(recov_path[0], 'r')
+                    fproc = open(snapshot.root + recov_path[0], 'r')
                 except (IOError, IndexError):
                     self.local_state = TARGET_ERROR
                     raise ComponentError(self, "recovery_state file not " \
@@ -547,6 +609,9 @@ class Journal(Component):
 
     TYPE = 'journal'
 
+    # Appended to the target unique id to build the journal one.
+    ID_SUFFIX = '_jdev'
+
     def __init__(self, target, device):
         Component.__init__(self, target.fs, target.server,
                            target.action_enabled, target._mode)
@@ -558,7 +623,7 @@ class Journal(Component):
         return self.uniqueid()
 
     def uniqueid(self):
-        return "%s_jdev" % self.target.uniqueid()
+        return "%s%s" % (self.target.uniqueid(), self.ID_SUFFIX)
 
     def longtext(self):
         return "%s journal (%s)" % (self.target.get_id(), self.dev)
@@ -0,0 +1,324 @@
+# Trace.py -- Timing trace of the actions run by a command
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""
+Timing trace of the actions run by a command, see 'shine --trace'.
+
+Once enabled, the trace records when each action starts and ends, on the
+local node, and when each remote sub-action starts and ends, from the events
+sent by remote nodes. The time until the first message of a remote node is
+recorded as its connection phase: it covers the ssh connection and the
+start of the remote shine.
+
+The trace is written in the Chrome trace event format, which could be
+opened with chrome://tracing or Perfetto. Dependencies between actions are
+flow events. summary() gives the critical path and the slowest components.
+"""
+
+import time
+import json
+from collections import OrderedDict
+
+from Shine.Lustre.EventHandler import hostname_short
+
+
+class Span(object):
+    """Time range of an action, run by process `pid' on track `tid'."""
+
+    def __init__(self, name, cat, pid, tid, start):
+        self.name = name
+        self.cat = cat
+        self.pid = pid
+        self.tid = tid
+        self.start = start
+        self.end = None
+        self.status = None
+        # Local action, and whether it is a group or runs a component
+        self.action = None
+        self.group = False
+        self.comp = False
+
+    @property
+    def duration(self):
+        """Span duration in seconds, 0 if it did not end."""
+        if self.end is None:
+            return 0
+        return self.end - self.start
+
+
+class ActionTrace(object):
+    """
+    Action timings of the current command. Nothing is recorded unless
+    enable() is called.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = None
+        # Local actions, in start order
+        self._spans = OrderedDict()
+        # Remote sub-actions, by (node, description)
+        self._remote = OrderedDict()
+        # Connection phase, by (proxy action, node)
+        self._connects = OrderedDict()
+
+    def enable(self):
+        """Start recording."""
+        self.enabled = True
+        self.origin = time.time()
+
+    #
+    # Recording
+    #
+
+    def begin(self, action):
+        """`action' is running."""
+        if action in self._spans:
+            return
+        # Actions module imports this one.
+        from Shine.Lustre.Actions.Action import ActionGroup
+        comp = getattr(action, 'comp', None)
+        name = action.trace_name()
+        span = Span(name, action.NAME, hostname_short(),
+                    comp.label if comp is not None else name, time.time())
+        span.action = action
+        span.group = isinstance(action, ActionGroup)
+        span.comp = comp is not None
+        self._spans[action] = span
+
+    def end(self, action, ok):
+        """`action' has ended, successfully if `ok' is True."""
+        span = self._spans.get(action)
+        if span is not None:
+            span.end = time.time()
+            span.status = 'ok' if ok else 'error'
+
+    def remote_event(self, node, status, info, result=None):
+        """A 'comp' event with `status' and `info' was sent by `node'."""
+        if info.actname == 'proxy' or status not in ('start', 'done',
+                                                     'failed', 'timeout'):
+            return
+        now = time.time()
+        key = (node, str(info))
+        if status == 'start':
+            label = getattr(info.elem, 'label', None) or info.actname
+            self._remote[key] = Span(str(info), info.actname, node, label,
+                                     now)
+            self._remote[key].comp = True
+            return
+
+        span = self._remote.get(key)
+        if span is None or span.end is not None:
+            # Start message not seen, use the duration given by the node.
+            duration = getattr(result, 'duration', None) or 0
+            label = getattr(info.elem, 'label', None) or info.actname
+            span = Span(str(info), info.actname, node, label, now - duration)
+            span.comp = True
+            self._remote[key] = span
+        span.end = now
+        span.status = status
+
+    def remote_output(self, action, node):
+        """First message of `node' for proxy `action'."""
+        key = (action, node)
+        if key in self._connects or action not in self._spans:
+            return
+        span = Span('connect for %s' % action.action, 'connect', node,
+                    'connect', self._spans[action].start)
+        span.end = time.time()
+        span.status = 'ok'
+        self._connects[key] = span
+
+    #
+    # Analysis
+    #
+
+    def _parents(self):
+        """Return {action: groups it is a member of}."""
+        parents = {}
+        for span in self._spans.values():
+            if span.group:
+                for member in span.action:
+                    parents.setdefault(member, []).append(span.action)
+        return parents
+
+    def _blocker(self, action):
+        """
+        Return the span of the non-group action which ended `action' the
+        last: itself, or one of its members for a group.
+        """
+        span = self._spans.get(action)
+        while span is not None and span.group:
+            members = [self._spans[member] for member in span.action
+                       if member in self._spans and
+                       self._spans[member].end is not None]
+            if not members:
+                return None
+            span = max(members, key=lambda member: member.end)
+        if span is None or span.end is None:
+            return None
+        return span
+
+    def _waits(self, action, parents):
+        """Return actions `action' or the groups it belongs to depend on."""
+        waits = set()
+        seen = set()
+        todo = [action]
+        while todo:
+            current = todo.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            waits.update(current.deps)
+            todo.extend(parents.get(current, ()))
+        return waits
+
+    def critical_path(self):
+        """
+        Return the spans of the chain of local actions which ended the last.
+        Each of them waited for the previous one to end.
+        """
+        leaves = [span for span in self._spans.values()
+                  if not span.group and span.end is not None]
+        if not leaves:
+            return []
+        parents = self._parents()
+        span = max(leaves, key=lambda leaf: leaf.end)
+        path = [span]
+        while True:
+            blockers = [self._blocker(dep)
+                        for dep in self._waits(span.action, parents)]
+            blockers = [blocker for blocker in blockers
+                        if blocker is not None and blocker.end <= span.start]
+            if not blockers:
+                break
+            span = max(blockers, key=lambda blocker: blocker.end)
+            path.append(span)
+        path.reverse()
+        return path
+
+    def slowest(self, count):
+        """Return the spans of the `count' slowest component actions."""
+        spans = [span for span in self._spans.values()
+                 if span.comp and span.end is not None]
+        spans += [span for span in self._remote.values()
+                  if span.end is not None]
+        spans.sort(key=lambda span: span.duration, reverse=True)
+        return spans[:count]
+
+    def summary(self, count=10):
+        """Return the critical path and the slowest components, as text."""
+        lines = []
+        path = self.critical_path()
+        if path:
+            lines.append("Critical path: %.1f s" %
+                         (path[-1].end - path[0].start))
+            for span in path:
+                lines.append("  %7.1f s %+7.1f s  %s" %
+                             (span.start - self.origin, span.duration,
+                              span.name))
+        slowest = self.slowest(count)
+        if slowest:
+            lines.append("Slowest components:")
+            for span in slowest:
+                lines.append("  %7.1f s  %s on %s" % (span.duration,
+                                                      span.name, span.pid))
+        return '\n'.join(lines)
+
+    #
+    # Chrome trace format
+    #
+
+    def _timestamp(self, when):
+        """Return `when' in microseconds since the trace start."""
+        return int((when - self.origin) * 1e6)
+
+    def chrome_events(self):
+        """Return the list of Chrome trace events."""
+        events = []
+        pids = {}
+        tids = {}
+
+        def ids(span):
+            """Return Chrome process and thread ids of `span'."""
+            if span.pid not in pids:
+                pids[span.pid] = len(pids) + 1
+                events.append({'ph': 'M', 'name': 'process_name',
+                               'pid': pids[span.pid],
+                               'args': {'name': span.pid}})
+            if (span.pid, span.tid) not in tids:
+                tids[(span.pid, span.tid)] = len(tids) + 1
+                events.append({'ph': 'M', 'name': 'thread_name',
+                               'pid': pids[span.pid],
+                               'tid': tids[(span.pid, span.tid)],
+                               'args': {'name': span.tid}})
+            return pids[span.pid], tids[(span.pid, span.tid)]
+
+        spans = [span for span in self._spans.values() if not span.group]
+        spans += list(self._connects.values()) + list(self._remote.values())
+        for span in spans:
+            if span.end is None:
+                continue
+            pid, tid = ids(span)
+            events.append({'ph': 'X', 'name': span.name, 'cat': span.cat,
+                           'ts': self._timestamp(span.start),
+                           'dur': self._timestamp(span.end) -
+                                  self._timestamp(span.start),
+                           'pid': pid, 'tid': tid,
+                           'args': {'status': span.status}})
+
+        # Dependencies, from the action which released each of them.
+        parents = self._parents()
+        flow = 0
+        for span in self._spans.values():
+            if span.group or span.end is None:
+                continue
+            for dep in self._waits(span.action, parents):
+                blocker = self._blocker(dep)
+                if blocker is None:
+                    continue
+                flow += 1
+                pid, tid = ids(blocker)
+                events.append({'ph': 's', 'name': 'depends',
+                               'cat': 'dependency', 'id': flow,
+                               'ts': self._timestamp(blocker.end),
+                               'pid': pid, 'tid': tid})
+                pid, tid = ids(span)
+                events.append({'ph': 'f', 'bp': 'e', 'name': 'depends',
+                               'cat': 'dependency', 'id': flow,
+                               'ts': self._timestamp(span.start),
+                               'pid': pid, 'tid': tid})
+        return events
+
+    def save(self, path):
+        """Write the trace to `path', in Chrome trace format."""
+        fobj = open(path, 'w')
+        try:
+            json.dump({'traceEvents': self.chrome_events(),
+                       'displayTimeUnit': 'ms'}, fobj)
+        finally:
+            fobj.close()
+
+
+_TRACE = ActionTrace()
+
+def action_trace():
+    """Return the trace of the current command."""
+    return _TRACE
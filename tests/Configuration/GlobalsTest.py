@@ -7,7 +7,8 @@
 
 import unittest
 
-from Shine.Configuration.Globals import Globals
+from Shine.Configuration.Globals import Globals, ActionLimit, ActionRetry
+from Shine.Configuration.ModelFile import ModelFileValueError
 
 
 class GlobalsTest(unittest.TestCase):
@@ -31,3 +32,34 @@ class GlobalsTest(unittest.TestCase):
         conf.add('lustre_version', '1.8.5')
         self.assertFalse(conf.lustre_version_is_smaller('1.6.7'))
         self.assertTrue(conf.lustre_version_is_smaller('2.0.0.1'))
+
+    def test_action_limit(self):
+        """test action_limit values are checked"""
+        conf = Globals()
+        conf.add('action_limit', 'format,fsck  group 2')
+        self.assertEqual(conf.get('action_limit'), ['format,fsck group 2'])
+        self.assertEqual(ActionLimit.split('* server 1'), (None, 'server', 1))
+        for value in ('format group', 'format rack 1', 'format group 0',
+                      'format group two'):
+            self.assertRaises(ModelFileValueError, conf.add, 'action_limit',
+                              value)
+        del conf['action_limit']
+
+    def test_action_retry(self):
+        """test action_retry values are checked"""
+        conf = Globals()
+        conf.add('action_retry', 'mount,start 3 2 *  Device or  busy')
+        self.assertEqual(conf.get('action_retry'),
+                         ['mount,start 3 2 *  Device or  busy'])
+        actions, attempts, delay, retcodes, pattern = \
+                ActionRetry.split(conf.get('action_retry')[0])
+        self.assertEqual((actions, attempts, delay, retcodes),
+                         (frozenset(['mount', 'start']), 3, 2.0, None))
+        self.assertEqual(pattern.pattern, 'Device or  busy')
+        self.assertEqual(ActionRetry.split('* 2 0.5 16,255'),
+                         (None, 2, 0.5, frozenset([16, 255]), None))
+        for value in ('mount 3 2', 'mount 0 2 *', 'mount 3 -1 *',
+                      'mount three 2 *', 'mount 3 2 EBUSY', 'mount 3 2 * (('):
+            self.assertRaises(ModelFileValueError, conf.add, 'action_retry',
+                              value)
+        del conf['action_retry']
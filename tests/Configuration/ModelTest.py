@@ -60,6 +60,18 @@ mgt: node=foo1 dev=/dev/sda active=nocreate""")
 mgt: node=foo1 dev=/dev/sda active=no""")
         self.assertEqual(model.get('mgt')[0].get('active'), 'no')
 
+    def test_action_limit(self):
+        """Test action_limit option."""
+        model = self.makeTempModel("""fs_name: limit
+action_limit: format,fsck group 2
+action_limit: * server 4""")
+        self.assertEqual(model.get('action_limit'),
+                         ['format,fsck group 2', '* server 4'])
+
+        testfile = makeTempFile("""fs_name: limit
+action_limit: format array 2""")
+        self.assertRaises(ModelFileValueError, Model().load, testfile.name)
+
     def test_unbalanced_nid_map(self):
         """size mismatch in nid_map raises an exception"""
         model = Model()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Shine.Controller test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit tests for Controller"""
+
+import os
+import sys
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from ClusterShell.Task import task_self
+
+from Shine.Controller import Controller
+from Shine.FSUtils import _SERVERS
+from Shine.Lustre.Actions.Action import CommonAction, MountdataProbe, \
+                                        ResourceLimits
+from Shine.Lustre.Actions.Proxy import FSProxyAction, \
+                                       shine_msg_pack_request, \
+                                       shine_msg_pack_end
+
+
+class LeakyController(Controller):
+    """
+    Record the state seen by each request, then leave some behind, as a
+    request which failed in the middle of its run loop would.
+    """
+
+    def __init__(self):
+        Controller.__init__(self)
+        self.seen = []
+
+    def run_command(self, args=None):
+        self.seen.append((task_self().info('fanout'),
+                          len(CommonAction._ready), CommonAction._launching,
+                          len(MountdataProbe._pending),
+                          MountdataProbe._running,
+                          dict(ResourceLimits._used),
+                          len(FSProxyAction._running), len(_SERVERS)))
+        rc = Controller.run_command(self, args)
+        CommonAction._ready.append(CommonAction())
+        CommonAction._launching = True
+        MountdataProbe._pending.append(None)
+        MountdataProbe._running = 2
+        ResourceLimits._used['dev:/dev/sda'] = 1
+        FSProxyAction._running.add(None)
+        _SERVERS['foo1'] = None
+        return rc
+
+
+class AgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self._fanout = task_self().info('fanout')
+        self._stdin = sys.stdin
+        self._stdout = sys.stdout
+
+    def tearDown(self):
+        if sys.stdin is not self._stdin:
+            sys.stdin.close()
+        sys.stdin = self._stdin
+        sys.stdout = self._stdout
+        task_self().set_info('fanout', self._fanout)
+        CommonAction.reset_all()
+        MountdataProbe.reset_all()
+        ResourceLimits.reset_all()
+        FSProxyAction.reset_all()
+        _SERVERS.clear()
+
+    def test_requests_are_independent(self):
+        """agent requests do not see what the previous one has left"""
+        # Agent reads its file descriptor
+        rfd, wfd = os.pipe()
+        requests = shine_msg_pack_request(['--fanout=3', 'show', 'conf']) + \
+                   shine_msg_pack_request(['show', 'conf'])
+        os.write(wfd, requests.encode())
+        os.close(wfd)
+        sys.stdin = os.fdopen(rfd)
+        sys.stdout = output = StringIO()
+        controller = LeakyController()
+        fanout = task_self().info('fanout')
+        self.assertEqual(controller.run_agent(), 0)
+        sys.stdout = self._stdout
+
+        clean = (fanout, 0, False, 0, 0, {}, 0, 0)
+        self.assertEqual(controller.seen, [clean, clean])
+        self.assertEqual(output.getvalue().count(shine_msg_pack_end(0)), 2)
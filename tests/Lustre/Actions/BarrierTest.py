@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# Copyright (C) 2015 CEA
+#
+# This file is part of shine
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+"""Unit test for plan barriers."""
+
+import os
+import unittest
+
+from ClusterShell.NodeSet import NodeSet
+from ClusterShell.Task import task_self
+
+from Shine.Lustre.EventHandler import EventHandler
+from Shine.Lustre.FileSystem import FileSystem
+from Shine.Lustre.Component import ComponentGroup
+from Shine.Lustre.Server import Server
+from Shine.Lustre.Actions.Action import ACT_OK, ACT_ERROR, ACT_RUNNING, \
+                                        ACT_WAITING
+from Shine.Lustre.Actions.Proxy import shine_msg_pack_barrier, \
+                                       shine_msg_pack_request
+from Shine.Lustre.Actions.Barrier import AdminInput, StageBarrier, \
+                                         StageGroup, PlanStage
+
+
+class FakeProxy(object):
+    """Record the answers sent by plan stages."""
+
+    def __init__(self, nodes):
+        self.action = 'start'
+        self.nodes = NodeSet(nodes)
+        self.stages = {}
+        self.answers = []
+
+    def answer(self, index, go):
+        self.answers.append((index, go))
+
+
+class FakeAdmin(object):
+    """Admin node which never answers."""
+
+    def wait(self, barrier):
+        pass
+
+
+class StageBarrierTest(unittest.TestCase):
+
+    def setUp(self):
+        rfd, self.wfd = os.pipe()
+        self.admin = AdminInput(os.fdopen(rfd))
+
+    def tearDown(self):
+        # Do not leave the input reader in the run loop, if a test failed.
+        if self.admin._worker is not None:
+            self.admin._worker.abort()
+        if self.wfd is not None:
+            os.close(self.wfd)
+        self.admin.stream.close()
+
+    def send(self, data, close=False):
+        os.write(self.wfd, data.encode())
+        if close:
+            os.close(self.wfd)
+            self.wfd = None
+
+    def test_answer_first(self):
+        """answer received with a request is kept for its barrier"""
+        self.send(shine_msg_pack_request(['start']) +
+                  shine_msg_pack_barrier(3, True))
+        self.assertEqual(self.admin.readline(),
+                         shine_msg_pack_request(['start']))
+        barrier = StageBarrier(3, self.admin)
+        barrier.launch()
+        self.assertEqual(barrier.status(), ACT_OK)
+
+    def test_wait(self):
+        """barrier waits in the run loop, other lines are kept"""
+        barrier1 = StageBarrier(1, self.admin)
+        barrier2 = StageBarrier(2, self.admin)
+        barrier1.launch()
+        barrier2.launch()
+        self.assertEqual(barrier1.status(), ACT_RUNNING)
+
+        # Answers could be split anywhere
+        answer = shine_msg_pack_barrier(2, False)
+        self.send(shine_msg_pack_barrier(1, True) + answer[:10])
+        self.send(answer[10:] + shine_msg_pack_request(['stop']))
+        task_self().run()
+        self.assertEqual(barrier1.status(), ACT_OK)
+        self.assertEqual(barrier2.status(), ACT_ERROR)
+        self.assertEqual(self.admin.readline(),
+                         shine_msg_pack_request(['stop']))
+
+    def test_closed(self):
+        """barrier stops if admin is gone"""
+        barrier = StageBarrier(0, self.admin)
+        barrier.launch()
+        self.send(shine_msg_pack_request(['start']), close=True)
+        task_self().run()
+        self.assertEqual(barrier.status(), ACT_ERROR)
+        self.assertEqual(self.admin.readline(),
+                         shine_msg_pack_request(['start']))
+        self.assertEqual(self.admin.readline(), '')
+
+        barrier = StageBarrier(1, self.admin)
+        barrier.launch()
+        self.assertEqual(barrier.status(), ACT_ERROR)
+
+
+class StageGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        class RecordEH(EventHandler):
+            def __init__(eh):
+                eh.events = []
+            def event_callback(eh, evtype, **kwargs):
+                eh.events.append((evtype, kwargs.get('index'),
+                                  kwargs.get('ok')))
+        self.fs = FileSystem('stage', RecordEH())
+
+    def test_done(self):
+        """stage group reports its end"""
+        group = StageGroup(self.fs, 4)
+        group.launch()
+        self.assertEqual(group.status(), ACT_OK)
+        self.assertEqual(self.fs.hdlr.events, [('stage', 4, True)])
+
+    def test_aborted(self):
+        """stage group reports it was aborted"""
+        group = StageGroup(self.fs, 2)
+        barrier = StageBarrier(2, FakeAdmin())
+        group.depends_on(barrier)
+        group.launch()
+        barrier.answer(False)
+        self.assertEqual(group.status(), ACT_ERROR)
+        self.assertEqual(self.fs.hdlr.events, [('stage', 2, False)])
+
+
+class PlanStageTest(unittest.TestCase):
+
+    def setUp(self):
+        fs = FileSystem('plan')
+        ost = fs.new_target(Server('foo1', ['foo1@tcp']), 'ost', 0, '/dev/ost')
+        self.comps = ComponentGroup([ost])
+        self.proxy = FakeProxy('foo1')
+
+    def test_description(self):
+        """stages are described with their index and labels"""
+        stage1 = PlanStage(self.proxy, self.comps, False)
+        stage2 = PlanStage(self.proxy, self.comps, True)
+        self.assertEqual(stage2.index, stage1.index + 1)
+        self.assertEqual(self.proxy.stages, {stage1.index: stage1,
+                                             stage2.index: stage2})
+        self.assertEqual(str(stage1), '%d:plan-OST0000' % stage1.index)
+        self.assertEqual(str(stage2), '+%d:plan-OST0000' % stage2.index)
+
+    def test_go(self):
+        """waiting stage is started once launched"""
+        stage = PlanStage(self.proxy, self.comps, True)
+        self.assertEqual(self.proxy.answers, [])
+        stage.launch()
+        self.assertEqual(self.proxy.answers, [(stage.index, True)])
+        self.assertEqual(stage.status(), ACT_RUNNING)
+        stage.done(True)
+        self.assertEqual(stage.status(), ACT_OK)
+
+    def test_no_wait(self):
+        """stage without dependencies is not answered"""
+        stage = PlanStage(self.proxy, self.comps, False)
+        stage.launch()
+        stage.done(False)
+        self.assertEqual(stage.status(), ACT_ERROR)
+        self.assertEqual(self.proxy.answers, [])
+
+    def test_dependency_error(self):
+        """remote stage is aborted if the components it needs failed"""
+        dep = PlanStage(self.proxy, self.comps, False)
+        stage = PlanStage(self.proxy, self.comps, True)
+        stage.depends_on(dep)
+        stage.launch()
+        self.assertEqual(stage.status(), ACT_WAITING)
+        dep.launch()
+        dep.done(False)
+        self.assertEqual(stage.status(), ACT_ERROR)
+        self.assertEqual(self.proxy.answers, [(stage.index, False)])
+
+    def test_plan_ended(self):
+        """stage is on error if the remote plan ended without running it"""
+        dep = PlanStage(self.proxy, self.comps, False)
+        stage = PlanStage(self.proxy, self.comps, True)
+        stage.depends_on(dep)
+        stage.done(False)
+        dep.launch()
+        dep.done(True)
+        self.assertEqual(stage.status(), ACT_ERROR)
+        self.assertEqual(self.proxy.answers, [(stage.index, True)])
@@ -24,6 +24,7 @@ from Shine.Lustre.Actions.Fsck import Fsck
 from Shine.Lustre.Actions.Format import JournalFormat, Format, Tunefs
 from Shine.Lustre.Actions.Execute import Execute
 from Shine.Lustre.Actions.Proxy import FSProxyAction
+from Shine.Lustre.Actions.Modules import LoadModules
 
 class ActionsTest(unittest.TestCase):
 
@@ -52,6 +53,31 @@ class ActionsTest(unittest.TestCase):
         self.assertEqual(sorted(action.needed_modules()), [])
         self.check_cmd(action, "/sbin/modprobe ptlrpc")
 
+    #
+    # Modules
+    #
+
+    def test_load_modules(self):
+        """test command line load modules"""
+        self.check_cmd(LoadModules(self.srv1), "modprobe lustre")
+        self.check_cmd(LoadModules(self.srv1, modname='lnet',
+                                   options='networks=tcp0'),
+                       'modprobe lnet  "networks=tcp0"')
+
+    def test_load_modules_batch(self):
+        """test command line load several modules at once"""
+        action = LoadModules(self.srv1, modname=['ldiskfs', 'lustre'])
+        self.assertEqual(str(action.info()), "load modules 'ldiskfs, lustre'")
+        self.check_cmd(action, "modprobe -a ldiskfs lustre")
+        self.assertEqual(action._already_done(), None)
+
+        # Loaded modules are skipped
+        self.srv1.modules['lustre'] = 1
+        self.check_cmd(action, "modprobe ldiskfs")
+        self.srv1.modules['ldiskfs'] = 1
+        self.assertEqual(str(action._already_done()),
+                         "'ldiskfs, lustre' is already loaded")
+
     def test_stop_router(self):
         """test command line stop router"""
         rtr = self.fs.new_router(self.srv1)
@@ -746,19 +772,22 @@ class ActionsTest(unittest.TestCase):
     def test_simple_proxy(self):
         """test proxy with minimal arguments"""
         action = self._create_proxy(debug=False)
-        self.check_cmd(action, 'nosetests dummy -f action -R')
+        self.check_cmd(action, 'env SHINE_MSG_VERSION=4 '
+                               'nosetests dummy -f action -R')
 
     def test_proxy_debug(self):
         """test proxy with debug"""
         action = self._create_proxy(debug=True)
-        self.check_cmd(action, 'nosetests dummy -f action -R -d')
+        self.check_cmd(action, 'env SHINE_MSG_VERSION=4 '
+                               'nosetests dummy -f action -R -d')
 
     def test_proxy_comps(self):
         """test proxy with a component list"""
         self.fs.new_router(self.srv1)
         self.fs.new_client(self.srv1, "/foo")
         action = self._create_proxy(debug=False, comps=self.fs.components)
-        self.check_cmd(action, 'nosetests dummy -f action -R'
+        self.check_cmd(action, 'env SHINE_MSG_VERSION=4 '
+                               'nosetests dummy -f action -R'
                                ' -l action-client,action-router')
 
     def test_proxy_comps_addopts(self):
@@ -767,7 +796,8 @@ class ActionsTest(unittest.TestCase):
         self.fs.new_client(self.srv1, "/foo")
         action = self._create_proxy(debug=False, comps=self.fs.components,
                                     addopts="-y")
-        self.check_cmd(action, "nosetests dummy -f action -R"
+        self.check_cmd(action, "env SHINE_MSG_VERSION=4 "
+                               "nosetests dummy -f action -R"
                                " -l action-client,action-router -o '-y'")
 
     def test_proxy_comps_failover(self):
@@ -776,26 +806,31 @@ class ActionsTest(unittest.TestCase):
         self.fs.new_client(self.srv1, "/foo")
         action = self._create_proxy(debug=False, comps=self.fs.components,
                                     failover=NodeSet('failnode'))
-        self.check_cmd(action, "nosetests dummy -f action -R"
+        self.check_cmd(action, "env SHINE_MSG_VERSION=4 "
+                               "nosetests dummy -f action -R"
                                " -l action-client,action-router -F 'failnode'")
 
     def test_proxy_comps_mountdata_never(self):
         """test proxy with a component list and mountdata=never"""
         action = self._create_proxy(debug=False, mountdata='never')
-        self.check_cmd(action, "nosetests dummy -f action -R"
+        self.check_cmd(action, "env SHINE_MSG_VERSION=4 "
+                               "nosetests dummy -f action -R"
                                " --mountdata=never")
 
     def test_proxy_comps_mountdata_auto(self):
         """test proxy with a component list and mountdata=auto"""
         action = self._create_proxy(debug=False, mountdata='auto')
-        self.check_cmd(action, "nosetests dummy -f action -R")
+        self.check_cmd(action, "env SHINE_MSG_VERSION=4 "
+                               "nosetests dummy -f action -R")
 
     def test_proxy_fanout(self):
         """test proxy with fanout"""
         action = self._create_proxy(debug=False, fanout=18)
-        self.check_cmd(action, 'nosetests dummy -f action -R --fanout=18')
+        self.check_cmd(action, 'env SHINE_MSG_VERSION=4 '
+                               'nosetests dummy -f action -R --fanout=18')
 
     def test_proxy_dryrun(self):
         """test proxy with dryrun"""
         action = self._create_proxy(debug=False, dryrun=True)
-        self.check_cmd(action, 'nosetests dummy -f action -R --dry-run')
+        self.check_cmd(action, 'env SHINE_MSG_VERSION=4 '
+                               'nosetests dummy -f action -R --dry-run')
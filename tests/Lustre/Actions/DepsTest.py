@@ -42,6 +42,23 @@ class TestAction(CommonAction):
         self.launch()
         task_self().run()
 
+class NoopAction(CommonAction):
+    """Action ending as soon as it is launched, or when end() is called."""
+
+    def __init__(self, result=ACT_OK, wait=False):
+        CommonAction.__init__(self)
+        self.result = result
+        self.wait = wait
+        self.launched = 0
+
+    def _launch(self):
+        self.launched += 1
+        if not self.wait:
+            self.end()
+
+    def end(self):
+        self.set_status(self.result)
+
 
 class DepsTests(unittest.TestCase):
 
@@ -521,3 +538,60 @@ class ActionGroupTests(unittest.TestCase):
         self.assertEqual(grp1.status(), ACT_ERROR)
         self.assertEqual(act2.status(), ACT_WAITING)
         self.assertEqual(grp2.status(), ACT_ERROR)
+
+class LargeGraphTests(unittest.TestCase):
+
+    def test_long_chain(self):
+        """A long chain of actions does not recurse"""
+        grp = ActionGroup()
+        for _ in range(5000):
+            grp.add(NoopAction())
+        grp.sequential()
+        grp.launch()
+        self.assertEqual(grp.status(), ACT_OK)
+        self.assertEqual([act.launched for act in grp], [1] * 5000)
+
+    def test_large_group(self):
+        """A group ends once all its members have ended, in any order"""
+        grp = ActionGroup()
+        for index in range(1000):
+            grp.add(NoopAction(wait=True))
+        after = NoopAction()
+        after.depends_on(grp)
+        after.launch()
+        self.assertEqual(grp.status(), ACT_WAITING)
+
+        for act in list(grp)[::-1][:-1]:
+            act.end()
+        self.assertEqual(grp.status(), ACT_WAITING)
+        self.assertEqual(after.status(), ACT_WAITING)
+        grp[0].end()
+        self.assertEqual(grp.status(), ACT_OK)
+        self.assertEqual(after.status(), ACT_OK)
+        self.assertEqual(set(act.launched for act in grp), set([1]))
+
+    def test_nested_group_error(self):
+        """An error in a nested group reaches the top group"""
+        top = ActionGroup()
+        for index in range(10):
+            grp = ActionGroup()
+            for _ in range(10):
+                grp.add(NoopAction())
+            top.add(grp)
+        grp.add(NoopAction(ACT_ERROR))
+        top.launch()
+        self.assertEqual(top[0].status(), ACT_OK)
+        self.assertEqual(grp.status(), ACT_ERROR)
+        self.assertEqual(top.status(), ACT_ERROR)
+
+    def test_dep_added_once_pulled(self):
+        """A dependency added after a launch is launched too"""
+        act1 = NoopAction(wait=True)
+        act2 = NoopAction()
+        act2.depends_on(act1)
+        act2.launch()
+        act3 = NoopAction()
+        act2.depends_on(act3)
+        act1.end()
+        self.assertEqual(act3.status(), ACT_OK)
+        self.assertEqual(act2.status(), ACT_OK)
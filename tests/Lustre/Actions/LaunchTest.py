@@ -20,15 +20,22 @@
 
 import os
 import copy
+import shutil
 import types
 import unittest
+from subprocess import Popen, PIPE, STDOUT
+
 import Utils
 
+from ClusterShell.NodeSet import NodeSet
 
+from Shine.Configuration.Globals import Globals
 from Shine.Configuration.TuningModel import TuningModel
 
-from Shine.Lustre.Actions.Action import ACT_OK, ACT_ERROR
+from Shine.Lustre.Actions.Action import ACT_OK, ACT_ERROR, action_timeout, \
+                                        retry_policy
 from Shine.Lustre.Actions.Install import Install
+from Shine.Lustre.Actions.Modules import PreloadModules
 from Shine.Lustre.EventHandler import EventHandler
 from Shine.Lustre.Server import Server
 from Shine.Lustre.FileSystem import FileSystem
@@ -290,6 +297,81 @@ class TargetActionTest(CommonTestCase):
         self.assertEqual(result.retcode, 1)
         self.assertEqual(self.tgt.state, OFFLINE)
 
+    def test_execute_timeout(self):
+        """Execute a command longer than its timeout fails"""
+        act = self.tgt.execute(addopts='sleep 5', mountdata='never')
+        act.timeout = 1
+        self.check_base(self.tgt, 'comp', act, ACT_ERROR,
+                        ['start', 'timeout'],
+                        'execute of MGS (%s)' % self.tgt.dev)
+        self.assertEqual(self.tgt.state, OFFLINE)
+
+    def test_action_timeout(self):
+        """Action timeouts come from <action>_timeout settings"""
+        Globals().replace('mount_timeout', 20)
+        try:
+            self.assertEqual(action_timeout('mount'), 20)
+            Globals().replace('mount_timeout', 0)
+            self.assertEqual(action_timeout('mount'), None)
+        finally:
+            del Globals()['mount_timeout']
+        self.assertEqual(action_timeout('mount'), None)
+        self.assertEqual(action_timeout('execute'), None)
+
+    def test_execute_retry(self):
+        """Execute a command failing once with a transient error"""
+        marker = Utils.makeTempFilename()
+        os.unlink(marker)
+        Globals().add('action_retry', 'execute 2 0 3,16 busy')
+        try:
+            act = self.tgt.execute(addopts='test -e %s || { touch %s; '
+                                   'echo busy; exit 16; }' % (marker, marker),
+                                   mountdata='never')
+            result = self.check_base(self.tgt, 'comp', act, ACT_OK,
+                                     ['start', 'progress', 'done'],
+                                     'execute of MGS (%s)' % self.tgt.dev)
+        finally:
+            del Globals()['action_retry']
+            os.unlink(marker)
+        self.assertEqual(result.retcode, 0)
+        self.assertEqual(act.retries, 1)
+        retry = self.eh.result('comp', 'execute', 'progress')
+        self.assertEqual((retry.attempt, retry.attempts, retry.retcode),
+                         (2, 2, 16))
+        self.assertEqual(str(retry), 'attempt 2/2 in 0.0s: busy')
+
+    def test_execute_retry_exhausted(self):
+        """Execute a command failing more than allowed retries"""
+        Globals().add('action_retry', '* 3 0 *')
+        try:
+            act = self.tgt.execute(addopts='/bin/false', mountdata='never')
+            result = self.check_base(self.tgt, 'comp', act, ACT_ERROR,
+                                     ['start', 'progress', 'failed'],
+                                     'execute of MGS (%s)' % self.tgt.dev)
+        finally:
+            del Globals()['action_retry']
+        self.assertEqual(result.retcode, 1)
+        self.assertEqual(act.retries, 2)
+
+    def test_retry_policy(self):
+        """Retry policies come from action_retry settings"""
+        self.assertEqual(retry_policy('mount'), None)
+        Globals().add('action_retry', '* 2 1 255')
+        Globals().add('action_retry', 'mount 3 1 * EBUSY')
+        try:
+            policy = retry_policy('mount')
+            self.assertEqual(policy.attempts, 3)
+            self.assertTrue(policy.retryable(1, 'mount: EBUSY'))
+            self.assertFalse(policy.retryable(1, 'mount: EINVAL'))
+            self.assertTrue(0.5 <= policy.backoff(2) <= 1)
+            self.assertTrue(1 <= policy.backoff(3) <= 2)
+            policy = retry_policy('start')
+            self.assertEqual(policy.attempts, 2)
+            self.assertTrue(policy.retryable(255, ''))
+            self.assertFalse(policy.retryable(1, ''))
+        finally:
+            del Globals()['action_retry']
+
     @Utils.rootonly
     def test_execute_check_mountdata(self):
         """Execute a command with mountdata check"""
@@ -626,6 +708,42 @@ class ServerActionTest(CommonTestCase):
         self.assertEqual(result.retcode, None)
         self.assertEqual(sorted(self.srv.modules.keys()), ['libcfs', 'lustre'])
 
+    @Utils.rootonly
+    def test_module_load_batch(self):
+        """Load several modules at once, skipping loaded ones"""
+        self.srv.load_modules().launch()
+        self.fs._run_actions()
+        self.eh.clear()
+
+        act = self.srv.load_modules(modname=['ldiskfs', 'lustre'])
+        self.check_base(self.srv, 'server', act, ACT_OK, ['start', 'done'],
+                        "load modules 'ldiskfs, lustre'")
+        self.assertEqual(self.eh.msglist, ['[RUN] modprobe ldiskfs'])
+        self.assertEqual(sorted(self.srv.modules.keys()),
+                         ['ldiskfs', 'libcfs', 'lustre'])
+
+    def test_module_preload_dryrun(self):
+        """Preload remote modules in dry-run mode"""
+        act = PreloadModules(NodeSet(Utils.HOSTNAME), self.fs,
+                             ['lustre', 'ldiskfs'], dryrun=True)
+        self.mock_shell(act)
+        act.launch()
+        self.fs._run_actions()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(self.eh.msglist,
+                         ['[RUN] modprobe -a ldiskfs lustre on %s' %
+                          Utils.HOSTNAME])
+
+    @Utils.rootonly
+    def test_module_preload_error(self):
+        """Preload failures are only logged"""
+        act = PreloadModules(NodeSet(Utils.HOSTNAME), self.fs, ['ERROR'])
+        act.launch()
+        self.fs._run_actions()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertTrue(self.eh.msglist[-1].startswith(
+                         "%s: module preload failed [rc=" % Utils.HOSTNAME))
+
     @Utils.rootonly
     def test_module_unload(self):
         """Unload modules"""
@@ -869,6 +987,20 @@ class TuneActionTest(CommonTestCase):
                          "'echo -n 1 > /proc/modules' failed\n"
                          "'echo -n 1 > /proc/cmdline' failed")
 
+    def test_tune_write(self):
+        """Apply tunings writes values like the shell would"""
+        tmp1 = Utils.makeTempFile('old')
+        tmp2 = Utils.makeTempFile('')
+        self.model.create_parameter(tmp1.name, 42, node_type_list=['mgs'])
+        self.model.create_parameter(tmp2.name, '"/tmp/toto space.log"',
+                                    node_type_list=['mgs'])
+
+        act = self.srv.tune(self.model, self.fs.components, 'action')
+        self.check_base(self.srv, 'server', act, ACT_OK, ['start', 'done'],
+                        'apply tunings')
+        self.assertEqual(open(tmp1.name).read(), '42')
+        self.assertEqual(open(tmp2.name).read(), '/tmp/toto space.log')
+
 
 class InstallActionTest(CommonTestCase):
 
@@ -964,3 +1096,191 @@ class InstallActionTest(CommonTestCase):
 
         # Status checks
         self.assertEqual(act.status(), ACT_ERROR)
+
+
+class MountdataProbeTest(CommonTestCase):
+
+    # Fake tunefs.lustre: device file name is the target label. A lock
+    # directory detects probes running at the same time.
+    TUNEFS = """#!/bin/sh
+mkdir "$(dirname $2)/lock" 2>/dev/null || exit 3
+sleep 0.1
+echo "   Target:     $(basename $2)"
+echo "   Flags:      0x20"
+rmdir "$(dirname $2)/lock"
+"""
+
+    def setUp(self):
+        CommonTestCase.setUp(self)
+        self.srv = Server(Utils.HOSTNAME, ["%s@tcp" % Utils.HOSTNAME],
+                          hdlr=self.eh)
+        self.fs.local_server = self.srv
+        self.tmpdir = Utils.make_tempdir()
+        tunefs = os.path.join(self.tmpdir, 'tunefs.lustre')
+        open(tunefs, 'w').write(self.TUNEFS)
+        os.chmod(tunefs, 0o755)
+        Globals().replace('command_path', self.tmpdir)
+        Globals().replace('mountdata_fanout', 1)
+        Globals().replace('mountdata_cache',
+                          os.path.join(self.tmpdir, 'cache', 'mountdata'))
+
+    def tearDown(self):
+        del Globals()['command_path']
+        del Globals()['mountdata_fanout']
+        del Globals()['mountdata_cache']
+        shutil.rmtree(self.tmpdir)
+
+    def new_target(self, tgttype, index, label):
+        dev = os.path.join(self.tmpdir, label)
+        open(dev, 'w').close()
+        return self.fs.new_target(self.srv, tgttype, index, dev)
+
+    def test_probes_limited(self):
+        """mountdata of several targets are read within the limit"""
+        tgts = [self.new_target('ost', idx, 'action-OST%04x' % idx)
+                for idx in range(4)]
+        acts = [tgt.execute(addopts='/bin/true', mountdata='always')
+                for tgt in tgts]
+        for act in acts:
+            act.launch()
+        self.fs._run_actions()
+
+        for tgt, act in zip(tgts, acts):
+            self.assertEqual(act.status(), ACT_OK)
+            self.assertEqual(tgt.ldd_svname, tgt.label)
+            self.assertEqual(tgt.flags(), ['first_time'])
+
+    def test_probe_failure(self):
+        """a bad mountdata only fails its own target"""
+        good = self.new_target('ost', 0, 'action-OST0000')
+        bad = self.new_target('ost', 1, 'action-OST0003')
+        goodact = good.execute(addopts='/bin/true', mountdata='always')
+        badact = bad.execute(addopts='/bin/true', mountdata='always')
+        badact.launch()
+        goodact.launch()
+        self.fs._run_actions()
+
+        self.assertEqual(badact.status(), ACT_ERROR)
+        self.assertEqual(bad.state, TARGET_ERROR)
+        self.assertEqual(goodact.status(), ACT_OK)
+
+    def test_cached_mountdata(self):
+        """mountdata are cached unless --mountdata=always"""
+        tgt = self.new_target('ost', 0, 'action-OST0000')
+        act = tgt.status(mountdata='always')
+        act.launch()
+        self.fs._run_actions()
+        self.assertEqual(act.status(), ACT_OK)
+
+        # Without tunefs.lustre, only cached values could be used.
+        os.unlink(os.path.join(self.tmpdir, 'tunefs.lustre'))
+        tgt._ldd_flags = 0
+        act = tgt.status()
+        act.launch()
+        self.fs._run_actions()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(tgt.flags(), ['first_time'])
+
+        act = tgt.status(mountdata='always')
+        act.launch()
+        self.fs._run_actions()
+        self.assertEqual(act.status(), ACT_ERROR)
+
+    def test_native_mountdata(self):
+        """ldiskfs mountdata are read without tunefs.lustre"""
+        srcdir = os.path.join(self.tmpdir, 'src', 'CONFIGS')
+        os.makedirs(srcdir)
+        open(os.path.join(srcdir, 'mountdata'), 'wb').write(
+            Utils.make_ldd('action-OST0000', 0x2))
+        tgt = self.new_target('ost', 0, 'action-OST0000')
+        process = Popen(['/sbin/mke2fs', '-q', '-F', '-t', 'ext4', '-d',
+                         os.path.dirname(srcdir), tgt.dev, '8M'],
+                        stdout=PIPE, stderr=STDOUT)
+        process.communicate()
+        self.assertEqual(process.returncode, 0)
+        os.unlink(os.path.join(self.tmpdir, 'tunefs.lustre'))
+
+        act = tgt.status(mountdata='always')
+        act.launch()
+        self.fs._run_actions()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(tgt.flags(), [])
+
+
+class ResourceLimitsTest(CommonTestCase):
+
+    # Record how many commands run at the same time. A lock directory per
+    # group detects commands of the same group running together.
+    CMD = 'mkdir %(dir)s/lock-%(group)s || exit 3; touch %(dir)s/run/%%label;' \
+          ' ls %(dir)s/run | wc -l >> %(dir)s/log; sleep 0.2;' \
+          ' rm %(dir)s/run/%%label; rmdir %(dir)s/lock-%(group)s'
+
+    def setUp(self):
+        CommonTestCase.setUp(self)
+        self.srv = Server(Utils.HOSTNAME, ["%s@tcp" % Utils.HOSTNAME],
+                          hdlr=self.eh)
+        self.fs.local_server = self.srv
+        self.tmpdir = Utils.make_tempdir()
+        os.mkdir(os.path.join(self.tmpdir, 'run'))
+
+    def tearDown(self):
+        del Globals()['action_limit']
+        shutil.rmtree(self.tmpdir)
+
+    def run_groups(self, groups):
+        """Run one command per target of `groups', return the actions."""
+        acts = []
+        for idx, group in enumerate(groups):
+            dev = os.path.join(self.tmpdir, 'ost%d' % idx)
+            open(dev, 'w').close()
+            tgt = self.fs.new_target(self.srv, 'ost', idx, dev, group=group)
+            cmd = self.CMD % {'dir': self.tmpdir, 'group': group}
+            acts.append(tgt.execute(addopts=cmd))
+        for act in acts:
+            act.launch()
+        self.fs._run_actions()
+        return acts
+
+    def counts(self):
+        return [int(line) for line in open(os.path.join(self.tmpdir, 'log'))]
+
+    def test_group_limit(self):
+        """commands of a group are serialized, groups run in parallel"""
+        Globals().add('action_limit', 'execute group 1')
+        acts = self.run_groups(['g1', 'g1', 'g2', 'g2'])
+        self.assertEqual([act.status() for act in acts], [ACT_OK] * 4)
+        self.assertEqual(len(self.counts()), 4)
+        self.assertEqual(max(self.counts()), 2)
+
+    def test_model_limit(self):
+        """filesystem limits also apply"""
+        self.fs.action_limits = ['* action 1']
+        acts = self.run_groups(['g1', 'g2', 'g3'])
+        self.assertEqual([act.status() for act in acts], [ACT_OK] * 3)
+        self.assertEqual(self.counts(), [1, 1, 1])
+
+    def test_other_actions(self):
+        """limits of other actions are ignored"""
+        Globals().add('action_limit', 'format,fsck server 1')
+        acts = self.run_groups(['g1', 'g2', 'g3'])
+        self.assertEqual([act.status() for act in acts], [ACT_OK] * 3)
+        self.assertEqual(max(self.counts()), 3)
+
+    def test_resources(self):
+        """resources of actions depend on the limits and the component"""
+        Globals().add('action_limit', 'start server 2')
+        Globals().add('action_limit', 'start,stop tag 4')
+        self.fs.action_limits = ['start server 1']
+        tgt = self.fs.new_target(self.srv, 'ost', 0, '/dev/ost0', tag='bay1')
+        tgt.dev_isblk = True
+        self.assertEqual(tgt.start().resources(),
+                         {('start', 'server', Utils.HOSTNAME): 1,
+                          ('start,stop', 'tag', 'bay1'): 4})
+        self.assertEqual(tgt.execute().resources(), {})
+
+        # Only one command on loop devices at a time
+        tgt.dev_isblk = False
+        self.assertEqual(tgt.stop().resources(),
+                         {('loop', 'server', Utils.HOSTNAME): 1,
+                          ('start,stop', 'tag', 'bay1'): 4})
+        self.assertEqual(tgt.execute().resources(), {})
@@ -18,24 +18,56 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
+import os
+import sys
 import types
 import unittest
 import binascii
+import pickle
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 import Utils
 
+from ClusterShell.Engine.Engine import FANOUT_UNLIMITED
+from ClusterShell.NodeSet import NodeSet
+from ClusterShell.Task import task_self
+
+from Shine.Configuration.Globals import Globals
 from Shine.Lustre.EventHandler import EventHandler
-from Shine.Lustre.FileSystem import FileSystem
-from Shine.Lustre.Component import MOUNTED, OFFLINE, RUNTIME_ERROR
+from Shine.Lustre.FileSystem import FileSystem, FSRemoteError
+from Shine.Lustre.Component import MOUNTED, OFFLINE, RECOVERING, \
+                                   RUNTIME_ERROR, UNREACHABLE
 from Shine.Lustre.Server import Server
-from Shine.Lustre.Actions.Action import ACT_OK, ACT_ERROR
+from Shine.Lustre.Actions.Action import ActionGroup, ACT_OK, ACT_ERROR, \
+                                        ACT_RUNNING, ErrorResult
+from Shine.Lustre.Actions.Barrier import PlanStage
 from Shine.Lustre.Actions.StartTarget import StartTarget
+from Shine.Lustre.Actions.Fsck import FsckProgress
+from Shine.Lustre import Trace
+from Shine.Lustre.Trace import ActionTrace, action_trace
 
 from Shine.Lustre.Actions.Proxy import shine_msg_pack, SHINE_MSG_MAGIC, \
-                                       SHINE_MSG_VERSION
+                                       SHINE_MSG_VERSION, \
+                                       SHINE_MSG_VERSION_COMPACT, \
+                                       shine_msg_pack_compact, \
+                                       shine_msg_dumps_compact, \
+                                       shine_msg_pack_batch, \
+                                       shine_msg_unpack, SHINE_MSG_ENV, \
+                                       SHINE_MSG_BATCH_ENV, \
+                                       shine_msg_pack_end, ProxyAgent, \
+                                       ProxyMux, MultiFSProxyAction, \
+                                       ProxyActionUnpickleError, \
+                                       ProxyDeadline, FSProxyAction
+from Shine.Commands.Base.RemoteCallEventHandler import \
+                                       RemoteCallEventHandler
 
 class ProxyTest(unittest.TestCase):
 
     def setUp(self):
+        # Most of these tests use v3 messages
+        Globals().replace('msg_pickle', 'yes')
         self.fs = FileSystem('proxy')
         self.srv1 = Server(Utils.HOSTNAME, ["%s@tcp" % Utils.HOSTNAME])
         disk = Utils.makeTempFilename()
@@ -48,6 +80,9 @@ class ProxyTest(unittest.TestCase):
             return [action.fakecmd]
         self.act._prepare_cmd = types.MethodType(fakeprepare, self.act)
 
+    def tearDown(self):
+        del Globals()['msg_pickle']
+
     def test_exec_fail(self):
         """simulate unable to run python"""
         self.act.fakecmd = '/bin/false'
@@ -71,8 +106,9 @@ class ProxyTest(unittest.TestCase):
         self.fs._check_errors([MOUNTED], self.fs.components)
 
         self.assertEqual(len(self.fs.proxy_errors), 1)
-        self.assertEqual(list(self.fs.proxy_errors.messages())[0],
-                         "Remote action start failed: \nBAD\n")
+        msg = str(list(self.fs.proxy_errors.messages())[0])
+        self.assertTrue(msg.startswith("Remote action start failed: "))
+        self.assertTrue(msg.endswith("BAD\n"))
         self.assertEqual(self.tgt.state, RUNTIME_ERROR)
         self.assertEqual(self.act.status(), ACT_ERROR)
 
@@ -145,12 +181,42 @@ class ProxyTest(unittest.TestCase):
         self.fs._check_errors([OFFLINE], self.fs.components)
 
         self.assertEqual(len(self.fs.proxy_errors), 1)
-        self.assertEqual(str(list(self.fs.proxy_errors.messages())[0]),
-                         "Cannot unpickle message (check Shine and ClusterShell"
-                         " versions): pop from empty list")
+        # Error details depend on the unpickler implementation
+        self.assertTrue(str(list(self.fs.proxy_errors.messages())[0])
+                        .startswith("Cannot unpickle message (check Shine and "
+                                    "ClusterShell versions): "))
         self.assertEqual(self.tgt.state, RUNTIME_ERROR)
         self.assertEqual(self.act.status(), ACT_OK)
 
+    def test_pickle_refused(self):
+        """v3 messages are refused if not allowed"""
+        Globals().replace('msg_pickle', 'no')
+        msg = shine_msg_pack(evtype='comp', info=self.info, status='start')
+
+        self.act.fakecmd = 'echo "%s"' % msg
+        self.act.launch()
+        self.fs._run_actions()
+        self.fs._check_errors([MOUNTED], self.fs.components)
+
+        self.assertEqual(len(self.fs.proxy_errors), 1)
+        self.assertTrue(str(list(self.fs.proxy_errors.messages())[0])
+                        .startswith("Pickle message refused"))
+
+    def test_pickle_restricted(self):
+        """v3 messages could not rebuild any object"""
+        msg = "%s%d:%s" % (SHINE_MSG_MAGIC, SHINE_MSG_VERSION,
+                           binascii.b2a_base64(pickle.dumps(
+                               {'evtype': 'log', 'obj': os.getcwd}, -1)))
+        self.assertRaises(ProxyActionUnpickleError, shine_msg_unpack, msg)
+
+        # Shine functions are not allowed either
+        msg = shine_msg_pack(evtype='log', obj=shine_msg_pack)
+        self.assertRaises(ProxyActionUnpickleError, shine_msg_unpack, msg)
+
+        msg = shine_msg_pack(evtype='comp', info=self.info, status='start',
+                             nodes=NodeSet('foo[1-2]'))
+        self.assertEqual(shine_msg_unpack(msg)['nodes'], NodeSet('foo[1-2]'))
+
     def test_compat_compname(self):
         """message with compname value is backward compatible"""
         msgs = []
@@ -210,3 +276,702 @@ class ProxyTest(unittest.TestCase):
         self.fs._check_errors([OFFLINE], self.fs.components)
         self.assertEqual(len(self.fs.proxy_errors), 0)
         self.assertEqual(self.act.status(), ACT_OK)
+
+    def test_compact_start_ok(self):
+        """send a start and done compact message"""
+        self.fs.local_server = self.srv1
+        msgs = []
+        msgs.append(shine_msg_pack_compact(evtype='comp', info=self.info,
+                                           status='start'))
+        self.tgt.local_state = MOUNTED
+        self.tgt.dev_size = 1234
+        msgs.append(shine_msg_pack_compact(evtype='comp', info=self.info,
+                                           status='done'))
+        self.tgt.local_state = None
+        self.tgt.dev_size = 0
+
+        self.act.fakecmd = "printf '%s'" % ''.join(msgs)
+        self.act.launch()
+        self.fs._run_actions()
+        self.fs._check_errors([MOUNTED], self.fs.components)
+
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertEqual(self.tgt.state, MOUNTED)
+        self.assertEqual(self.tgt.dev_size, 1234)
+        self.assertEqual(self.act.status(), ACT_OK)
+
+    def test_compact_batch(self):
+        """send a batch of compact messages"""
+        self.fs.local_server = self.srv1
+        payloads = [shine_msg_dumps_compact(evtype='comp', info=self.info,
+                                            status='start')]
+        self.tgt.local_state = MOUNTED
+        payloads.append(shine_msg_dumps_compact(evtype='comp', info=self.info,
+                                                status='done'))
+        payloads.append(shine_msg_dumps_compact(evtype='log', level='detail',
+                                                msg='done'))
+        self.tgt.local_state = None
+
+        self.act.fakecmd = "printf '%s'" % shine_msg_pack_batch(payloads)
+        self.act.launch()
+        self.fs._run_actions()
+        self.fs._check_errors([MOUNTED], self.fs.components)
+
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertEqual(self.tgt.state, MOUNTED)
+        self.assertEqual(self.act.status(), ACT_OK)
+
+    def test_compact_bad_content(self):
+        """send a forged compact message which cannot be decoded"""
+        msg = "%s%d:[bad content" % (SHINE_MSG_MAGIC,
+                                     SHINE_MSG_VERSION_COMPACT)
+
+        self.act.fakecmd = 'echo "%s"' % msg
+        self.act.launch()
+        self.fs._run_actions()
+        self.fs._check_errors([OFFLINE], self.fs.components)
+
+        self.assertEqual(len(self.fs.proxy_errors), 1)
+        self.assertTrue(str(list(self.fs.proxy_errors.messages())[0])
+                        .startswith("Cannot decode message"))
+        self.assertEqual(self.tgt.state, RUNTIME_ERROR)
+
+    def test_watch(self):
+        """status watch is done once initial status is sent"""
+        class WatchEH(EventHandler):
+            def __init__(self, act):
+                self.act = act
+                self.events = []
+            def event_callback(self, evtype, **kwargs):
+                if evtype == 'log':
+                    self.events.append((evtype, kwargs['level']))
+                elif kwargs['info'].actname != 'proxy':
+                    self.events.append((kwargs['status'], self.act.status(),
+                                        kwargs['info'].elem.state))
+        self.fs.hdlr = WatchEH(self.act)
+        self.fs.local_server = self.srv1
+        self.act.options['watch'] = 5
+        self.assertTrue('--watch --watch-interval=5' in
+                        self.act._prepare_args())
+
+        self.tgt.local_state = OFFLINE
+        msgs = [shine_msg_pack_compact(evtype='comp', info=self.info,
+                                       status='done'),
+                shine_msg_pack_compact(evtype='watch')]
+        self.tgt.local_state = MOUNTED
+        msgs.append(shine_msg_pack_compact(evtype='comp', info=self.info,
+                                           status='done'))
+        self.tgt.local_state = None
+
+        self.act.fakecmd = "printf '%s'; sleep 0.1; printf '%s'" % (
+                                                ''.join(msgs[:2]), msgs[2])
+        self.act.launch()
+        self.fs._run_actions()
+
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertEqual(self.fs.hdlr.events,
+                         [('done', ACT_RUNNING, OFFLINE),
+                          ('done', ACT_OK, MOUNTED),
+                          ('log', 'warning')])
+        self.assertEqual(self.act.status(), ACT_OK)
+
+    def test_timeout(self):
+        """remote command not ended in time raises timeout events"""
+        class TimeoutEH(EventHandler):
+            def __init__(self):
+                self.events = []
+            def event_callback(self, evtype, **kwargs):
+                if kwargs.get('status') == 'timeout':
+                    self.events.append((kwargs['node'],
+                                        kwargs['info'].actname))
+        self.fs.hdlr = TimeoutEH()
+        Globals().replace('ssh_connect_timeout', 0)
+        try:
+            self.act.timeout = 1
+            self.act.fakecmd = 'sleep 10'
+            self.act.launch()
+            self.fs._run_actions()
+        finally:
+            Globals().replace('ssh_connect_timeout', 30)
+
+        self.assertEqual(self.act.status(), ACT_ERROR)
+        self.assertEqual(self.fs.hdlr.events, [(Utils.HOSTNAME, 'start')])
+
+    def test_retry(self):
+        """remote command failing to connect is run again"""
+        class RetryEH(EventHandler):
+            def __init__(self):
+                self.events = []
+            def event_callback(self, evtype, **kwargs):
+                if kwargs.get('status') == 'progress':
+                    self.events.append((kwargs['node'],
+                                        kwargs['result'].attempt))
+        self.fs.hdlr = RetryEH()
+        marker = Utils.makeTempFilename()
+        os.unlink(marker)
+        self.tgt.state = MOUNTED
+        msg = shine_msg_pack(evtype='comp', info=self.info, status='done')
+        self.act.fakecmd = 'test -e %s || { touch %s; echo refused; ' \
+                           'exit 255; }; echo "%s"' % (marker, marker, msg)
+        Globals().add('action_retry', 'start 2 0 255')
+        try:
+            self.act.launch()
+            self.fs._run_actions()
+        finally:
+            del Globals()['action_retry']
+            os.unlink(marker)
+
+        self.assertEqual(self.fs.hdlr.events, [(Utils.HOSTNAME, 2)])
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertEqual(self.act.status(), ACT_OK)
+
+    def test_trace(self):
+        """proxy, connection and remote actions are traced"""
+        msgs = [shine_msg_pack(evtype='comp', info=self.info, status='start'),
+                shine_msg_pack(evtype='comp', info=self.info, status='done')]
+        self.tgt.state = MOUNTED
+        self.act.fakecmd = 'echo "%s"' % '\n'.join(msgs)
+        Trace._TRACE = ActionTrace()
+        action_trace().enable()
+        try:
+            self.act.launch()
+            self.fs._run_actions()
+            spans = [(event['cat'], event['name'])
+                     for event in action_trace().chrome_events()
+                     if event['ph'] == 'X']
+        finally:
+            Trace._TRACE = ActionTrace()
+
+        self.assertEqual(self.act.status(), ACT_OK)
+        self.assertEqual(spans,
+                         [('proxy', 'start on %s' % Utils.HOSTNAME),
+                          ('connect', 'connect for start'),
+                          ('start', str(self.info))])
+
+    def test_deadline(self):
+        """nodes not answering before the deadline are unreachable"""
+        self.act.fakecmd = 'sleep 10'
+        self.act.launch()
+        task_self().timer(0.5, handler=ProxyDeadline(), autoclose=True)
+        self.fs._run_actions()
+
+        self.assertEqual(self.act.status(), ACT_OK)
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertEqual(self.tgt.state, UNREACHABLE)
+        self.assertEqual(self.fs.unreachable, NodeSet(Utils.HOSTNAME))
+        self.assertEqual(self.fs.check_status(self.fs.components),
+                         set([UNREACHABLE]))
+        self.assertFalse(self.act in FSProxyAction._running)
+
+
+class MultiFSTest(unittest.TestCase):
+    """Proxy actions of several filesystems run by the same command"""
+
+    def setUp(self):
+        self.srv1 = Server(Utils.HOSTNAME, ["%s@tcp" % Utils.HOSTNAME])
+        self.mux = ProxyMux()
+        self.fs1 = FileSystem('mfs1')
+        self.fs2 = FileSystem('mfs2')
+        self.tgt1 = self.fs1.new_target(self.srv1, 'mgt', 0,
+                                        Utils.makeTempFilename())
+        self.tgt2 = self.fs2.new_target(self.srv1, 'ost', 0,
+                                        Utils.makeTempFilename())
+        self.multi = []
+        for fs in (self.fs1, self.fs2):
+            fs.local_server = self.srv1
+            fs.proxy_mux = self.mux
+
+        test = self
+        def fakeprepare(action):
+            test.multi.append(action)
+            return [test.fakecmd]
+        MultiFSProxyAction._prepare_cmd = fakeprepare
+
+    def tearDown(self):
+        del MultiFSProxyAction._prepare_cmd
+
+    def _run(self):
+        acts = []
+        for fs in (self.fs1, self.fs2):
+            acts.append(fs._proxy_action('start', self.srv1.hostname,
+                                         fs.components))
+            acts[-1].launch()
+        FileSystem.run_actions([self.fs1, self.fs2])
+        return acts
+
+    def test_single_command(self):
+        """events are given back to each filesystem"""
+        msgs = []
+        for fs, tgt in ((self.fs1, self.tgt1), (self.fs2, self.tgt2)):
+            tgt.local_state = MOUNTED
+            msgs.append(shine_msg_dumps_compact(evtype='comp',
+                                                info=StartTarget(tgt).info(),
+                                                status='done',
+                                                fsname=fs.fs_name))
+            tgt.local_state = None
+        self.fakecmd = "printf '%s'" % shine_msg_pack_batch(msgs)
+
+        acts = self._run()
+        self.assertEqual(len(self.multi), 1)
+        args = self.multi[0]._prepare_args()
+        self.assertTrue('-f mfs1' in args and '-f mfs2' in args)
+        self.assertTrue('-l %s' % NodeSet.fromlist([self.tgt1.label,
+                                                    self.tgt2.label]) in args)
+        self.assertEqual([act.status() for act in acts], [ACT_OK, ACT_OK])
+        self.assertEqual(self.tgt1.state, MOUNTED)
+        self.assertEqual(self.tgt2.state, MOUNTED)
+
+    def test_command_failed(self):
+        """each filesystem reports the command error"""
+        self.fakecmd = 'echo BAD; exit 1'
+
+        acts = self._run()
+        self.assertEqual([act.status() for act in acts],
+                         [ACT_ERROR, ACT_ERROR])
+        for fs, tgt in ((self.fs1, self.tgt1), (self.fs2, self.tgt2)):
+            fs._check_errors([MOUNTED], fs.components)
+            msg = str(list(fs.proxy_errors.messages())[0])
+            self.assertEqual(msg, "Remote action start failed: BAD\n")
+            self.assertEqual(tgt.state, RUNTIME_ERROR)
+
+    def test_untagged_message(self):
+        """an event without filesystem name could not be dispatched"""
+        self.tgt1.local_state = MOUNTED
+        msg = shine_msg_pack_compact(evtype='comp', status='done',
+                                     info=StartTarget(self.tgt1).info())
+        self.tgt1.local_state = None
+        self.fakecmd = "printf '%s'" % msg
+
+        self._run()
+        self.fs1._check_errors([MOUNTED], self.fs1.components)
+        self.assertTrue(str(list(self.fs1.proxy_errors.messages())[0])
+                        .startswith("Cannot dispatch message"))
+
+
+class AgentTest(unittest.TestCase):
+    """Proxy actions sent to a persistent agent"""
+
+    def setUp(self):
+        Globals().replace('remote_agent', 'yes')
+        self._fanout = task_self().info('fanout')
+        self.fs = FileSystem('agent')
+        self.srv1 = Server(Utils.HOSTNAME, ["%s@tcp" % Utils.HOSTNAME])
+        self.tgt = self.fs.new_target(self.srv1, 'mgt', 0,
+                                      Utils.makeTempFilename())
+        self.fs.local_server = self.srv1
+        self.info = StartTarget(self.tgt).info()
+        self.agent = None
+
+    def tearDown(self):
+        del Globals()['remote_agent']
+        for agent in list(ProxyAgent._sessions.values()):
+            agent.worker.abort()
+        ProxyAgent._sessions.clear()
+        task_self().set_info('fanout', self._fanout)
+
+    def _fake_agent(self, answer):
+        """Create a fake agent, replying `answer' to each request."""
+        self.agent = Utils.makeTempFile("while read line; do\n"
+                                        "%s\n"
+                                        "done\n" % answer)
+
+    def _run(self):
+        act = self.fs._proxy_action('start', self.srv1.hostname,
+                                    self.fs.components)
+        def fakeenv(action):
+            return ['sh', self.agent.name]
+        act._prepare_env = types.MethodType(fakeenv, act)
+        act.launch()
+        self.fs._run_actions()
+        return act
+
+    def test_agent_reused(self):
+        """several proxy actions are run by the same agent"""
+        self.tgt.local_state = MOUNTED
+        msg = shine_msg_pack_compact(evtype='comp', info=self.info,
+                                     status='done')
+        self.tgt.local_state = None
+        self._fake_agent("printf '%s'" % (msg + shine_msg_pack_end(0)))
+
+        act = self._run()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(self.tgt.state, MOUNTED)
+        agent = ProxyAgent._sessions[Utils.HOSTNAME]
+        self.assertEqual(task_self().info('fanout'), self._fanout)
+        self.assertEqual(agent.worker._fanout, FANOUT_UNLIMITED)
+
+        self.tgt.local_state = None
+        act = self._run()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(self.tgt.state, MOUNTED)
+        self.assertTrue(ProxyAgent._sessions[Utils.HOSTNAME] is agent)
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+
+    def test_agent_plan(self):
+        """agent plan waits for the stage answer"""
+        act = self.fs._proxy_action('start', self.srv1.hostname,
+                                    self.fs.components)
+        def fakeenv(action):
+            return ['sh', self.agent.name]
+        act._prepare_env = types.MethodType(fakeenv, act)
+        dep = ActionGroup()
+        stage = PlanStage(act, self.fs.components, True)
+        stage.depends_on(dep)
+
+        self.tgt.local_state = MOUNTED
+        msg = shine_msg_pack_compact(evtype='comp', info=self.info,
+                                     status='done')
+        self.tgt.local_state = None
+        done = shine_msg_pack_compact(evtype='stage', index=stage.index,
+                                      ok=True)
+        self._fake_agent("read answer\n"
+                         "case \"$answer\" in *'\"go\":true'*) "
+                         "printf '%s';; esac\n"
+                         "printf '%s'" % (msg + done, shine_msg_pack_end(0)))
+
+        # The stage is allowed to start before the request is sent
+        graph = ActionGroup()
+        graph.add(stage)
+        graph.add(act)
+        graph.launch()
+        self.fs._run_actions()
+        self.assertEqual(stage.status(), ACT_OK)
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(self.tgt.state, MOUNTED)
+
+    def test_agent_request_failed(self):
+        """agent request has failed"""
+        self._fake_agent("echo BAD; printf '%s'" % shine_msg_pack_end(1))
+
+        act = self._run()
+        self.fs._check_errors([MOUNTED], self.fs.components)
+        self.assertEqual(act.status(), ACT_ERROR)
+        msg = str(list(self.fs.proxy_errors.messages())[0])
+        self.assertTrue(msg.startswith("Remote action start failed: "))
+        self.assertTrue(msg.endswith("BAD\n"))
+        self.assertEqual(self.tgt.state, RUNTIME_ERROR)
+
+    def test_agent_crash(self):
+        """agent exits before ending the request"""
+        self._fake_agent("exit 0")
+
+        act = self._run()
+        self.fs._check_errors([MOUNTED], self.fs.components)
+        self.assertEqual(act.status(), ACT_ERROR)
+        self.assertEqual(list(self.fs.proxy_errors.messages())[0],
+                         "Remote action start failed: No response")
+        self.assertEqual(self.tgt.state, RUNTIME_ERROR)
+        self.assertFalse(Utils.HOSTNAME in ProxyAgent._sessions)
+        self.assertEqual(task_self().info('fanout'), self._fanout)
+
+    def test_agent_retry(self):
+        """agent request failing with a transient error is sent again"""
+        marker = Utils.makeTempFilename()
+        os.unlink(marker)
+        self.tgt.local_state = MOUNTED
+        msg = shine_msg_pack_compact(evtype='comp', info=self.info,
+                                     status='done')
+        self.tgt.local_state = None
+        self._fake_agent("if test -e %s; then printf '%s'; else touch %s; "
+                         "echo busy; printf '%s'; fi" %
+                         (marker, msg + shine_msg_pack_end(0), marker,
+                          shine_msg_pack_end(16)))
+        Globals().add('action_retry', '* 2 0 16 busy')
+        try:
+            act = self._run()
+        finally:
+            del Globals()['action_retry']
+            os.unlink(marker)
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(act.retries, 1)
+        self.assertEqual(self.tgt.state, MOUNTED)
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+
+    def test_agent_timeout(self):
+        """agent not answering in time is given up"""
+        self._fake_agent("sleep 10")
+        self.tgt.local_state = None
+
+        act = self.fs._proxy_action('start', self.srv1.hostname,
+                                    self.fs.components)
+        act.timeout = 1
+        Globals().replace('ssh_connect_timeout', 0)
+        try:
+            def fakeenv(action):
+                return ['sh', self.agent.name]
+            act._prepare_env = types.MethodType(fakeenv, act)
+            act.launch()
+            self.fs._run_actions()
+        finally:
+            Globals().replace('ssh_connect_timeout', 30)
+
+        self.assertEqual(act.status(), ACT_ERROR)
+        self.assertFalse(Utils.HOSTNAME in ProxyAgent._sessions)
+        self.assertEqual(task_self().info('fanout'), self._fanout)
+
+    def test_agent_deadline(self):
+        """agent not answering before the deadline is given up"""
+        self._fake_agent("sleep 10")
+        task_self().timer(0.5, handler=ProxyDeadline(), autoclose=True)
+        act = self._run()
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(self.tgt.state, UNREACHABLE)
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertFalse(Utils.HOSTNAME in ProxyAgent._sessions)
+
+
+class TreeTest(unittest.TestCase):
+    """Proxy actions routed through a gateway"""
+
+    def setUp(self):
+        self.fs = FileSystem('tree')
+        self.srv1 = Server('127.0.0.1', ['127.0.0.1@tcp'])
+        self.srv2 = Server('127.0.0.2', ['127.0.0.2@tcp'])
+        self.tgt = self.fs.new_target(self.srv1, 'mgt', 0, '/dev/tree')
+        self.tgt.add_server(self.srv2)
+        self.fs.local_server = self.srv1
+        self.info = StartTarget(self.tgt).info()
+        self.topology = None
+
+    def tearDown(self):
+        task_self().topology = None
+        task_self().router = None
+
+    def _topology(self, gateway):
+        """Load a topology routing 127.0.0.[1-2] through `gateway'."""
+        self.topology = Utils.makeTempFile("[routes]\n%s: %s\n"
+                                           "%s: 127.0.0.[1-2]\n"
+                                           % (Utils.HOSTNAME, gateway,
+                                              gateway))
+        task_self().load_topology(self.topology.name)
+
+    def _run(self, nodes, fakecmd):
+        act = self.fs._proxy_action('start', NodeSet(nodes),
+                                    self.fs.components)
+        def fakeprepare(action):
+            return [fakecmd]
+        act._prepare_cmd = types.MethodType(fakeprepare, act)
+        act.launch()
+        self.fs._run_actions()
+        return act
+
+    def test_tree_proxy(self):
+        """proxy messages are forwarded by the gateway"""
+        self._topology('localhost')
+        self.tgt.local_state = MOUNTED
+        msg = shine_msg_pack_compact(evtype='comp', info=self.info,
+                                     status='done')
+        self.tgt.local_state = None
+
+        act = self._run('127.0.0.1', "printf '%s'" % msg)
+        self.assertEqual(act.status(), ACT_OK)
+        self.assertEqual(len(self.fs.proxy_errors), 0)
+        self.assertEqual(self.tgt._states['127.0.0.1'], MOUNTED)
+
+    def test_tree_errors_grouped(self):
+        """errors from nodes behind a gateway are grouped"""
+        self._topology('localhost')
+        act = self._run('127.0.0.[1-2]', "echo BAD; exit 1")
+        self.assertEqual(act.status(), ACT_ERROR)
+        self.assertEqual(len(self.fs.proxy_errors), 1)
+        msg, nodes = list(self.fs.proxy_errors.walk())[0]
+        self.assertEqual(str(NodeSet.fromlist(nodes)), '127.0.0.[1-2]')
+        self.assertTrue(str(msg).endswith("BAD\n"))
+
+    def test_tree_no_gateway(self):
+        """all gateways are unreachable"""
+        self._topology('badgateway')
+        self.assertRaises(FSRemoteError, self._run, '127.0.0.1', 'true')
+
+
+class CompactMessageTest(unittest.TestCase):
+    """Compact (v4) message encoding"""
+
+    def setUp(self):
+        self.fs = FileSystem('compact')
+        self.srv1 = Server('foo1', ['foo1@tcp'])
+        self.srv2 = Server('foo2', ['foo2@tcp'])
+        self.fs.local_server = self.srv2
+        self.tgt = self.fs.new_target(self.srv1, 'ost', 3, '/dev/sdz',
+                                      jdev='/dev/sdy')
+        self.tgt.add_server(self.srv2)
+        self.client = self.fs.new_client(self.srv2, '/compact')
+
+    def _roundtrip(self, **kwargs):
+        msg = shine_msg_pack_compact(**kwargs)
+        self.assertTrue(msg.endswith('\n'))
+        self.assertEqual(msg.count('\n'), 1)
+        return shine_msg_unpack(msg)
+
+    def test_target_fields(self):
+        """compact message only carries the sender target state"""
+        self.tgt.local_state = RECOVERING
+        self.tgt.recov_info = "30s (1/2)"
+        self.tgt.ldd_svname = 'compact-OST0003'
+        self.tgt._ldd_flags = 0x2
+        info = StartTarget(self.tgt).info()
+        data = self._roundtrip(evtype='comp', info=info, status='done')
+
+        self.assertEqual(data['evtype'], 'comp')
+        self.assertEqual(data['info'].actname, 'start')
+        self.assertEqual(str(data['info']), str(info))
+        self.assertEqual(data['info'].elem.uniqueid(), 'compact-OST0003')
+
+        # Update a fresh filesystem, as an admin node would do
+        fs = FileSystem('compact')
+        tgt = fs.new_target(self.srv1, 'ost', 3, '/dev/sdz')
+        tgt.add_server(self.srv2)
+        fs.distant_event(node='foo2', **data)
+        self.assertEqual(tgt._states, {'foo1': None, 'foo2': RECOVERING})
+        self.assertEqual(tgt.recov_info, "30s (1/2)")
+        self.assertEqual(tgt.ldd_svname, 'compact-OST0003')
+        self.assertEqual(tgt._ldd_flags, 0x2)
+        self.assertEqual(data['info'].elem, tgt)
+        # JSON strings are given back as native strings
+        self.assertTrue(type(tgt.recov_info) is str)
+        self.assertTrue(type(tgt.ldd_svname) is str)
+        self.assertTrue(type(data['info'].description) is str)
+
+    def test_client_fields(self):
+        """compact message updates client fields"""
+        self.client.state = MOUNTED
+        self.client.mtpt = '/compact'
+        self.client.proc_states = {'FULL': 3}
+        info = self.client.mount().info()
+        data = self._roundtrip(evtype='comp', info=info, status='done')
+
+        fs = FileSystem('compact')
+        client = fs.new_client(self.srv2, '/compact')
+        fs.distant_event(node='foo2', **data)
+        self.assertEqual(client.state, MOUNTED)
+        self.assertEqual(client.mtpt, '/compact')
+        self.assertEqual(client.proc_states, {'FULL': 3})
+        self.assertTrue(type(client.mount_path) is str)
+        self.assertTrue(type(client.mtpt) is str)
+        self.assertEqual([type(key) for key in client.proc_states], [str])
+
+    def test_start_is_not_an_update(self):
+        """compact start message does not update component"""
+        self.client.state = MOUNTED
+        info = self.client.mount().info()
+        data = self._roundtrip(evtype='comp', info=info, status='start')
+
+        fs = FileSystem('compact')
+        client = fs.new_client(self.srv2, '/compact')
+        fs.distant_event(node='foo2', **data)
+        self.assertEqual(client.state, None)
+
+    def test_journal(self):
+        """compact message updates target journal"""
+        self.tgt.journal.state = OFFLINE
+        info = self.tgt.format().deps.pop().info()
+        data = self._roundtrip(evtype='comp', info=info, status='done')
+
+        fs = FileSystem('compact')
+        tgt = fs.new_target(self.srv1, 'ost', 3, '/dev/sdz', jdev='/dev/sdy')
+        fs.distant_event(node='foo1', **data)
+        self.assertEqual(tgt.journal.state, OFFLINE)
+
+    def test_results(self):
+        """compact message rebuilds Result objects"""
+        info = StartTarget(self.tgt).info()
+        data = self._roundtrip(evtype='comp', info=info, status='failed',
+                               result=ErrorResult('oops', 1.5, 3))
+        self.assertTrue(isinstance(data['result'], ErrorResult))
+        self.assertEqual(data['result'].message, 'oops')
+        self.assertEqual(data['result'].duration, 1.5)
+        self.assertEqual(data['result'].retcode, 3)
+
+        data = self._roundtrip(evtype='comp', info=info, status='progress',
+                               result=FsckProgress(2, 1, 4))
+        self.assertTrue(isinstance(data['result'], FsckProgress))
+        self.assertEqual(data['result'].progress, 25.0)
+
+    def test_server_and_log(self):
+        """compact message supports server and log events"""
+        info = self.srv1.load_modules().info()
+        data = self._roundtrip(evtype='server', info=info, status='start')
+        self.assertEqual(str(data['info']), "load module 'lustre'")
+        self.assertEqual(data['info'].elem.uniqueid(), 'foo1')
+
+        data = self._roundtrip(evtype='log', level='detail', msg='[RUN] ls')
+        self.assertEqual(data, {'evtype': 'log', 'level': 'detail',
+                                'msg': '[RUN] ls'})
+
+
+class BatchEventHandlerTest(unittest.TestCase):
+    """Remote event handler batching"""
+
+    def setUp(self):
+        self._environ = os.environ.copy()
+        self._stdout = sys.stdout
+        sys.stdout = StringIO()
+        os.environ[SHINE_MSG_ENV] = str(SHINE_MSG_VERSION_COMPACT)
+
+    def tearDown(self):
+        sys.stdout = self._stdout
+        os.environ.clear()
+        os.environ.update(self._environ)
+
+    def _lines(self):
+        return sys.stdout.getvalue().splitlines(True)
+
+    def test_no_batch(self):
+        """without batch parameters, one line per event"""
+        hdlr = RemoteCallEventHandler()
+        hdlr.log('detail', 'one')
+        hdlr.log('detail', 'two')
+        self.assertEqual(len(self._lines()), 2)
+        self.assertEqual(shine_msg_unpack(self._lines()[0])['msg'], 'one')
+
+    def test_batch_size(self):
+        """batch is sent when full or flushed"""
+        os.environ[SHINE_MSG_BATCH_ENV] = '3:60000'
+        hdlr = RemoteCallEventHandler()
+        for idx in range(4):
+            hdlr.log('detail', str(idx))
+        self.assertEqual(len(self._lines()), 1)
+        data = shine_msg_unpack(self._lines()[0])
+        self.assertEqual([evt['msg'] for evt in data], ['0', '1', '2'])
+        hdlr.flush()
+        self.assertEqual(len(self._lines()), 2)
+        data = shine_msg_unpack(self._lines()[1])
+        self.assertEqual([evt['evtype'] for evt in data], ['log'])
+        hdlr.flush()
+        self.assertEqual(len(self._lines()), 2)
+
+    def test_batch_delay(self):
+        """batch is sent when its first event is too old"""
+        os.environ[SHINE_MSG_BATCH_ENV] = '100:0'
+        hdlr = RemoteCallEventHandler()
+        hdlr.log('detail', 'one')
+        self.assertEqual(len(self._lines()), 1)
+
+    def test_batch_needs_compact(self):
+        """batch is ignored if compact messages are not supported"""
+        del os.environ[SHINE_MSG_ENV]
+        os.environ[SHINE_MSG_BATCH_ENV] = '100:60000'
+        hdlr = RemoteCallEventHandler()
+        hdlr.log('detail', 'one')
+        self.assertTrue(self._lines()[0].startswith('SHINE:3:'))
+
+    def test_batch_fallback(self):
+        """non-compact event is sent after the pending ones"""
+        os.environ[SHINE_MSG_BATCH_ENV] = '100:60000'
+        hdlr = RemoteCallEventHandler()
+        hdlr.log('detail', 'one')
+        hdlr.log('detail', 'two', obj=object())
+        lines = self._lines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(shine_msg_unpack(lines[0])[0]['msg'], 'one')
+        self.assertTrue(lines[1].startswith('SHINE:3:'))
+
+    def test_fsname(self):
+        """events are tagged with their filesystem if asked"""
+        hdlr = RemoteCallEventHandler()
+        hdlr.log('detail', 'one')
+        hdlr.fsname = 'fs2'
+        hdlr.log('detail', 'two')
+        lines = self._lines()
+        self.assertFalse('fsname' in shine_msg_unpack(lines[0]))
+        self.assertEqual(shine_msg_unpack(lines[1])['fsname'], 'fs2')
@@ -4,11 +4,16 @@
 
 """Unit test for Client"""
 
+import os
+import shutil
 import unittest
 
+import Utils
 from Shine.Lustre.FileSystem import FileSystem
 from Shine.Lustre.Server import Server
 from Shine.Lustre.Client import Client
+from Shine.Lustre.Component import ComponentError, MOUNTED, CLIENT_ERROR
+from Shine.Lustre.ProcFS import proc_snapshot
 
 class ClientTest(unittest.TestCase):
 
@@ -42,3 +47,62 @@ class ClientTest(unittest.TestCase):
         client2 = fs2.new_client(srv2, '/foo2')
 
         self.assertNotEqual(client1.uniqueid(), client2.uniqueid())
+
+
+class ClientProcStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = Utils.make_tempdir()
+        proc_snapshot().root = self.root
+        proc_snapshot().invalidate()
+        self.write('/proc/mounts',
+                   '10.0.0.1@tcp:/foo /foo lustre rw 0 0\n'
+                   '10.0.0.1@tcp:/foo /foo2 lustre rw 0 0\n')
+        self.write('/proc/fs/lustre/lov/foo-clilov-ffff01/uuid', 'x\n')
+        self.write('/proc/fs/lustre/lov/foo-clilov-ffff02/uuid', 'x\n')
+
+        self.fs = FileSystem('foo')
+        srv = Server('foo1', ['foo1@tcp'])
+        self.fs.new_target(srv, 'ost', 0, '/dev/ost0')
+        self.fs.new_target(srv, 'ost', 1, '/dev/ost1')
+        self.client1 = self.fs.new_client(srv, '/foo')
+        self.client2 = self.fs.new_client(srv, '/foo2')
+
+    def tearDown(self):
+        proc_snapshot().root = ''
+        proc_snapshot().invalidate()
+        shutil.rmtree(self.root)
+
+    def write(self, path, content):
+        path = self.root + path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').write(content)
+
+    def set_state(self, label, instance, state):
+        self.write('/proc/fs/lustre/osc/%s-osc-%s/state' % (label, instance),
+                   'current_state: %s\n' % state)
+
+    def test_shared_states(self):
+        """test all mounts share the import states of the node"""
+        for instance in ('ffff01', 'ffff02'):
+            self.set_state('foo-OST0000', instance, 'FULL')
+            self.set_state('foo-OST0001', instance, 'DISCONN')
+        for client in (self.client1, self.client2):
+            client.lustre_check()
+            self.assertEqual(client.state, MOUNTED)
+            self.assertEqual(client.proc_states, {'FULL': 2, 'DISCONN': 2})
+
+    def test_inactive_and_evicted(self):
+        """test inactive targets are ignored, evictions are errors"""
+        self.fs.components['foo-OST0001'].active = 'no'
+        self.set_state('foo-OST0000', 'ffff01', 'FULL')
+        self.set_state('foo-OST0001', 'ffff01', 'DISCONN')
+        self.client1.lustre_check()
+        self.assertEqual(self.client1.proc_states, {'FULL': 1})
+
+        self.set_state('foo-OST0000', 'ffff02', 'EVICTED')
+        proc_snapshot().invalidate()
+        self.assertRaises(ComponentError, self.client1.lustre_check)
+        self.assertEqual(self.client1.state, CLIENT_ERROR)
+        self.assertEqual(self.client1.proc_states, {'FULL': 1, 'EVICTED': 1})
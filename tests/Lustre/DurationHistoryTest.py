@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# Shine.Lustre.DurationHistory test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit tests for DurationHistory"""
+
+import os
+import shutil
+import unittest
+
+import Utils
+from Shine.Configuration.Globals import Globals
+from Shine.Lustre.DurationHistory import DurationHistory
+from Shine.Lustre.EventHandler import EventHandler
+from Shine.Lustre.FileSystem import FileSystem, Server
+from Shine.Lustre.Actions.Action import Result
+
+
+class DurationHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Utils.make_tempdir()
+        Globals().replace('history_dir', os.path.join(self.tmpdir, 'hist'))
+        self.history = DurationHistory('foo')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        del Globals()['history_dir']
+
+    def test_estimate(self):
+        """test median of the last durations"""
+        self.assertEqual(self.history.estimate('start', 'foo-OST0000'), None)
+        self.history.add('start', 'foo-OST0000', 10)
+        self.assertEqual(self.history.estimate('start', 'foo-OST0000'), 10)
+        self.history.add('start', 'foo-OST0000', 20)
+        self.assertEqual(self.history.estimate('start', 'foo-OST0000'), 15)
+        for duration in (1, 2, 3, 4):
+            self.history.add('start', 'foo-OST0000', duration)
+        # 10 is too old
+        self.assertEqual(self.history.estimate('start', 'foo-OST0000'), 3)
+        self.assertEqual(self.history.estimate('stop', 'foo-OST0000'), None)
+        # Failures do not count
+        self.history.ended('start', 'foo-OST0000')
+        self.assertEqual(self.history.estimate('start', 'foo-OST0000'), 3)
+
+    def test_save(self):
+        """test durations are kept by filesystem"""
+        self.history.save()
+        self.assertFalse(os.path.exists(self.history.path))
+        self.history.add('format', 'foo-MDT0000', 42)
+        self.history.save()
+        self.assertEqual(DurationHistory('foo').estimate('format',
+                                                         'foo-MDT0000'), 42)
+        self.assertEqual(DurationHistory('bar').estimate('format',
+                                                         'foo-MDT0000'), None)
+
+    def test_remaining(self):
+        """test time still needed by running actions"""
+        self.history.add('start', 'foo-OST0000', 10)
+        self.assertEqual(self.history.remaining('start', 'foo-OST0000', 0),
+                         10)
+        self.history.started('start', 'foo-OST0000')
+        start = self.history._started[('start', 'foo-OST0000')]
+        self.assertEqual(self.history.remaining('start', 'foo-OST0000',
+                                                start + 4), 6)
+        self.assertEqual(self.history.remaining('start', 'foo-OST0000',
+                                                start + 20), 0)
+        self.history.ended('start', 'foo-OST0000')
+        self.assertEqual(self.history.remaining('start', 'foo-OST0000',
+                                                start + 4), 0)
+        self.assertEqual(self.history.remaining('start', 'foo-OST0001',
+                                                start + 4), None)
+
+
+class FileSystemHistoryTest(unittest.TestCase):
+
+    class LogEH(EventHandler):
+        def __init__(self):
+            self.logs = []
+        def event_callback(self, evtype, **kwargs):
+            if evtype == 'log':
+                self.logs.append(kwargs['msg'])
+
+    def setUp(self):
+        self.tmpdir = Utils.make_tempdir()
+        Globals().replace('history_dir', self.tmpdir)
+        self.fs = FileSystem('hist', event_handler=self.LogEH())
+        self.mgt = self.fs.new_target(Server('node1', ['node1@tcp']),
+                                      'mgt', 0, '/dev/mgt')
+        self.mdt = self.fs.new_target(Server('node2', ['node2@tcp']),
+                                      'mdt', 0, '/dev/mdt')
+        srv3 = Server('node3', ['node3@tcp'])
+        self.ost0 = self.fs.new_target(srv3, 'ost', 0, '/dev/ost0')
+        self.ost1 = self.fs.new_target(srv3, 'ost', 1, '/dev/ost1')
+        self.fs.enable_history()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        del Globals()['history_dir']
+
+    def durations(self, action, **durations):
+        for name, duration in durations.items():
+            comp = getattr(self, name)
+            self.fs.durations.add(action, comp.uniqueid(), duration)
+
+    def test_record(self):
+        """test component events are recorded"""
+        action = self.mgt.format()
+        self.fs.local_event('comp', info=action.info(), status='start')
+        self.fs.local_event('comp', info=action.info(), status='done',
+                            result=Result(duration=12))
+        action = self.mdt.format()
+        self.fs.local_event('comp', info=action.info(), status='failed',
+                            result=Result(duration=5))
+        self.fs._run_actions()
+        history = DurationHistory('hist')
+        self.assertEqual(history.estimate('format', self.mgt.uniqueid()), 12)
+        self.assertEqual(history.estimate('format', self.mdt.uniqueid()),
+                         None)
+
+    def test_plan_dependencies(self):
+        """test start estimate follows target dependencies"""
+        self.durations('start', mgt=10, mdt=30, ost0=5, ost1=20)
+        depends = self.fs._start_depends(self.fs.components)
+        graph = self.fs._prepare('start', depends=depends)
+        # OSTs only wait for the MGT, MDT0 is longer.
+        self.assertEqual(self.fs.estimate(graph), (40, 0))
+
+        depends = self.fs._start_depends(self.fs.components, True)
+        graph = self.fs._prepare('start', depends=depends)
+        self.assertEqual(self.fs.estimate(graph), (60, 0))
+
+    def test_plan_groups(self):
+        """test sequential groups add up, unknown components are counted"""
+        self.durations('format', mgt=10, mdt=30, ost0=5)
+        self.fs._prepare('format', groupby='START_ORDER')
+        self.assertEqual(self.fs.estimate(), (45, 1))
+
+    def test_dryrun_estimate(self):
+        """test dry run displays the estimate"""
+        self.durations('format', mgt=100, mdt=30, ost0=20, ost1=20)
+        self.fs._prepare('format', dryrun=True)
+        self.assertEqual(self.fs.hdlr.logs,
+                         ["Estimated format time: 1.7 min"])
+
+        self.fs.durations = None
+        self.fs._prepare('format', dryrun=True)
+        self.assertEqual(len(self.fs.hdlr.logs), 1)
+
+    def test_eta(self):
+        """test ended actions are not counted anymore"""
+        self.durations('start', mgt=10, mdt=30, ost0=5, ost1=20)
+        depends = self.fs._start_depends(self.fs.components)
+        self.fs._prepare('start', depends=depends)
+        self.fs.durations.ended('start', self.mgt.uniqueid())
+        self.fs.durations.ended('start', self.mdt.uniqueid())
+        self.assertEqual(self.fs.estimate(now=0), (20, 0))
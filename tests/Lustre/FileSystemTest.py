@@ -19,12 +19,26 @@
 #
 
 
+import os
+import shutil
 import unittest
 import Utils
 
+from ClusterShell.NodeSet import NodeSet
+from ClusterShell.Event import EventHandler as TimerHandler
+from ClusterShell.Task import task_self
+
+from Shine.Configuration.Globals import Globals
+from Shine.Lustre.Actions.Proxy import FSProxyAction
+from Shine.Lustre.Actions.Barrier import StageBarrier
+from Shine.Lustre.Actions.Modules import PreloadModules
+
 from Shine.Lustre.Server import ServerGroup
+from Shine.Lustre.EventHandler import EventHandler
+from Shine.Lustre.Component import ComponentGroup
+from Shine.Lustre.ProcFS import proc_snapshot
 from Shine.Lustre.FileSystem import FileSystem, Server, FSRemoteError, \
-                                    MOUNTED, OFFLINE, MIGRATED
+                                    MOUNTED, OFFLINE, MIGRATED, RECOVERING
 
 
 def _graph2obj(graph):
@@ -58,9 +72,10 @@ class PrepareTest(unittest.TestCase):
 
         self.assertEqual(_graph2obj(graph),
                          [[[{'NAME': 'start', 'comp': comp}],
-                           [{'NAME': 'load modules'},
-                            {'NAME': 'load modules'}]]])
-        self.assertEqual(graph[0][1][0]._modname, 'lustre')
+                           {'NAME': 'load modules'}]])
+        self.assertEqual(graph[0][1]._modnames, ['ldiskfs', 'lustre'])
+        # Modules are loaded beside the first components
+        self.assertFalse(graph[0][0].deps)
 
     def test_simple_remote_action(self):
         """prepare a simple action on a remote component"""
@@ -68,8 +83,12 @@ class PrepareTest(unittest.TestCase):
         graph = self.fs._prepare('start')
 
         self.assertEqual(_graph2obj(graph),
-                         [[[{'NAME': 'proxy', 'action': 'start'}]]])
-        self.assertEqual(str(graph[0][0][0].nodes), 'remote')
+                         [[[[{'NAME': 'proxy', 'action': 'start'}]]],
+                          {'NAME': 'preload modules'}])
+        self.assertEqual(str(graph[0][0][0][0].nodes), 'remote')
+        self.assertEqual(str(graph[1].nodes), 'remote')
+        self.assertEqual(graph[1].modnames, ['ldiskfs', 'lustre'])
+        self.assertFalse(graph[1].deps)
 
     def test_proxy_tunings(self):
         """prepare is ok with or without tunings"""
@@ -102,17 +121,15 @@ class PrepareTest(unittest.TestCase):
         graph = self.fs._prepare('start', tunings=None)
         self.assertEqual(_graph2obj(graph),
                          [[[{'NAME': 'start', 'comp': comp}],
-                           [{'NAME': 'load modules'},
-                            {'NAME': 'load modules'}]]])
-        self.assertEqual(graph[0][1][0]._modname, 'lustre')
+                           {'NAME': 'load modules'}]])
+        self.assertEqual(graph[0][1]._modnames, ['ldiskfs', 'lustre'])
 
         # With tunings
         graph = self.fs._prepare('start', tunings=FakeTunings())
         self.assertEqual(_graph2obj(graph),
                          [[[{'NAME': 'start', 'comp': comp}],
-                           [{'NAME': 'load modules'},
-                            {'NAME': 'load modules'}], []]])
-        self.assertEqual(graph[0][1][0]._modname, 'lustre')
+                           {'NAME': 'load modules'}, {'NAME': 'tune'}]])
+        self.assertEqual(graph[0][1]._modnames, ['ldiskfs', 'lustre'])
         self.assertEqual(graph[0][2].NAME, 'tune')
 
     def test_need_unload(self):
@@ -131,6 +148,273 @@ class PrepareTest(unittest.TestCase):
                            {'NAME': 'unload modules'}]])
 
 
+class PlanPrepareTest(unittest.TestCase):
+    """Verify graph from _prepare() with remote agents"""
+
+    def setUp(self):
+        Globals().replace('remote_agent', 'yes')
+        self.fs = FileSystem('plan')
+        srv1 = Server('foo1', ['foo1@tcp'])
+        srv2 = Server('foo2', ['foo2@tcp'])
+        self.mgt = self.fs.new_target(srv1, 'mgt', 0, '/dev/mgt')
+        self.mdt = self.fs.new_target(srv1, 'mdt', 0, '/dev/mdt')
+        self.ost = self.fs.new_target(srv2, 'ost', 0, '/dev/ost')
+
+    def tearDown(self):
+        del Globals()['remote_agent']
+
+    def test_one_proxy_per_server(self):
+        """each server receives its whole plan"""
+        depends = FileSystem._start_depends(self.fs.components)
+        graph = self.fs._prepare('start', depends=depends)
+        proxies = [act for act in graph if isinstance(act, FSProxyAction)]
+        self.assertEqual([str(act.nodes) for act in proxies], ['foo1', 'foo2'])
+        # Agents load their modules themselves
+        self.assertFalse([act for act in graph
+                          if isinstance(act, PreloadModules)])
+
+        mgt, mdt = proxies[0].stages.values()
+        ost, = proxies[1].stages.values()
+        args = proxies[0]._prepare_args()
+        self.assertTrue("-l %s" % NodeSet.fromlist([self.mgt.label,
+                                                    self.mdt.label]) in args)
+        self.assertTrue("--stages='%d:%s;+%d:%s'" % (mgt.index,
+                                                     self.mgt.label,
+                                                     mdt.index,
+                                                     self.mdt.label) in args)
+        self.assertTrue("--stages='+%d:%s'" % (ost.index, self.ost.label)
+                        in proxies[1]._prepare_args())
+
+        # Stages wait for the stages of the components they need
+        deps = dict((grp[0][0], grp.deps) for grp in graph[-1])
+        self.assertEqual(deps, {mgt: set(), mdt: set([mgt]), ost: set([mgt])})
+
+    def test_agent_modules(self):
+        """agents load modules themselves, without another connection"""
+        graph = self.fs._prepare('start', groupby='START_ORDER')
+        self.assertEqual(len(graph), 3)
+        self.assertFalse([act for act in graph
+                          if isinstance(act, PreloadModules)])
+
+    def test_no_agent(self):
+        """without agents, one proxy per server and group is used"""
+        Globals().replace('remote_agent', 'no')
+        graph = self.fs._prepare('start', groupby='START_ORDER')
+        self.assertEqual(len(graph[0]), 3)
+        self.assertTrue(isinstance(graph[0][0][0][0], FSProxyAction))
+        self.assertTrue(isinstance(graph[1], PreloadModules))
+
+    def test_remote_stages(self):
+        """remote plan runs given stages, waiting ones after the admin"""
+        srv = Server(Utils.HOSTNAME, ['%s@tcp' % Utils.HOSTNAME])
+        fs = FileSystem('plan')
+        mgt = fs.new_target(srv, 'mgt', 0, '/dev/mgt')
+        ost = fs.new_target(srv, 'ost', 0, '/dev/ost')
+        fs.local_server = srv
+        graph = fs._prepare('start', stages="+5:%s;7:foo;9:%s" % (ost.label,
+                                                                 mgt.label))
+        self.assertEqual([grp.index for grp in graph[:3]], [5, 7, 9])
+        self.assertEqual(graph[0][0][0].comp, ost)
+        barrier, = graph[0].deps
+        self.assertTrue(isinstance(barrier, StageBarrier))
+        self.assertEqual(barrier.index, 5)
+        # Modules are loaded at once, the waiting stage needs them
+        self.assertEqual(graph[0][0].deps, set([graph[3]]))
+        self.assertEqual(len(graph[1]), 0)
+        self.assertEqual(graph[2][0][0].comp, mgt)
+        self.assertEqual(graph[2].deps, set())
+        self.assertEqual(graph[2][0].deps, set())
+
+
+class DependsPrepareTest(unittest.TestCase):
+    """Start and stop graphs follow component dependencies"""
+
+    def setUp(self):
+        self.fs = FileSystem('deps')
+        srv1 = Server('foo1', ['foo1@tcp'])
+        srv2 = Server('foo2', ['foo2@tcp'])
+        srv3 = Server('foo3', ['foo3@tcp'])
+        self.mgt = self.fs.new_target(srv1, 'mgt', 0, '/dev/mgt')
+        self.mdt0 = self.fs.new_target(srv1, 'mdt', 0, '/dev/mdt0')
+        self.mdt1 = self.fs.new_target(srv2, 'mdt', 1, '/dev/mdt1')
+        self.ost0 = self.fs.new_target(srv2, 'ost', 0, '/dev/ost0')
+        self.ost1 = self.fs.new_target(srv3, 'ost', 1, '/dev/ost1')
+        self.router = self.fs.new_router(Server('foo4', ['foo4@tcp']))
+
+    def _deps(self, graph):
+        """Return {proxy labels: labels of the proxies it waits for}."""
+        result = {}
+        for grp in graph:
+            for proxy in grp[0]:
+                labels = str(proxy._comps.labels())
+                result[labels] = sorted(str(dep._comps.labels())
+                                        for dep in grp.deps)
+        return result
+
+    def test_start_depends(self):
+        """targets wait for the MGS, MDTs for MDT0"""
+        deps = FileSystem._start_depends(self.fs.components)
+        self.assertEqual(deps[self.mdt0], set([self.mgt]))
+        self.assertEqual(deps[self.mdt1], set([self.mgt, self.mdt0]))
+        self.assertEqual(deps[self.ost0], set([self.mgt]))
+        self.assertFalse(self.mgt in deps or self.router in deps)
+
+        deps = FileSystem._start_depends(self.fs.components, first_time=True)
+        self.assertEqual(deps[self.ost1], set([self.mgt, self.mdt0]))
+
+        # Only selected components are waited for
+        comps = ComponentGroup([self.mdt1, self.ost0])
+        deps = FileSystem._start_depends(comps)
+        self.assertEqual(deps[self.mdt1], set())
+
+    def test_stop_depends(self):
+        """stop dependencies are reversed"""
+        deps = FileSystem._stop_depends(self.fs.components)
+        self.assertEqual(deps[self.mgt], set([self.mdt0, self.mdt1,
+                                              self.ost0, self.ost1]))
+        self.assertEqual(deps[self.mdt0], set([self.mdt1]))
+        # OSTs still wait for all MDTs
+        self.assertEqual(deps[self.ost0], set([self.mdt0, self.mdt1]))
+        self.assertFalse(self.router in deps)
+
+        # Only selected components are waited for
+        comps = ComponentGroup([self.mgt, self.ost0])
+        deps = FileSystem._stop_depends(comps)
+        self.assertFalse(self.ost0 in deps)
+
+    def test_start_graph(self):
+        """each server group only waits for the targets it needs"""
+        depends = FileSystem._start_depends(self.fs.components)
+        graph = self.fs._prepare('start', depends=depends)
+        # Routers do not need target modules
+        preloads = dict((str(act.nodes), act.modnames) for act in graph[1:])
+        self.assertEqual(preloads, {'foo[1-3]': ['ldiskfs', 'lustre']})
+        self.assertEqual(self._deps(graph[0]),
+                         {'deps-router': [],
+                          'MGS': [],
+                          'deps-OST0000': ['MGS'],
+                          'deps-OST0001': ['MGS'],
+                          'deps-MDT0000': ['MGS'],
+                          'deps-MDT0001': ['MGS', 'deps-MDT0000']})
+
+    def test_stop_graph(self):
+        """MDTs are stopped first, then OSTs, and the MGS last"""
+        depends = FileSystem._stop_depends(self.fs.components)
+        graph = self.fs._prepare('stop', depends=depends, reverse=True)
+        deps = self._deps(graph)
+        self.assertEqual(deps['deps-MDT0001'], [])
+        self.assertEqual(deps['deps-OST0000'], ['deps-MDT0000',
+                                                'deps-MDT0001'])
+        self.assertEqual(deps['deps-OST0001'], ['deps-MDT0000',
+                                                'deps-MDT0001'])
+        self.assertEqual(deps['deps-MDT0000'], ['deps-MDT0001'])
+        self.assertEqual(deps['MGS'], ['deps-MDT0000', 'deps-MDT0001',
+                                       'deps-OST0000', 'deps-OST0001'])
+
+
+class WatchStatusTest(unittest.TestCase):
+    """Follow component states with watch mode"""
+
+    class RecordEH(EventHandler):
+        def __init__(self):
+            self.events = []
+            self.abort = False
+        def event_callback(self, evtype, **kwargs):
+            comp = kwargs['info'].elem
+            self.events.append((comp, kwargs['status']))
+            if self.abort and comp.state == RECOVERING:
+                # Watch timer is not removed by a simple abort
+                task_self().abort(kill=True)
+
+    class AbortTimer(TimerHandler):
+        def ev_timer(self, timer):
+            task_self().abort(kill=True)
+
+    def setUp(self):
+        self.root = Utils.make_tempdir()
+        proc_snapshot().root = self.root
+        self.eh = self.RecordEH()
+        self.fs = FileSystem('watch', event_handler=self.eh)
+        srv = Server(Utils.HOSTNAME, ['%s@tcp' % Utils.HOSTNAME])
+        self.fs.local_server = srv
+        self.dev = Utils.makeTempFilename()
+        self.ost = self.fs.new_target(srv, 'ost', 0, self.dev)
+        self.remote = self.fs.new_target(Server('remote', ['remote@tcp']),
+                                         'ost', 1, '/dev/ost1')
+
+    def tearDown(self):
+        proc_snapshot().root = ''
+        proc_snapshot().invalidate()
+        shutil.rmtree(self.root)
+        os.unlink(self.dev)
+
+    def write(self, path, content):
+        path = self.root + path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').write(content)
+
+    def recover(self, remaining):
+        obd = '/proc/fs/lustre/obdfilter/%s' % self.ost.label
+        self.write(obd + '/mntdev', self.dev + '\n')
+        self.write('/proc/mounts', '%s /ost lustre rw 0 0\n' % self.dev)
+        self.write(obd + '/recovery_status',
+                   'status: RECOVERING\ntime_remaining: %d\n'
+                   'connected_clients: 1/2\ncompleted_clients: 1/2\n'
+                   % remaining)
+
+    def test_poll_changes_only(self):
+        """poll_status() raises events for changed local components"""
+        comps = self.fs.components
+        self.assertEqual(self.fs.poll_status(comps), [self.ost])
+        self.assertEqual(self.ost.state, OFFLINE)
+        self.assertEqual(self.fs.poll_status(comps), [])
+
+        self.recover(30)
+        self.assertEqual(self.fs.poll_status(comps), [self.ost])
+        self.assertEqual(self.ost.state, RECOVERING)
+        self.assertEqual(self.ost.recov_info, '30s (1/2)')
+
+        # Recovery progress is a change too
+        self.recover(20)
+        self.assertEqual(self.fs.poll_status(comps), [self.ost])
+        self.assertEqual(self.ost.recov_info, '20s (1/2)')
+        self.assertEqual(self.eh.events, [(self.ost, 'done')] * 3)
+
+    def test_poll_error(self):
+        """poll_status() reports check errors as failures"""
+        self.write('/proc/fs/lustre/obdfilter/%s/mntdev' % self.ost.label,
+                   self.dev + '\n')
+        self.assertEqual(self.fs.poll_status(self.fs.components), [self.ost])
+        self.assertEqual(self.eh.events, [(self.ost, 'failed')])
+
+    def test_launch_watch(self):
+        """launch_status() watches once the status is known"""
+        ready = []
+        def ready_cb(comps):
+            ready.append(self.ost.state)
+            self.eh.events = []
+            self.eh.abort = True
+            self.recover(30)
+
+        self.fs.launch_status(self.fs.components.filter(key=lambda comp:
+                                                        comp is self.ost),
+                              watch=1, ready=ready_cb, mountdata='never')
+        # Watch never ends by itself
+        task_self().timer(10, handler=self.AbortTimer())
+        self.fs._run_actions()
+        self.assertEqual(ready, [OFFLINE])
+        self.assertEqual(self.eh.events[-1], (self.ost, 'done'))
+        self.assertEqual(self.ost.state, RECOVERING)
+
+    def test_watch_prepare(self):
+        """remote nodes are asked to watch"""
+        graph = self.fs._prepare('status', ComponentGroup([self.remote]),
+                                 allservers=True, watch=5)
+        proxy = graph[0][0][0]
+        self.assertTrue('--watch --watch-interval=5' in proxy._prepare_args())
+
+
 class SimpleFileSystemTest(unittest.TestCase):
     """Tests which do not setup a real Lustre filesystem."""
 
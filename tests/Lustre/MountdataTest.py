@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# Shine.Lustre.Mountdata test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit test for MountdataCache"""
+
+import os
+import time
+import shutil
+import unittest
+from subprocess import Popen, PIPE, STDOUT
+
+import Utils
+from Utils import make_ldd
+from Shine.Lustre.Mountdata import MountdataCache, device_uuid, \
+                                   read_mountdata, MountdataUnsupported
+
+MKE2FS = '/sbin/mke2fs'
+
+
+class MountdataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Utils.make_tempdir()
+        self.path = os.path.join(self.tmpdir, 'cache', 'mountdata')
+        self.cache = MountdataCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        """test cached values depend on device identity"""
+        self.assertEqual(self.cache.get('/dev/sda', [2048, 1024, None]), None)
+        self.cache.set('/dev/sda', [2048, 1024, None], 'foo-OST0000', 0x2)
+        self.assertEqual(self.cache.get('/dev/sda', [2048, 1024, None]),
+                         ('foo-OST0000', 0x2))
+        # Same device, new content
+        self.assertEqual(self.cache.get('/dev/sda', [2048, 1024, 'abcd']), None)
+        self.assertEqual(self.cache.get('/dev/sdb', [2048, 1024, None]), None)
+
+    def test_invalidate(self):
+        """test invalidated device is not cached anymore"""
+        self.cache.set('/dev/sda', [1], 'foo-OST0000', 0x2)
+        self.cache.set('/dev/sdb', [2], 'foo-OST0001', 0x2)
+        self.cache.invalidate('/dev/sda')
+        self.cache.invalidate('/dev/sdc')
+        self.assertEqual(self.cache.get('/dev/sda', [1]), None)
+        self.assertEqual(self.cache.get('/dev/sdb', [2]), ('foo-OST0001', 0x2))
+
+    def test_shared_file(self):
+        """test changes made by other processes are seen"""
+        self.cache.set('/dev/sda', [1], 'foo-OST0000', 0x2)
+        other = MountdataCache(self.path)
+        self.assertEqual(other.get('/dev/sda', [1]), ('foo-OST0000', 0x2))
+
+        # Be sure file modification time changes
+        time.sleep(0.01)
+        other.invalidate('/dev/sda')
+        self.assertEqual(self.cache.get('/dev/sda', [1]), None)
+
+    def test_bad_file(self):
+        """test an unusable cache file is ignored"""
+        os.makedirs(os.path.dirname(self.path))
+        open(self.path, 'w').write('garbage')
+        self.assertEqual(self.cache.get('/dev/sda', [1]), None)
+
+        cache = MountdataCache('/proc/no/such/cache')
+        cache.set('/dev/sda', [1], 'foo-OST0000', 0x2)
+        self.assertEqual(cache.get('/dev/sda', [1]), ('foo-OST0000', 0x2))
+
+    def test_removed_file(self):
+        """test removing the cache file clears it"""
+        self.cache.set('/dev/sda', [1], 'foo-OST0000', 0x2)
+        os.unlink(self.path)
+        self.assertEqual(self.cache.get('/dev/sda', [1]), None)
+
+    def test_device_uuid(self):
+        """test UUID is found from by-uuid links"""
+        dev = os.path.join(self.tmpdir, 'sda')
+        open(dev, 'w').close()
+        bydir = os.path.join(self.tmpdir, 'by-uuid')
+        os.mkdir(bydir)
+        os.symlink('../sda', os.path.join(bydir, 'f2b3c4d5'))
+        self.assertEqual(device_uuid(dev, bydir), 'f2b3c4d5')
+        self.assertEqual(device_uuid('/dev/nothing', bydir), None)
+        self.assertEqual(device_uuid(dev, '/no/such/dir'), None)
+
+
+class ReadMountdataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Utils.make_tempdir()
+        self.srcdir = os.path.join(self.tmpdir, 'src')
+        os.makedirs(os.path.join(self.srcdir, 'CONFIGS'))
+        self.image = os.path.join(self.tmpdir, 'image')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def mkfs(self, *opts):
+        """Build an image from self.srcdir, return False if not possible."""
+        if not os.path.exists(MKE2FS):
+            print("SKIP. %s is required." % MKE2FS)
+            return False
+        cmd = [MKE2FS, '-q', '-F'] + list(opts)
+        cmd += ['-d', self.srcdir, self.image, '16M']
+        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
+        process.communicate()
+        self.assertEqual(process.returncode, 0)
+        return True
+
+    def write(self, path, content):
+        open(os.path.join(self.srcdir, path), 'wb').write(content)
+
+    def test_ext4_extents(self):
+        """test mountdata of an extent-based ldiskfs"""
+        self.write('CONFIGS/mountdata', make_ldd('foo-OST0001', 0x1062))
+        if self.mkfs('-t', 'ext4', '-b', '4096'):
+            self.assertEqual(read_mountdata(self.image), ('foo-OST0001', 0x1062))
+
+    def test_block_map(self):
+        """test mountdata using indirect blocks on a 1k block device"""
+        self.write('CONFIGS/mountdata', make_ldd('foo:MDT0000', 0x22, 20480))
+        if self.mkfs('-t', 'ext2', '-b', '1024'):
+            self.assertEqual(read_mountdata(self.image), ('foo:MDT0000', 0x22))
+
+    def test_hashed_directory(self):
+        """test mountdata in a large directory"""
+        for idx in range(300):
+            self.write('CONFIGS/foo-OST%04x' % idx, b'x')
+        self.write('CONFIGS/mountdata', make_ldd('foo-MDT0000', 0x2))
+        if self.mkfs('-t', 'ext4', '-b', '1024', '-O', 'dir_index'):
+            self.assertEqual(read_mountdata(self.image), ('foo-MDT0000', 0x2))
+
+    def test_unsupported(self):
+        """test devices without readable mountdata"""
+        # Not a filesystem
+        open(self.image, 'w').write('\0' * 4096)
+        self.assertRaises(MountdataUnsupported, read_mountdata, self.image)
+        self.assertRaises(MountdataUnsupported, read_mountdata, '/no/such/dev')
+
+        # No mountdata, or not a Lustre one
+        self.write('CONFIGS/other', b'x')
+        if self.mkfs('-t', 'ext4'):
+            self.assertRaises(MountdataUnsupported, read_mountdata, self.image)
+        self.write('CONFIGS/mountdata', b'garbage' * 100)
+        if self.mkfs('-t', 'ext4'):
+            self.assertRaises(MountdataUnsupported, read_mountdata, self.image)
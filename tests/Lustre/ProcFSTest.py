@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# Shine.Lustre.ProcFS test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit test for ProcSnapshot"""
+
+import os
+import shutil
+import unittest
+
+import Utils
+from Shine.Lustre.ProcFS import ProcSnapshot
+
+MOUNTS = """rootfs / rootfs rw 0 0
+/dev/sdb /lustre/foo/ost/foo-OST0000 lustre ro 0 0
+/dev/sdc /lustre/foo/ost/foo-OST0001 lustre ro 0 0
+10.0.0.1@tcp:/foo /foo lustre rw,flock 0 0
+/dev/sdc /mnt/backup ext4 rw 0 0
+"""
+
+PARTITIONS = """major minor  #blocks  name
+
+   8        0   20971520 sda
+   8       16    1048576 sdb
+"""
+
+MODULES = """lustre 1002144 3 - Live 0xffffffffa0d44000
+libcfs 487383 12 lnet,lustre, Live 0xffffffffa05bc000
+"""
+
+class ProcSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = Utils.make_tempdir()
+        self.snapshot = ProcSnapshot(self.root)
+        self.write('/proc/mounts', MOUNTS)
+        self.write('/proc/partitions', PARTITIONS)
+        self.write('/proc/modules', MODULES)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, content):
+        path = self.root + path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').write(content)
+
+    def test_mounts(self):
+        """test mount indexes"""
+        self.assertEqual(self.snapshot.mounts_by_device('/dev/sdc'),
+                         [('/lustre/foo/ost/foo-OST0001', 'lustre'),
+                          ('/mnt/backup', 'ext4')])
+        self.assertEqual(self.snapshot.mounts_by_path('/foo'),
+                         [('10.0.0.1@tcp:/foo', 'lustre')])
+        self.assertEqual(self.snapshot.mounts_by_device('/dev/sdz'), [])
+
+    def test_partitions_and_modules(self):
+        """test partition sizes and module counts"""
+        self.assertEqual(self.snapshot.partition_size('sdb'), 1048576 * 1024)
+        self.assertEqual(self.snapshot.partition_size('sdz'), None)
+        self.assertEqual(self.snapshot.modules(), {'lustre': 3, 'libcfs': 12})
+
+    def test_obd_paths(self):
+        """test mntdev lookup prefers sysfs"""
+        self.write('/proc/fs/lustre/obdfilter/foo-OST0000/mntdev', '/dev/sdb\n')
+        self.write('/proc/fs/lustre/obdfilter/foo-OST0000/recovery_status',
+                   'status: COMPLETE\n')
+        self.write('/sys/fs/lustre/obdfilter/foo-OST0001/mntdev', '/dev/sdc\n')
+        self.write('/proc/fs/lustre/obdfilter/foo-OST0001/mntdev', '/dev/sdc\n')
+
+        paths = self.snapshot.obd_paths('foo-OST0000', 'mntdev')
+        self.assertEqual(paths, ['/proc/fs/lustre/obdfilter/foo-OST0000/mntdev'])
+        self.assertEqual(self.snapshot.read_obd_file(paths[0]), '/dev/sdb')
+        self.assertEqual(self.snapshot.obd_paths('foo-OST0001', 'mntdev'),
+                         ['/sys/fs/lustre/obdfilter/foo-OST0001/mntdev'])
+        self.assertEqual(len(self.snapshot.obd_paths('foo-OST0000',
+                                                     'recovery_status')), 1)
+        self.assertEqual(self.snapshot.obd_paths('foo-OST0002', 'mntdev'), [])
+
+    def test_clients(self):
+        """test client devices and import states by filesystem"""
+        self.write('/proc/fs/lustre/lov/foo-clilov-ffff8800/uuid', 'x\n')
+        self.write('/proc/fs/lustre/osc/foo-OST0000-osc-ffff8800/state',
+                   'current_state: FULL\nstate_history:\n')
+        self.write('/proc/fs/lustre/mdc/foo-MDT0000-mdc-ffff8800/state',
+                   'current_state: EVICTED\n')
+        self.write('/proc/fs/lustre/osc/bar-OST0000-osc-ffff8800/state',
+                   'current_state: FULL\n')
+        self.write('/proc/fs/lustre/osc/foo-OST0000-osc-ffff9900/state',
+                   'current_state: FULL\n')
+
+        self.assertEqual(self.snapshot.clilov('foo'),
+                         ['/proc/fs/lustre/lov/foo-clilov-ffff8800'])
+        self.assertEqual(self.snapshot.clilov('bar'), [])
+        self.assertEqual(self.snapshot.import_states('foo'),
+                         {'ffff8800': ({'FULL': 1, 'EVICTED': 1},
+                                       [('foo-MDT0000', 'EVICTED')]),
+                          'ffff9900': ({'FULL': 1}, [])})
+        self.assertEqual(self.snapshot.import_states('bar'),
+                         {'ffff8800': ({'FULL': 1}, [])})
+        self.assertEqual(self.snapshot.import_states('baz'), {})
+
+    def test_bounded_state_read(self):
+        """test import state is read from file head only"""
+        self.write('/proc/fs/lustre/osc/foo-OST0000-osc-ffff8800/state',
+                   'current_state: DISCONN\n' + 'state_history:\n' * 1000 +
+                   'current_state: FULL\n')
+        self.write('/proc/fs/lustre/osc/foo-OST0001-osc-ffff8800/state',
+                   'garbage\n')
+        self.assertEqual(self.snapshot.import_states('foo'),
+                         {'ffff8800': ({'DISCONN': 1},
+                                       [('foo-OST0000', 'DISCONN')])})
+
+    def test_invalidate(self):
+        """test files are read once until invalidated"""
+        self.assertEqual(self.snapshot.modules()['lustre'], 3)
+        self.write('/proc/modules', MODULES.replace(' 3 ', ' 0 '))
+        self.assertEqual(self.snapshot.modules()['lustre'], 3)
+        self.snapshot.invalidate()
+        self.assertEqual(self.snapshot.modules()['lustre'], 0)
+
+    def test_missing_files(self):
+        """test a node without Lustre"""
+        snapshot = ProcSnapshot(self.root + '/nothing')
+        self.assertEqual(snapshot.modules(), {})
+        self.assertEqual(snapshot.mounts_by_path('/foo'), [])
+        self.assertEqual(snapshot.clilov('foo'), [])
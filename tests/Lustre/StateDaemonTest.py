@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# Shine.Lustre.StateDaemon test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit tests for the local state daemon"""
+
+import os
+import sys
+import time
+import shutil
+import unittest
+import subprocess
+
+import Utils
+from Shine.Configuration.Globals import Globals
+from Shine.Lustre.EventHandler import EventHandler
+from Shine.Lustre.ProcFS import proc_snapshot
+from Shine.Lustre.StateDaemon import StateDaemon, query_states, \
+                                     invalidate_states
+from Shine.Lustre.FileSystem import FileSystem, Server, MOUNTED, OFFLINE
+
+
+def make_fs(fsname, event_handler=None):
+    """Return a filesystem with one local client."""
+    fs = FileSystem(fsname, event_handler=event_handler)
+    srv = Server(Utils.HOSTNAME, ['%s@tcp' % Utils.HOSTNAME])
+    fs.local_server = srv
+    fs.new_client(srv, '/%s' % fsname)
+    return fs
+
+def loader(fsname):
+    if fsname != 'daemon':
+        raise KeyError("unknown filesystem %s" % fsname)
+    return make_fs(fsname)
+
+
+class StateDaemonTest(unittest.TestCase):
+
+    class RecordEH(EventHandler):
+        def __init__(self):
+            self.events = []
+            self.logs = []
+        def event_callback(self, evtype, **kwargs):
+            if evtype == 'log':
+                self.logs.append(kwargs['msg'])
+            elif kwargs.get('status') == 'done':
+                self.events.append(kwargs['result'])
+
+    def setUp(self):
+        self.root = Utils.make_tempdir()
+        proc_snapshot().root = self.root
+        path = os.path.join(self.root, 'state.sock')
+        Globals().replace('state_socket', path)
+        Globals().replace('state_interval', 60)
+
+        # A separate process, with its own ClusterShell task
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        self.daemon = subprocess.Popen([sys.executable, __file__.rstrip('c'),
+                                        path, self.root], env=env)
+        while not os.path.exists(path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.daemon.kill()
+        self.daemon.wait()
+        proc_snapshot().root = ''
+        proc_snapshot().invalidate()
+        shutil.rmtree(self.root)
+        del Globals()['state_socket']
+        Globals().replace('state_interval', 10)
+
+    def mount(self):
+        path = self.root + '/proc/mounts'
+        os.makedirs(self.root + '/proc/fs/lustre/lov/daemon-clilov-ffff8800')
+        open(path, 'w').write('10.0.0.1@tcp:/daemon /daemon lustre rw 0 0\n')
+
+    def state(self):
+        """Return the state of the client, as answered by the daemon."""
+        return list(query_states('daemon')[1].values())[0][0]
+
+    def test_query_states(self):
+        """daemon answers with local component states"""
+        age, comps = query_states('daemon')
+        self.assertTrue(age < 60)
+        client = list(make_fs('daemon').components)[0]
+        self.assertEqual(list(comps.keys()), [client.uniqueid()])
+        self.assertEqual(list(comps.values())[0][0], OFFLINE)
+
+    def test_unknown_fs(self):
+        """unknown filesystem or no daemon answer nothing"""
+        self.assertEqual(query_states('unknown'), None)
+        Globals().replace('state_socket', self.root + '/nothing.sock')
+        self.assertEqual(query_states('daemon'), None)
+
+    def test_invalidate(self):
+        """states are checked again once invalidated"""
+        self.assertEqual(self.state(), OFFLINE)
+        self.mount()
+        # Still answered from memory
+        self.assertEqual(self.state(), OFFLINE)
+        invalidate_states('daemon')
+        self.assertEqual(self.state(), MOUNTED)
+
+    def test_launch_status(self):
+        """status uses daemon states and tells their age"""
+        self.mount()
+        eh = self.RecordEH()
+        fs = make_fs('daemon', event_handler=eh)
+        self.assertEqual(fs.status(daemon=True), set([MOUNTED]))
+        self.assertEqual(len(eh.events), 1)
+        self.assertTrue('from state daemon' in str(eh.events[0]))
+
+    def test_stale_states(self):
+        """too old daemon states are not used"""
+        query_states('daemon')
+        time.sleep(0.1)
+        Globals().replace('state_interval', 0)
+        eh = self.RecordEH()
+        fs = make_fs('daemon', event_handler=eh)
+        self.assertEqual(fs.status(daemon=True), set([OFFLINE]))
+        self.assertEqual(eh.events, [None])
+        self.assertTrue(eh.logs[0].startswith('State daemon data are'))
+
+
+if __name__ == '__main__':
+    proc_snapshot().root = sys.argv[2]
+    StateDaemon(sys.argv[1], 60, loader).serve()
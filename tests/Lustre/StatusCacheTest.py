@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# Shine.Lustre.StatusCache test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit tests for StatusCache"""
+
+import os
+import time
+import shutil
+import unittest
+
+import Utils
+from Shine.Configuration.Globals import Globals
+from Shine.Lustre.StatusCache import StatusCache
+from Shine.Lustre.FileSystem import FileSystem, Server, MOUNTED, OFFLINE, \
+                                    RECOVERING
+
+
+class StatusCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Utils.make_tempdir()
+        Globals().replace('status_dir', os.path.join(self.tmpdir, 'status'))
+        Globals().replace('status_cache_ttl', 60)
+        self.cache = StatusCache('foo')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        del Globals()['status_dir']
+        del Globals()['status_cache_ttl']
+
+    def test_get_set(self):
+        """test entries are keyed and aged"""
+        self.assertEqual(self.cache.get('fs', 60), None)
+        self.cache.set('fs', {'foo-MDT0000': {'node1': [MOUNTED]}})
+        age, comps = self.cache.get('fs', 60)
+        self.assertTrue(0 <= age < 60)
+        self.assertEqual(comps, {'foo-MDT0000': {'node1': [MOUNTED]}})
+        self.assertEqual(self.cache.get('target', 60), None)
+        self.assertEqual(StatusCache('bar').get('fs', 60), None)
+
+    def test_max_age_and_ttl(self):
+        """test too old entries are not used"""
+        self.cache.set('fs', {})
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get('fs', 0), None)
+        self.assertNotEqual(self.cache.get('fs', 60), None)
+        self.cache.ttl = 0
+        self.assertEqual(self.cache.get('fs', 60), None)
+
+    def test_disabled(self):
+        """test nothing is stored without TTL"""
+        Globals().replace('status_cache_ttl', 0)
+        cache = StatusCache('foo')
+        cache.set('fs', {})
+        self.assertFalse(os.path.exists(cache.path))
+
+    def test_clear(self):
+        """test all entries are dropped"""
+        self.cache.set('fs', {})
+        self.cache.set('target', {})
+        self.cache.clear()
+        self.cache.clear()
+        self.assertEqual(self.cache.get('fs', 60), None)
+        self.assertEqual(self.cache.get('target', 60), None)
+
+
+class FileSystemCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Utils.make_tempdir()
+        Globals().replace('status_dir', self.tmpdir)
+        Globals().replace('status_cache_ttl', 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        del Globals()['status_dir']
+        del Globals()['status_cache_ttl']
+
+    def make_fs(self, osts=0):
+        fs = FileSystem('cache')
+        srv1 = Server('node1', ['node1@tcp'])
+        srv2 = Server('node2', ['node2@tcp'])
+        mdt = fs.new_target(srv1, 'mdt', 0, '/dev/mdt')
+        mdt.add_server(srv2)
+        for index in range(osts):
+            fs.new_target(srv2, 'ost', index, '/dev/ost%d' % index)
+        fs.new_client(Server('node3', ['node3@tcp']), '/cache')
+        return fs, mdt, fs.components['cache-client-node3@tcp-/cache']
+
+    def test_cached_status(self):
+        """test component states are restored for each server"""
+        fs, mdt, client = self.make_fs()
+        mdt._states = {'node1': OFFLINE, 'node2': RECOVERING}
+        mdt.recov_info = '30s (1/2)'
+        mdt.dev_size = 1024
+        client.state = MOUNTED
+        client.proc_states = {'FULL': 2}
+        fs.cache_status(fs.components, 'fs')
+
+        fs, mdt, client = self.make_fs()
+        comps, age = fs.cached_status(None, 'fs', 60)
+        self.assertEqual(len(comps), 2)
+        self.assertTrue(age < 60)
+        self.assertEqual(mdt._states, {'node1': OFFLINE, 'node2': RECOVERING})
+        self.assertEqual(mdt.state, RECOVERING)
+        self.assertEqual(mdt.recov_info, '30s (1/2)')
+        self.assertEqual(mdt.dev_size, 1024)
+        self.assertEqual(client.state, MOUNTED)
+        self.assertEqual(client.proc_states, {'FULL': 2})
+        self.assertEqual(fs.check_status(comps), set([RECOVERING]))
+
+        self.assertEqual(fs.cached_status(None, 'target', 60), None)
+
+    def test_changed_components(self):
+        """test cache is not used for other components"""
+        fs = self.make_fs()[0]
+        fs.cache_status(fs.components, 'fs')
+        fs = self.make_fs(osts=1)[0]
+        self.assertEqual(fs.cached_status(None, 'fs', 60), None)
+
+    def test_invalidate(self):
+        """test other actions drop cached results"""
+        fs = self.make_fs()[0]
+        fs.cache_status(fs.components, 'fs')
+        fs._prepare('status')
+        FileSystem.run_actions([fs])
+        self.assertNotEqual(fs.cached_status(None, 'fs', 60), None)
+
+        fs._prepare('stop')
+        FileSystem.run_actions([fs])
+        self.assertEqual(fs.cached_status(None, 'fs', 60), None)
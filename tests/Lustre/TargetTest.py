@@ -15,7 +15,7 @@ from Shine.Lustre.FileSystem import FileSystem
 from Shine.Lustre.Server import Server
 from Shine.Lustre.Target import Target, ComponentError
 from Shine.Lustre.Component import MOUNTED, RECOVERING, OFFLINE, MIGRATED, \
-                                   TARGET_ERROR, RUNTIME_ERROR
+                                   TARGET_ERROR, RUNTIME_ERROR, UNREACHABLE
 
 class TargetTest(unittest.TestCase):
 
@@ -238,6 +238,22 @@ class GetStateTest(unittest.TestCase):
                             self.srv3name: MOUNTED}
         self.assertEqual(self.tgt.state, MIGRATED)
 
+    def test_unreachable_states(self):
+        """test states with servers which did not answer"""
+        self.tgt._states = {self.srv1name: OFFLINE,
+                            self.srv2name: None,
+                            self.srv3name: None}
+        self.tgt.mark_unreachable(NodeSet(self.srv2name))
+        self.tgt.sanitize_state(nodes=NodeSet(self.srv3name))
+        self.assertEqual(self.tgt._states[self.srv2name], UNREACHABLE)
+        self.assertEqual(self.tgt._states[self.srv3name], RUNTIME_ERROR)
+        # Could be started on the unreachable server
+        self.assertEqual(self.tgt.state, UNREACHABLE)
+        self.assertEqual(self.tgt.text_statusonly(), 'unreachable')
+
+        self.tgt._states[self.srv1name] = MOUNTED
+        self.assertEqual(self.tgt.state, MOUNTED)
+
     def test_update_server(self):
         """test Target.update_server()"""
         self.tgt._states = {self.srv1name: None,
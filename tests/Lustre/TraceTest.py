@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# Shine.Lustre.Trace test suite
+# Copyright (C) 2015 CEA
+
+
+"""Unit tests for ActionTrace"""
+
+import os
+import json
+import time
+import shutil
+import unittest
+
+import Utils
+from Shine.Lustre import Trace
+from Shine.Lustre.Trace import ActionTrace, action_trace
+from Shine.Lustre.Actions.Action import CommonAction, ActionGroup, \
+                                        ActionInfo, Result, ACT_OK, ACT_ERROR
+
+
+class FakeComp(object):
+    """Component with a label only."""
+
+    def __init__(self, label):
+        self.label = label
+
+
+class PendingAction(CommonAction):
+    """Action running nothing, ending when end() is called."""
+
+    NAME = 'pending'
+
+    def __init__(self, pending, label):
+        CommonAction.__init__(self)
+        self.pending = pending
+        self.comp = FakeComp(label)
+
+    def _launch(self):
+        self.pending.append(self)
+
+    def end(self, status=ACT_OK):
+        time.sleep(0.01)
+        self.set_status(status)
+
+
+class ActionTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        Trace._TRACE = ActionTrace()
+        action_trace().enable()
+        self.pending = []
+
+    def tearDown(self):
+        Trace._TRACE = ActionTrace()
+
+    def action(self, label):
+        return PendingAction(self.pending, label)
+
+    def run_graph(self):
+        """Build and run: first -> second, and other, which fails first."""
+        first = self.action('first')
+        second = self.action('second')
+        other = self.action('other')
+        second.depends_on(first)
+        grp = ActionGroup()
+        for action in (first, second, other):
+            grp.add(action)
+        grp.launch()
+        self.assertEqual(self.pending, [first, other])
+        other.end(ACT_ERROR)
+        first.end()
+        self.assertEqual(self.pending, [first, other, second])
+        second.end()
+        return first, second, other
+
+    def test_disabled(self):
+        """test nothing is recorded unless enabled"""
+        Trace._TRACE = ActionTrace()
+        self.run_graph()
+        self.assertEqual(action_trace().critical_path(), [])
+        self.assertEqual(action_trace().summary(), '')
+
+    def test_critical_path(self):
+        """test critical path follows dependencies"""
+        first, second, _ = self.run_graph()
+        path = action_trace().critical_path()
+        self.assertEqual([span.action for span in path], [first, second])
+        self.assertEqual([span.tid for span in path], ['first', 'second'])
+        self.assertEqual([span.status for span in path], ['ok', 'ok'])
+        self.assertTrue(path[0].end <= path[1].start)
+
+    def test_critical_path_group(self):
+        """test critical path goes through group members"""
+        first = self.action('first')
+        second = self.action('second')
+        grp = ActionGroup()
+        grp.add(first)
+        grp.add(second)
+        last = self.action('last')
+        last.depends_on(grp)
+        last.launch()
+        grp.launch()
+        second.end()
+        first.end()
+        last.end()
+        path = action_trace().critical_path()
+        self.assertEqual([span.action for span in path], [first, last])
+
+    def test_slowest_and_summary(self):
+        """test slowest components and summary"""
+        first, second, other = self.run_graph()
+        slowest = action_trace().slowest(2)
+        self.assertEqual(len(slowest), 2)
+        self.assertTrue(slowest[0].duration >= slowest[1].duration)
+        self.assertTrue(set(span.action for span in slowest) <=
+                        set([first, second, other]))
+        summary = action_trace().summary(1)
+        self.assertTrue(summary.startswith("Critical path: "))
+        self.assertTrue("Slowest components:" in summary)
+        self.assertEqual(len(summary.splitlines()), 5)
+
+    def test_remote_event(self):
+        """test remote sub-actions are recorded"""
+        trace = action_trace()
+        info = ActionInfo(self.action('foo'), FakeComp('foo-OST0000'))
+        trace.remote_event('node1', 'start', info)
+        time.sleep(0.01)
+        trace.remote_event('node1', 'done', info)
+        # End without start uses the node duration
+        trace.remote_event('node2', 'failed', info, Result(duration=3))
+        # Proxy events are local ones
+        proxy = ActionInfo(self.action('foo'))
+        proxy.actname = 'proxy'
+        trace.remote_event('node3', 'start', proxy)
+
+        spans = trace.slowest(10)
+        self.assertEqual([(span.pid, span.tid, span.status)
+                          for span in spans],
+                         [('node2', 'foo-OST0000', 'failed'),
+                          ('node1', 'foo-OST0000', 'done')])
+        self.assertTrue(2.9 < spans[0].duration < 3.1)
+        self.assertTrue(spans[1].duration > 0)
+
+    def test_chrome_events(self):
+        """test Chrome trace events"""
+        self.run_graph()
+        events = action_trace().chrome_events()
+        spans = [event for event in events if event['ph'] == 'X']
+        self.assertEqual(sorted(event['name'] for event in spans),
+                         ['pending', 'pending', 'pending'])
+        for event in spans:
+            self.assertTrue(event['ts'] >= 0)
+            self.assertTrue(event['dur'] > 0)
+        threads = [event['args']['name'] for event in events
+                   if event['ph'] == 'M' and event['name'] == 'thread_name']
+        self.assertEqual(sorted(threads), ['first', 'other', 'second'])
+        starts = [event for event in events if event['ph'] == 's']
+        ends = [event for event in events if event['ph'] == 'f']
+        self.assertEqual(len(starts), 1)
+        self.assertEqual(len(ends), 1)
+        self.assertEqual(starts[0]['id'], ends[0]['id'])
+        self.assertTrue(starts[0]['ts'] <= ends[0]['ts'])
+
+    def test_save(self):
+        """test trace is written as JSON"""
+        self.run_graph()
+        tmpdir = Utils.make_tempdir()
+        try:
+            path = os.path.join(tmpdir, 'trace.json')
+            action_trace().save(path)
+            with open(path) as fobj:
+                data = json.load(fobj)
+            self.assertEqual(data['traceEvents'],
+                             json.loads(json.dumps(
+                                 action_trace().chrome_events())))
+        finally:
+            shutil.rmtree(tmpdir)
@@ -6,9 +6,11 @@ from __future__ import print_function
 
 import os
 import socket
+import struct
 import tempfile
 
 from Shine.Configuration.Globals import Globals
+from Shine.Lustre.Mountdata import LDD_MAGIC
 
 
 # Used when a real hostname is required
@@ -38,6 +40,15 @@ def make_disk(size=200):
     disk.flush()
     return disk
 
+#
+# Lustre mountdata record, as found in CONFIGS/mountdata
+#
+def make_ldd(svname, flags, size=12288):
+    """Return a lustre_disk_data record for `svname'."""
+    ldd = struct.pack('<8I', LDD_MAGIC, 0, 0, 0, 1, flags, 0, 1)
+    ldd += b'lustre'.ljust(64, b'\0') + svname.encode().ljust(64, b'\0')
+    return ldd.ljust(size, b'\0')
+
 #
 # Some tests need a block device to stat.
 # Index is used to get a different one if possible